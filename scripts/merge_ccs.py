@@ -20,6 +20,11 @@ parser.add_argument("storagestr")
 parser.add_argument("size_thr", type=int)
 parser.add_argument("--max_face_shape", type=int,
                     nargs="+", default=(1024, 1024))
+parser.add_argument("--parallel", type=int, default=1)
+parser.add_argument("--memory_budget", type=int, default=None,
+                    help="merge cleft infos out-of-core within this many"
+                         " bytes, spilling to local disk")
+parser.add_argument("--spill_dir", default=None)
 parser.add_argument("--timing_tag", default=None)
 
 args = parser.parse_args()
@@ -2,12 +2,31 @@ import argparse
 from taskqueue import TaskQueue
 
 import synaptor.cloud.kube.synaptortask  # triggers registration of SynaptorTask
+from synaptor.cloud.kube import executor
 
 parser = argparse.ArgumentParser()
 
 parser.add_argument("qurl", type=str)
 parser.add_argument("lease_seconds", type=int, default=300)
+parser.add_argument("--dispatcher", action="store_true",
+                    help="run each task in a new process via dispatcher.sh")
+parser.add_argument("--script_dir", default=None,
+                    help="directory of the task scripts (default: cwd)")
+parser.add_argument("--task_timeout", type=float, default=None)
+parser.add_argument("--isolate", action="store_true",
+                    help="run each task in a new python process")
+parser.add_argument("--prefetch", action="store_true",
+                    help="lease the next task early and read its inputs"
+                         " in the background")
 
 args = parser.parse_args()
+executor.configure(in_process=not args.dispatcher,
+                   script_dir=args.script_dir,
+                   timeout=args.task_timeout,
+                   isolate=args.isolate)
+
 with TaskQueue(qurl=args.qurl, n_threads=0) as tq:
-    tq.poll(lease_seconds=args.lease_seconds)
+    if args.prefetch:
+        executor.poll(tq, lease_seconds=args.lease_seconds)
+    else:
+        tq.poll(lease_seconds=args.lease_seconds)
@@ -111,7 +111,7 @@ setup(
     url='https://github.com/nicholasturner1/Synaptor',
     packages=setuptools.find_packages(),
     ext_modules=ext_modules,
-    install_requires=['numpy', 'scipy', 'python-igraph', 'pandas', 'h5py',
+    install_requires=['numpy', 'scipy', 'pandas', 'h5py',
                       'cloud-volume', 'task-queue', 'torch',
                       'torchvision', 'future', 'pybind11>=2.2',
                       'psycopg2-binary', 'sqlalchemy', 'pytest',
@@ -1,17 +1,15 @@
-from . import types
-from .types import bbox
-from .types.bbox import BBox3d, chunk_bboxes
-
-from . import seg_utils
-from .seg_utils import filter_segs_by_size, centers_of_mass, bounding_boxes
-
-from . import proc
-from .proc.seg import connected_components, dilated_components
-from .proc.edge import infer_edges
-from .proc.edge.merge import merge_duplicate_clefts
-
-from . import evaluate
-
-from . import io
-
-from . import cloud
+from . import lazy
+
+
+# Submodules are imported on first use (see lazy.py)
+__getattr__, __dir__, __all__ = lazy.attach(
+    __name__,
+    submodules=["types", "seg_utils", "proc", "evaluate", "io", "cloud"],
+    attributes={
+        "types": ["bbox", "IdMap"],
+        "types.bbox": ["BBox3d", "chunk_bboxes"],
+        "seg_utils": ["filter_segs_by_size", "centers_of_mass",
+                      "bounding_boxes"],
+        "proc.seg": ["connected_components", "dilated_components"],
+        "proc.edge": ["infer_edges"],
+        "proc.edge.merge": ["merge_duplicate_clefts"]})
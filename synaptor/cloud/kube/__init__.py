@@ -1,3 +1,4 @@
 from . import task_creation
 from . import synaptortask
+from . import executor
 from . import parser
@@ -0,0 +1,214 @@
+"""
+In-Process Task Execution
+
+Runs the task scripts (e.g. task_scripts/chunk_edges.py) within the
+current (worker) process instead of starting a new interpreter through
+dispatcher.sh for each task. Imported modules, networks (see
+proc.tasks_w_io.load_network) and database engines then stay warm
+across tasks.
+
+Tasks can instead be isolated within a new python process running the
+task script (no fork, so this is safe after CUDA is initialized). These
+tasks start cold, and don't use or warm the caches of the worker.
+
+Timeouts of in-process tasks use SIGALRM, so they only apply when tasks
+run within the main thread (as with scripts/worker.py). Isolated tasks
+are killed on timeout instead.
+
+poll can also lease the next task before running the current one, and
+start reading its inputs in the background (see prefetch_task).
+"""
+
+
+import os
+import sys
+import time
+import runpy
+import random
+import signal
+import threading
+import contextlib
+import subprocess
+
+
+# Matches dispatcher.sh
+TASK_NAMES = ["chunk_ccs", "merge_ccs", "match_contins", "seg_graph_ccs",
+              "chunk_seg_map", "merge_seginfo", "chunk_edges", "pick_edge",
+              "merge_dups", "remap_ids", "chunk_overlaps", "merge_overlaps",
+              "chunk_anchors", "create_index", "dedup_chunk_segs", "init_db",
+              "hello_world"]
+# Tasks whose inputs can be read ahead of time (see prefetch_task)
+PREFETCHED_TASKS = ["chunk_edges"]
+# Bounds on the random wait (in seconds) after finding an empty queue
+MIN_BACKOFF = 1
+MAX_BACKOFF = 120
+
+
+# Worker-wide execution options (see configure)
+OPTIONS = dict(in_process=True, script_dir=None, timeout=None, isolate=False)
+
+
+class TaskTimeout(TimeoutError):
+    pass
+
+
+def configure(**options):
+    """
+    Sets how SynaptorTasks are executed within this process.
+
+    Options:
+        in_process (bool): Whether to run tasks within this process
+            (otherwise they're forwarded to dispatcher.sh).
+        script_dir (str): The directory containing the task scripts.
+            Defaults to the current working directory.
+        timeout (float): Seconds before a task is interrupted (in-process
+            tasks are only interrupted within the main thread).
+        isolate (bool): Whether to run each task in a new python process.
+    """
+    for k in options:
+        assert k in OPTIONS, f"unknown option {k}"
+
+    OPTIONS.update(options)
+
+
+def run_task(cmd, script_dir=None, timeout=None, isolate=False):
+    """ Runs a task command line (e.g. ["chunk_edges", ...]) """
+    assert len(cmd) > 0, "No command received"
+    name, args = cmd[0], list(cmd[1:])
+
+    if name not in TASK_NAMES:
+        raise TypeError(f"invalid task name {name}")
+
+    script = script_path(name, script_dir)
+
+    if isolate:
+        run_isolated(script, args, timeout)
+    else:
+        with time_limit(timeout):
+            run_script(script, args)
+
+
+def prefetch_task(cmd, script_dir=None):
+    """
+    Starts reading the inputs of a task command line in the background
+    if the task supports it (see PREFETCHED_TASKS). The task script is
+    run with its edge_task call only prefetching (see
+    proc.tasks_w_io.prefetching), so a later run_task call in this
+    process takes the inputs instead of reading them again.
+    """
+    if len(cmd) == 0 or cmd[0] not in PREFETCHED_TASKS:
+        return
+
+    from ...proc import tasks_w_io
+
+    with tasks_w_io.prefetching():
+        run_script(script_path(cmd[0], script_dir), list(cmd[1:]))
+
+
+def poll(tq, lease_seconds=300, prefetch=True):
+    """
+    Executes the tasks of a TaskQueue until interrupted (or a task fails).
+    With prefetch=True, the next task is leased before running the
+    current one, and starts reading its inputs (see prefetch_task). Its
+    lease then starts early, so lease_seconds should cover two tasks.
+    """
+    from taskqueue import QueueEmptyError
+
+    def lease():
+        try:
+            return tq.lease(seconds=int(lease_seconds))
+        except QueueEmptyError:
+            return None
+
+    task, tries = None, 0
+    while True:
+        task = lease() if task is None else task
+        if task is None:
+            tries += 1
+            time.sleep(random.uniform(MIN_BACKOFF,
+                                      min(2 ** tries, MAX_BACKOFF)))
+            continue
+        tries = 0
+
+        next_task = lease() if prefetch else None
+        if next_task is not None and hasattr(next_task, "prefetch"):
+            try:
+                next_task.prefetch()
+            except Exception as e:
+                print(f"Prefetching {next_task} failed: {e!r}")
+
+        task.execute()
+        tq.delete(task)
+
+        task = next_task
+
+
+def script_path(name, script_dir=None):
+    script_dir = os.getcwd() if script_dir is None else script_dir
+
+    return os.path.join(script_dir, f"{name}.py")
+
+
+def run_script(script, args):
+    """ Runs a task script as __main__ with the passed arguments """
+    argv = sys.argv
+    sys.argv = [script, *args]
+    try:
+        runpy.run_path(script, run_name="__main__")
+
+    except SystemExit as e:
+        # e.g. argparse errors - these shouldn't exit the worker
+        if e.code not in (0, None):
+            raise RuntimeError(f"{os.path.basename(script)} exited"
+                               f" with status {e.code}") from e
+
+    finally:
+        sys.argv = argv
+
+
+def run_isolated(script, args, timeout=None):
+    """
+    Runs a task script within a new python process (which is killed
+    after timeout seconds)
+    """
+    proc = subprocess.Popen([sys.executable, script, *args])
+    try:
+        returncode = proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        raise TaskTimeout(f"{os.path.basename(script)} timed out"
+                          f" after {timeout}s")
+
+    if returncode != 0:
+        raise RuntimeError(f"{os.path.basename(script)} failed"
+                           f" with exit code {returncode}")
+
+
+@contextlib.contextmanager
+def time_limit(timeout=None):
+    """
+    Interrupts the enclosed block with a TaskTimeout after timeout seconds.
+    Only applies within the main thread (using SIGALRM), and the timeout
+    is ignored (with a warning) elsewhere.
+    """
+    if timeout is None or not hasattr(signal, "SIGALRM"):
+        yield
+        return
+
+    if threading.current_thread() is not threading.main_thread():
+        print(f"WARNING: ignoring the {timeout}s task timeout"
+              " outside of the main thread")
+        yield
+        return
+
+    def interrupt(signum, frame):
+        raise TaskTimeout(f"task timed out after {timeout}s")
+
+    handler = signal.signal(signal.SIGALRM, interrupt)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, handler)
@@ -2,6 +2,8 @@ import subprocess
 
 from taskqueue import RegisteredTask
 
+from . import executor
+
 
 class SynaptorTask(RegisteredTask):
     def __init__(self, command_line=""):
@@ -9,9 +11,26 @@ class SynaptorTask(RegisteredTask):
         self.cmd = command_line.split(" ")
 
     def execute(self):
-        # Interim solution: Forward the command to the dispatcher.sh, which
-        # will then again call the correct python scripts to run... ideally,
-        # we would start the Python functions directly from here.
+        if not self.cmd:
+            raise ValueError("No command received")
+
+        options = executor.OPTIONS
+        if options["in_process"]:
+            executor.run_task(self.cmd, script_dir=options["script_dir"],
+                              timeout=options["timeout"],
+                              isolate=options["isolate"])
+        else:
+            self.dispatch()
+
+    def prefetch(self):
+        """ Starts reading this task's inputs within this process """
+        options = executor.OPTIONS
+        if options["in_process"] and not options["isolate"]:
+            executor.prefetch_task(self.cmd, script_dir=options["script_dir"])
+
+    def dispatch(self):
+        # Forwards the command to the dispatcher.sh, which will then
+        # call the correct python script in a new process
         def run_cmd(cmd):
             popen = subprocess.Popen(
                 cmd, stdout=subprocess.PIPE, universal_newlines=True
@@ -24,10 +43,7 @@ class SynaptorTask(RegisteredTask):
             if return_code:
                 raise subprocess.CalledProcessError(return_code, cmd)
 
-        if self.cmd:
-            for stdout in run_cmd(["./dispatcher.sh", *self.cmd]):
-                print(stdout, end="")
-                if "invalid task name" in stdout:
-                    raise TypeError(stdout)
-        else:
-            raise ValueError("No command received")
+        for stdout in run_cmd(["./dispatcher.sh", *self.cmd]):
+            print(stdout, end="")
+            if "invalid task name" in stdout:
+                raise TypeError(stdout)
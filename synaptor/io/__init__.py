@@ -1,11 +1,22 @@
+from .. import lazy
+
 from . import backends
-from .backends.cloudvolume import *
 from .backends.utils import *
-from .backends.sqlalchemy import open_db_metadata
-from .backends.sqlalchemy import create_db_tables, drop_db_tables
-from .backends.sqlalchemy import execute_db_statement, execute_db_statements
-
-from . import pcg
 
 from .base import *
 from .utils import *
+
+
+# The cloudvolume and sqlalchemy backends (and pcg) are imported on first
+# use (see synaptor/lazy.py)
+__getattr__, __dir__ = lazy.attach(
+    __name__,
+    submodules=["pcg"],
+    attributes={
+        "backends.cloudvolume": ["read_cloud_volume_chunk",
+                                 "write_cloud_volume_chunk",
+                                 "init_seg_volume"],
+        "backends.sqlalchemy": ["open_db_metadata", "db_metadata", "db_table",
+                                "create_db_tables", "drop_db_tables",
+                                "execute_db_statement",
+                                "execute_db_statements"]})[:2]
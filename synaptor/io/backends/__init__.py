@@ -1,6 +1,10 @@
-from . import aws
-from . import gcloud
-from . import cloudvolume
-from . import local
-from . import utils
-from . import sqlalchemy
+from ... import lazy
+
+
+# Backends are imported on first use (see synaptor/lazy.py), since each
+# needs its own client library
+__getattr__, __dir__, __all__ = lazy.attach(
+    __name__,
+    submodules=["aws", "gcloud", "fakebucket", "cloudvolume", "columnar",
+                "local", "cache", "transfer", "utils", "sqlalchemy",
+                "pgcopy"])
@@ -1,65 +1,89 @@
 """ AWS IO Functionality """
 
 import os
-import re
-import glob
-import subprocess
+import threading
 
 import cloudvolume  # Piggybacking on cloudvolume's secrets
 import boto3
+import botocore.config
 
+from . import cache
 from . import utils
+from . import transfer
 
 
-REGEXP = re.compile("s3://")
+REGEXP = utils.AWS_REGEXP
 CREDS_FN = cloudvolume.secrets.aws_credentials
 
+# Clients opened so far (boto3 clients are thread-safe)
+_clients = dict()
+_clients_lock = threading.Lock()
 
-def pull_file(remote_path):
-    bucket, key = parse_remote_path(remote_path)
 
-    local_fname = os.path.basename(remote_path)
+def pull_file(remote_path, local_fname=None):
+    """
+    Pulls an object to local_fname (default: its basename) through the
+    local cache (see cache.py)
+    """
+    if local_fname is None:
+        local_fname = os.path.basename(remote_path)
+
+    return cache.pull_file(remote_path, local_fname,
+                           download_file, object_version)
+
+
+def download_file(remote_path, local_fname, version=None):
+    """ Downloads an object (checking its ETag if a version is given) """
+    bucket, key = parse_remote_path(remote_path)
 
     client = open_client(bucket)
 
-    client.download_file(bucket, key, local_fname)
+    extra_args = None if version is None else {"IfMatch": version}
+    client.download_file(bucket, key, local_fname, ExtraArgs=extra_args)
 
-    return local_fname
 
+def object_version(remote_path):
+    """ The current ETag of an object """
+    bucket, key = parse_remote_path(remote_path)
 
-def pull_files(remote_paths, check=True,
-               batching_limit=50000, batch_size=1000):
+    client = open_client(bucket)
+
+    return client.head_object(Bucket=bucket, Key=key)["ETag"]
 
-    if len(remote_paths) > batching_limit:
-        return pull_files_in_batches(remote_paths, batch_size)
-    else:
-        subprocess.run(["gsutil", "-m", "-q", "cp", *remote_paths, "."],
-                       check=check)
-        return list(map(os.path.basename, remote_paths))
 
+def object_size(remote_path):
+    """ The size of an object in bytes """
+    bucket, key = parse_remote_path(remote_path)
+
+    client = open_client(bucket)
 
-def pull_files_in_batches(paths, check=True, batch_size=1000):
-    num_batches = len(paths) / batch_size + 1
+    return client.head_object(Bucket=bucket, Key=key)["ContentLength"]
 
-    local_paths = list()
-    for i in range(num_batches):
-        batch_paths = paths[i*batch_size:(i+1)*batch_size]
-        subprocess.run(["gsutil", "-m", "-q", "cp", *batch_paths, "."],
-                       check=check)
-        local_paths.extend(map(os.path.basename, batch_paths))
 
-    return local_paths
+def pull_files(remote_paths, check=True):
+    return transfer.pull_files(pull_file, remote_paths, check=check)
 
 
 def pull_directory(remote_dir, check=True):
     """ This will currently break if the remote dir has subdirectories """
-    local_dirname = os.path.basename(remote_dir)
-    subprocess.run(["gsutil", "-m", "-q", "cp", "-r", remote_dir, "."],
-                   check=check)
+    return transfer.pull_directory(list_paths, pull_file, remote_dir,
+                                   check=check)
 
-    local_fnames = glob.glob(f"{local_dirname}/*")
 
-    return local_fnames
+def read_bytes(remote_path, start=None, end=None):
+    """ Reads an object (or its bytes within [start, end)) into memory """
+    bucket, key = parse_remote_path(remote_path)
+
+    client = open_client(bucket)
+
+    kwargs = dict()
+    if start is not None or end is not None:
+        # S3 byte ranges include the end
+        start = 0 if start is None else start
+        end = "" if end is None else end - 1
+        kwargs["Range"] = f"bytes={start}-{end}"
+
+    return client.get_object(Bucket=bucket, Key=key, **kwargs)["Body"].read()
 
 
 def send_file(local_name, remote_path):
@@ -70,35 +94,38 @@ def send_file(local_name, remote_path):
     client.upload_file(local_name, bucket, key)
 
 
-def send_files(local_names, remote_dir):
-    # gsutil is running into a strange error - using the simpler method instead
-    # subprocess.run(["gsutil", "-q", "-m", "cp", *local_names, remote_dir])
-    for local_name in local_names:
-        dst = os.path.join(remote_dir, os.path.basename(local_name))
-        send_file(local_name, dst)
+def send_files(local_names, remote_dir, check=True):
+    transfer.send_files(send_file, local_names, remote_dir, check=check)
 
 
 def send_directory(local_dir, remote_dir):
-    bucket, key = parse_remote_path(remote_dir)
+    transfer.send_directory(send_file, local_dir, remote_dir)
 
-    # Sending directory to a subdirectory of remote dir
-    key = os.path.join(key, os.path.basename(utils.check_no_slash(local_dir)))
 
-    fnames = os.listdir(local_dir)
-    remote_keys = [os.path.join(key, f) for f in fnames]
+def write_bytes(data, remote_path):
+    """ Writes an object from memory """
+    bucket, key = parse_remote_path(remote_path)
 
     client = open_client(bucket)
 
-    for (f, key) in zip(fnames, remote_keys):
-        client.upload_file(os.path.join(local_dir, f), bucket, key)
+    client.put_object(Bucket=bucket, Key=key, Body=bytes(data))
+
+
+def list_paths(remote_dir):
+    """ Lists the objects under a remote "directory" """
+    bucket, key = parse_remote_path(utils.check_slash(remote_dir))
+
+    keys = keys_under_prefix(open_client(bucket), bucket, key)
+
+    return [f"s3://{bucket}/{k}" for k in keys if not k.endswith("/")]
 
 
 def keys_under_prefix(client, bucket, key):
 
-    response = client.list_objects(Bucket=bucket,
-                                   Prefix=utils.check_slash(key))
+    paginator = client.get_paginator("list_objects_v2")
+    pages = paginator.paginate(Bucket=bucket, Prefix=utils.check_slash(key))
 
-    return [obj["Key"] for obj in response["Contents"]]
+    return [obj["Key"] for page in pages for obj in page.get("Contents", [])]
 
 
 def parse_remote_path(remote_path):
@@ -111,8 +138,16 @@ def parse_remote_path(remote_path):
 
 
 def open_client(bucket):
-    creds = CREDS_FN(bucket)
-    return boto3.client("s3",
-                        aws_access_key_id=creds["AWS_ACCESS_KEY_ID"],
-                        aws_secret_access_key=creds["AWS_SECRET_ACCESS_KEY"],
-                        region_name="us-east-1")
+    """ Opens a client for a bucket, reusing it (and its connection pool) """
+    with _clients_lock:
+        if bucket not in _clients:
+            creds = CREDS_FN(bucket)
+            _clients[bucket] = boto3.client(
+                "s3",
+                aws_access_key_id=creds["AWS_ACCESS_KEY_ID"],
+                aws_secret_access_key=creds["AWS_SECRET_ACCESS_KEY"],
+                region_name="us-east-1",
+                config=botocore.config.Config(
+                           max_pool_connections=transfer.PARALLELISM))
+
+    return _clients[bucket]
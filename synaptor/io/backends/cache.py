@@ -0,0 +1,198 @@
+"""
+Local Object Cache
+
+Remote objects pulled to local files are first downloaded into a cache
+directory shared by every process on a node, keyed by their full uri and
+version (GCS generation, S3 ETag, ...). Tasks that pull the same objects
+(unique id maps, networks, histograms, ...) then download each of them
+once, and the pulled files are copied out of the cache (copies instead
+of links, so that later writes to the pulled files can't reach it).
+
+Entries are locked with flock while they're downloaded or copied, and
+the least recently used entries are evicted once the cache grows past
+its size cap. The cache is disabled when the cap is 0.
+"""
+
+import os
+import fcntl
+import shutil
+import hashlib
+import tempfile
+import threading
+import contextlib
+
+
+CACHE_DIR = os.environ.get("SYNAPTOR_CACHE_DIR",
+                           os.path.join(tempfile.gettempdir(),
+                                        "synaptor_cache"))
+# Size cap in bytes
+MAX_SIZE = int(os.environ.get("SYNAPTOR_CACHE_SIZE", 4 * 2 ** 30))
+
+LOCK_EXT = ".lock"
+PART_EXT = ".part"
+
+# Bytes added by this process since the last eviction check. The cache is
+# only scanned after enough has been added to matter.
+_added = 0
+_added_lock = threading.Lock()
+
+
+def configure(cache_dir=None, max_size=None):
+    """ Sets the cache directory and/or its size cap (0 disables it) """
+    global CACHE_DIR, MAX_SIZE
+
+    if cache_dir is not None:
+        CACHE_DIR = cache_dir
+
+    if max_size is not None:
+        MAX_SIZE = max_size
+
+
+def enabled():
+    return MAX_SIZE > 0
+
+
+def pull_file(remote_path, local_fname, download_file, object_version):
+    """
+    Pulls a remote object to local_fname through the cache.
+
+    Args:
+        remote_path (str): The object's uri.
+        local_fname (str): Where to place the pulled file.
+        download_file (function): Downloads an object's version to a local
+            file - download_file(remote_path, local_fname, version).
+        object_version (function): Returns the current version of an
+            object (str).
+
+    Returns:
+        str: local_fname
+    """
+    if not enabled():
+        download_file(remote_path, local_fname, None)
+        return local_fname
+
+    version = object_version(remote_path)
+    entry = entry_path(remote_path, version)
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+
+    with entry_lock(entry):
+        if os.path.exists(entry):
+            os.utime(entry)  # marks it as recently used
+
+        else:
+            part = entry + PART_EXT
+            try:
+                download_file(remote_path, part, version)
+            except BaseException:
+                if os.path.exists(part):
+                    os.remove(part)
+                raise
+
+            os.replace(part, entry)
+            record_added(os.path.getsize(entry))
+
+        shutil.copyfile(entry, local_fname)
+
+    return local_fname
+
+
+def entry_path(remote_path, version):
+    """ The cache path for a version of an object """
+    key = hashlib.sha256(f"{remote_path}\0{version}".encode()).hexdigest()
+    basename = os.path.basename(remote_path)
+
+    # keeping the basename also keeps its extension
+    return os.path.join(CACHE_DIR, key[:2], f"{key[2:]}_{basename}")
+
+
+@contextlib.contextmanager
+def entry_lock(entry, blocking=True):
+    """
+    Locks a cache entry across processes and threads. Yields whether the
+    lock was acquired (always True when blocking).
+    """
+    flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+    lockname = entry + LOCK_EXT
+
+    while True:
+        lockfile = open(lockname, "a")
+        try:
+            fcntl.flock(lockfile, flags)
+        except BlockingIOError:
+            lockfile.close()
+            yield False
+            return
+
+        # the lock file may have been removed (by evict) while we waited
+        if same_file(lockfile, lockname):
+            break
+        lockfile.close()
+
+    try:
+        yield True
+    finally:
+        lockfile.close()  # releases the lock
+
+
+def same_file(f, path):
+    try:
+        return os.path.samestat(os.fstat(f.fileno()), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+def record_added(num_bytes):
+    """ Evicts entries once enough has been added since the last check """
+    global _added
+
+    with _added_lock:
+        _added += num_bytes
+        if _added < MAX_SIZE // 16:
+            return
+        _added = 0
+
+    evict()
+
+
+def evict(max_size=None):
+    """
+    Removes the least recently used entries until the cache fits within
+    max_size (default: MAX_SIZE). Entries locked by another worker are
+    skipped.
+    """
+    max_size = MAX_SIZE if max_size is None else max_size
+
+    entries = cache_entries()
+    total = sum(size for (_, size, _) in entries)
+
+    for (entry, size, _) in sorted(entries, key=lambda e: e[2]):
+        if total <= max_size:
+            break
+
+        with entry_lock(entry, blocking=False) as locked:
+            if not locked or not os.path.exists(entry):
+                continue
+
+            os.remove(entry)
+            os.remove(entry + LOCK_EXT)
+            total -= size
+
+
+def cache_entries():
+    """ (path, size, last use) for each cache entry """
+    entries = list()
+    if not os.path.isdir(CACHE_DIR):
+        return entries
+
+    for shard in os.scandir(CACHE_DIR):
+        if not shard.is_dir():
+            continue
+
+        for f in os.scandir(shard.path):
+            if f.name.endswith((LOCK_EXT, PART_EXT)):
+                continue
+
+            stat = f.stat()
+            entries.append((f.path, stat.st_size, stat.st_mtime))
+
+    return entries
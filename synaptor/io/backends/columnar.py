@@ -0,0 +1,286 @@
+"""
+Binary Columnar DataFrame IO
+
+DataFrames are stored as either
+(1) .npz files holding one array per column (and the index) or
+(2) Parquet files (requires pyarrow).
+
+Both support reading a subset of columns, and filtering rows by predicates
+before the DataFrame is assembled. Predicates are (column, op, value)
+tuples which are all required to hold, e.g. [("partnerhash", "==", 3)].
+"""
+
+import os
+import shutil
+import zipfile
+import tempfile
+import contextlib
+
+import numpy as np
+import pandas as pd
+
+from ...types.dataframe import dtypes
+
+try:
+    import pyarrow  # noqa: F401 (pandas parquet engine)
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+NPZ_EXTS = (".npz",)
+PARQUET_EXTS = (".parquet", ".pq")
+INDEX_KEY = "__index__"
+INDEX_NAME_KEY = "__index_name__"
+COLUMNS_KEY = "__columns__"
+
+FILTER_OPS = {"==": np.equal,
+              "!=": np.not_equal,
+              "<": np.less,
+              "<=": np.less_equal,
+              ">": np.greater,
+              ">=": np.greater_equal,
+              "in": lambda vals, v: np.isin(vals, list(v)),
+              "not in": lambda vals, v: ~np.isin(vals, list(v))}
+
+
+def is_columnar_path(path):
+    return isinstance(path, str) and path.endswith(NPZ_EXTS + PARQUET_EXTS)
+
+
+def read_dframe(path, columns=None, filters=None, chunksize=None,
+                fname=None):
+    """
+    Reads a dataframe from a binary columnar file. If chunksize is
+    passed, returns an iterator over row chunks (as with pd.read_csv)
+    of the filtered table. path can also be a binary file object, in
+    which case fname names the file (to pick its format).
+    """
+    fname = path if fname is None else fname
+    if fname.endswith(NPZ_EXTS):
+        dframe = read_npz_dframe(path, columns=columns, filters=filters)
+    else:
+        dframe = read_parquet_dframe(path, columns=columns, filters=filters)
+
+    if chunksize is not None:
+        return contextlib.closing(iter_row_chunks(dframe, chunksize))
+
+    return dframe
+
+
+def write_dframe(dframe, path, fname=None):
+    fname = path if fname is None else fname
+    if fname.endswith(NPZ_EXTS):
+        write_npz_dframe(dframe, path)
+    else:
+        write_parquet_dframe(dframe, path)
+
+
+def write_dframe_parts(dframes, path):
+    """
+    Writes a sequence of dataframes (with the same columns) as a single
+    file, holding only one of them in memory at a time.
+    """
+    if path.endswith(NPZ_EXTS):
+        write_npz_parts(dframes, path)
+    else:
+        write_parquet_parts(dframes, path)
+
+
+def read_npz_dframe(path, columns=None, filters=None):
+    with np.load(path, allow_pickle=False) as f:
+        colnames = f[COLUMNS_KEY].tolist()
+        index_name = f[INDEX_NAME_KEY].item() or None
+        keys = {name: f"c{i}" for (i, name) in enumerate(colnames)}
+        keys[index_name] = INDEX_KEY
+
+        mask = filter_mask(lambda name: f[keys[name]], filters)
+
+        def load(key):
+            return f[key] if mask is None else f[key][mask]
+
+        if columns is not None:
+            colnames = [name for name in columns if name != index_name]
+
+        index = pd.Index(load(INDEX_KEY), name=index_name)
+        data = {name: load(keys[name]) for name in colnames}
+
+    return pd.DataFrame(data, index=index, columns=colnames)
+
+
+def write_npz_dframe(dframe, path):
+    """
+    Writes one array per column. Columns with a dtype declared in
+    types/dataframe/dtypes.py are stored as that dtype if it's lossless.
+    """
+    arrays = npz_header_arrays(dframe)
+    arrays.update(npz_column_arrays(dframe))
+
+    # np.savez appends .npz otherwise
+    if isinstance(path, str):
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+    else:
+        np.savez(path, **arrays)
+
+
+def npz_header_arrays(dframe):
+    """ The arrays naming the columns and index of an .npz dataframe """
+    colnames = [str(name) for name in dframe.columns]
+    index_name = "" if dframe.index.name is None else str(dframe.index.name)
+
+    return {COLUMNS_KEY: np.array(colnames, dtype=str),
+            INDEX_NAME_KEY: np.array(index_name)}
+
+
+def npz_column_arrays(dframe):
+    """ The arrays holding the index and columns of an .npz dataframe """
+    index_name = "" if dframe.index.name is None else str(dframe.index.name)
+
+    arrays = {INDEX_KEY: column_array(dframe.index, index_name)}
+    for (i, name) in enumerate(dframe.columns):
+        arrays[f"c{i}"] = column_array(dframe.iloc[:, i], str(name))
+
+    return arrays
+
+
+def write_npz_parts(dframes, path):
+    """
+    Writes a sequence of dataframes as a single .npz file. Each column of
+    each part is appended to a raw file beside path, and these are then
+    copied (in blocks) into the .npz archive behind .npy headers.
+    """
+    spill_dir = tempfile.mkdtemp(dir=os.path.dirname(path) or None)
+    try:
+        header, coltypes, lengths = None, dict(), dict()
+        for dframe in dframes:
+            if header is None:
+                header = npz_header_arrays(dframe)
+            else:
+                assert np.array_equal(header[COLUMNS_KEY],
+                                      npz_header_arrays(dframe)[COLUMNS_KEY]
+                                      ), "mismatched columns"
+
+            for (key, arr) in npz_column_arrays(dframe).items():
+                dtype = coltypes.setdefault(key, arr.dtype)
+                assert np.can_cast(arr.dtype, dtype, "same_kind"), (
+                    f"mismatched column types: {arr.dtype} and {dtype}")
+
+                with open(os.path.join(spill_dir, key), "ab") as f:
+                    f.write(np.ascontiguousarray(arr, dtype=dtype).tobytes())
+                lengths[key] = lengths.get(key, 0) + len(arr)
+
+        assert header is not None, "no dataframes to write"
+
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED,
+                             allowZip64=True) as zf:
+            for (key, arr) in header.items():
+                with zf.open(f"{key}.npy", "w", force_zip64=True) as f:
+                    np.lib.format.write_array(f, arr, allow_pickle=False)
+
+            for (key, dtype) in coltypes.items():
+                with zf.open(f"{key}.npy", "w", force_zip64=True) as f:
+                    np.lib.format.write_array_header_2_0(
+                        f, {"descr": np.lib.format.dtype_to_descr(dtype),
+                            "fortran_order": False,
+                            "shape": (lengths[key],)})
+
+                    with open(os.path.join(spill_dir, key), "rb") as raw:
+                        shutil.copyfileobj(raw, f)
+
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+
+def column_array(values, colname):
+    arr = np.asarray(values)
+    if arr.dtype == object:
+        return arr.astype(str)
+
+    dtype = dtypes.column_dtype(colname)
+    if dtype is not None and np.can_cast(arr.dtype, dtype, "safe"):
+        return arr.astype(dtype, copy=False)
+
+    return arr
+
+
+def read_parquet_dframe(path, columns=None, filters=None):
+    assert HAS_PYARROW, "pyarrow is required for parquet dataframes"
+    if filters is not None:
+        filters = [(colname, op, parquet_filter_value(value))
+                   for (colname, op, value) in filters]
+
+    return pd.read_parquet(path, columns=columns, filters=filters)
+
+
+def parquet_filter_value(value):
+    """
+    pyarrow converts python ints to int64, so larger (uint64) ids are
+    passed as numpy scalars instead
+    """
+    if isinstance(value, (set, frozenset, list, tuple)):
+        return [parquet_filter_value(v) for v in value]
+
+    if isinstance(value, int) and value > np.iinfo(np.int64).max:
+        return np.uint64(value)
+
+    return value
+
+
+def write_parquet_dframe(dframe, path):
+    assert HAS_PYARROW, "pyarrow is required for parquet dataframes"
+    dframe.to_parquet(path, index=True)
+
+
+def write_parquet_parts(dframes, path):
+    """ Writes a sequence of dataframes as row groups of a parquet file """
+    assert HAS_PYARROW, "pyarrow is required for parquet dataframes"
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for dframe in dframes:
+            table = pyarrow.Table.from_pandas(dframe, preserve_index=True)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+
+    finally:
+        if writer is not None:
+            writer.close()
+
+    assert writer is not None, "no dataframes to write"
+
+
+def filter_mask(get_column, filters):
+    """
+    Evaluates a list of (column, op, value) predicates over columns
+    fetched by name. Returns None if there are no filters.
+    """
+    if filters is None or len(filters) == 0:
+        return None
+
+    mask = None
+    for (colname, op, value) in filters:
+        assert op in FILTER_OPS, f"unsupported filter op: {op}"
+        colmask = FILTER_OPS[op](np.asarray(get_column(colname)), value)
+        mask = colmask if mask is None else mask & colmask
+
+    return mask
+
+
+def filter_dframe(dframe, filters):
+    """ Applies a list of predicates to a loaded dataframe """
+    def get_column(name):
+        if name == dframe.index.name and name not in dframe.columns:
+            return dframe.index.values
+        return dframe[name].values
+
+    mask = filter_mask(get_column, filters)
+
+    return dframe if mask is None else dframe[mask]
+
+
+def iter_row_chunks(dframe, chunksize):
+    for i in range(0, len(dframe), chunksize):
+        yield dframe.iloc[i:i+chunksize]
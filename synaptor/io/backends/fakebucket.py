@@ -0,0 +1,108 @@
+"""
+Fake Bucket IO
+
+Serves remote paths (gs://bucket/key or s3://bucket/key) from a local
+directory (root/bucket/key) instead, with the same interface as the
+gcloud and aws backends. This is meant for testing tasks without cloud
+credentials, and is enabled by use() or the SYNAPTOR_FAKE_BUCKET_DIR
+environment variable.
+"""
+
+import os
+import shutil
+
+from . import cache
+from . import local
+from . import utils
+from . import transfer
+
+
+ROOT = os.environ.get("SYNAPTOR_FAKE_BUCKET_DIR")
+
+
+def use(root):
+    """ Serves all remote paths from root (None disables the fake bucket) """
+    global ROOT
+    ROOT = root
+
+
+def fake_path(remote_path):
+    """ The local path standing in for a remote path """
+    assert ROOT is not None, "fake bucket not enabled"
+    protocol, bucket, key = utils.parse_remote_path(remote_path)
+
+    return os.path.join(ROOT, bucket, key)
+
+
+def pull_file(remote_path, local_fname=None):
+    if local_fname is None:
+        local_fname = os.path.basename(remote_path)
+
+    return cache.pull_file(remote_path, local_fname,
+                           download_file, object_version)
+
+
+def download_file(remote_path, local_fname, version=None):
+    shutil.copyfile(fake_path(remote_path), local_fname)
+
+
+def object_version(remote_path):
+    """ Stands in for a generation/ETag """
+    stat = os.stat(fake_path(remote_path))
+
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def object_size(remote_path):
+    return os.path.getsize(fake_path(remote_path))
+
+
+def pull_files(remote_paths, check=True):
+    return transfer.pull_files(pull_file, remote_paths, check=check)
+
+
+def pull_directory(remote_dir, check=True):
+    return transfer.pull_directory(list_paths, pull_file, remote_dir,
+                                   check=check)
+
+
+def read_bytes(remote_path, start=None, end=None):
+    """ Reads an object (or its bytes within [start, end)) into memory """
+    return local.read_bytes(fake_path(remote_path), start=start, end=end)
+
+
+def send_file(local_name, remote_path):
+    path = fake_path(remote_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    shutil.copyfile(local_name, path)
+
+
+def send_files(local_names, remote_dir, check=True):
+    transfer.send_files(send_file, local_names, remote_dir, check=check)
+
+
+def send_directory(local_dir, remote_dir):
+    transfer.send_directory(send_file, local_dir, remote_dir)
+
+
+def write_bytes(data, remote_path):
+    """ Writes an object from memory """
+    path = fake_path(remote_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    local.write_bytes(data, path)
+
+
+def list_paths(remote_dir):
+    """ Lists the objects under a remote "directory" (recursively) """
+    remote_dir = utils.check_no_slash(remote_dir)
+    local_dir = fake_path(remote_dir)
+
+    paths = list()
+    for (dirpath, _, fnames) in os.walk(local_dir):
+        subdir = os.path.relpath(dirpath, local_dir)
+        for f in fnames:
+            paths.append(os.path.normpath(os.path.join(subdir, f)))
+
+    return [f"{remote_dir}/{p}" for p in sorted(paths)]
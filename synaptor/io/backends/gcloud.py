@@ -1,68 +1,88 @@
 """ GCloud IO Functionality """
 
 import os
-import re
-import glob
-import subprocess
+import threading
 
 import cloudvolume  # Piggybacking on cloudvolume's secrets
 from google.cloud import storage
 
+from . import cache
 from . import utils
+from . import transfer
 
 
-REGEXP = re.compile("gs://")
+REGEXP = utils.GCLOUD_REGEXP
 CREDS_FN = cloudvolume.secrets.google_credentials
 
+# Buckets opened so far by each thread (see open_bucket)
+_buckets = threading.local()
 
-def pull_file(remote_path, alwayspull=False):
-    bucket, key = parse_remote_path(remote_path)
 
-    local_fname = os.path.basename(remote_path)
+def pull_file(remote_path, local_fname=None, alwayspull=False):
+    """
+    Pulls an object to local_fname (default: its basename) through the
+    local cache (see cache.py), unless alwayspull=True.
+    """
+    if local_fname is None:
+        local_fname = os.path.basename(remote_path)
 
-    if not alwayspull and os.path.isfile(local_fname):
+    if alwayspull:
+        download_file(remote_path, local_fname)
         return local_fname
 
-    blob = open_bucket(bucket).blob(key)
+    return cache.pull_file(remote_path, local_fname,
+                           download_file, object_version)
+
+
+def download_file(remote_path, local_fname, version=None):
+    """ Downloads an object (or a specific generation of it) """
+    bucket, key = parse_remote_path(remote_path)
+
+    generation = None if version is None else int(version)
+    blob = open_bucket(bucket).blob(key, generation=generation)
 
     blob.download_to_filename(local_fname)
 
-    return local_fname
 
+def object_version(remote_path):
+    """ The current generation of an object """
+    bucket, key = parse_remote_path(remote_path)
+
+    blob = open_bucket(bucket).get_blob(key)
+    assert blob is not None, f"{remote_path} doesn't exist"
 
-def pull_files(remote_paths, check=True,
-               batching_limit=50000, batch_size=1000):
+    return str(blob.generation)
 
-    if len(remote_paths) > batching_limit:
-        return pull_files_in_batches(remote_paths, batch_size)
-    else:
-        subprocess.run(["gsutil", "-m", "-q", "cp", *remote_paths, "."],
-                       check=check)
-        return list(map(os.path.basename, remote_paths))
 
+def object_size(remote_path):
+    """ The size of an object in bytes """
+    bucket, key = parse_remote_path(remote_path)
 
-def pull_files_in_batches(paths, check=True, batch_size=1000):
-    num_batches = len(paths) / batch_size + 1
+    blob = open_bucket(bucket).get_blob(key)
+    assert blob is not None, f"{remote_path} doesn't exist"
 
-    local_paths = list()
-    for i in range(num_batches):
-        batch_paths = paths[i*batch_size:(i+1)*batch_size]
-        subprocess.run(["gsutil", "-m", "-q", "cp", *batch_paths, "."],
-                       check=check)
-        local_paths.extend(map(os.path.basename, batch_paths))
+    return blob.size
 
-    return local_paths
+
+def pull_files(remote_paths, check=True):
+    return transfer.pull_files(pull_file, remote_paths, check=check)
 
 
 def pull_directory(remote_dir, check=True):
     """ This will currently break if the remote dir has subdirectories """
-    local_dirname = os.path.basename(remote_dir)
-    subprocess.run(["gsutil", "-m", "-q", "cp", "-r", remote_dir, "."],
-                   check=check)
+    return transfer.pull_directory(list_paths, pull_file, remote_dir,
+                                   check=check)
 
-    local_fnames = glob.glob(f"{local_dirname}/*")
 
-    return local_fnames
+def read_bytes(remote_path, start=None, end=None):
+    """ Reads an object (or its bytes within [start, end)) into memory """
+    bucket, key = parse_remote_path(remote_path)
+
+    blob = open_bucket(bucket).blob(key)
+
+    # GCS byte ranges include the end
+    return blob.download_as_bytes(start=start,
+                                  end=None if end is None else end - 1)
 
 
 def send_file(local_name, remote_path):
@@ -74,24 +94,30 @@ def send_file(local_name, remote_path):
 
 
 def send_files(local_names, remote_dir, check=True):
-    subprocess.run(["gsutil", "-q", "-m", "cp", *local_names, remote_dir],
-                   check=check)
+    transfer.send_files(send_file, local_names, remote_dir, check=check)
 
 
 def send_directory(local_dir, remote_dir):
-    bucket, key = parse_remote_path(remote_dir)
+    transfer.send_directory(send_file, local_dir, remote_dir)
+
+
+def write_bytes(data, remote_path):
+    """ Writes an object from memory """
+    bucket, key = parse_remote_path(remote_path)
+
+    blob = open_bucket(bucket).blob(key)
 
-    # Sending directory to a subdirectory of remote dir
-    key = os.path.join(key, os.path.basename(utils.check_no_slash(local_dir)))
+    blob.upload_from_string(bytes(data))
 
-    fnames = os.listdir(local_dir)
-    remote_keys = [os.path.join(key, f) for f in fnames]
 
-    active_bucket = open_bucket(bucket)
+def list_paths(remote_dir):
+    """ Lists the objects under a remote "directory" """
+    bucket, key = parse_remote_path(utils.check_slash(remote_dir))
 
-    for (f, key) in zip(fnames, remote_keys):
-        blob = active_bucket.blob(key)
-        blob.upload_from_filename(os.path.join(local_dir, f))
+    blobs = open_bucket(bucket).list_blobs(prefix=key)
+
+    return [f"gs://{bucket}/{blob.name}" for blob in blobs
+            if not blob.name.endswith("/")]
 
 
 def parse_remote_path(remote_path):
@@ -104,9 +130,15 @@ def parse_remote_path(remote_path):
 
 
 def open_bucket(bucket):
-    """ Opens a bucket """
-    project, creds = CREDS_FN(bucket)
-    client = storage.Client(project=project,
-                            credentials=creds)
-
-    return client.get_bucket(bucket)
+    """
+    Opens a bucket. Each thread reuses its client (and its connection
+    pool) for the same bucket, and the bucket itself isn't fetched.
+    """
+    buckets = _buckets.__dict__
+    if bucket not in buckets:
+        project, creds = CREDS_FN(bucket)
+        client = storage.Client(project=project,
+                                credentials=creds)
+        buckets[bucket] = client.bucket(bucket)
+
+    return buckets[bucket]
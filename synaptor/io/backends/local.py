@@ -1,16 +1,19 @@
 """ Local Filesystem IO """
 
+import io
 import os
 import glob
+import contextlib
 import shutil
 import itertools
 import importlib
 import types
 
-import torch
 import h5py
 import pandas as pd
 
+from . import columnar
+
 
 def pull_file(fname):
     """ Ensure that a file exists locally. """
@@ -28,6 +31,15 @@ def pull_directory(dirname):
     return glob.glob(os.path.join(dirname, "*"))
 
 
+def read_bytes(fname, start=None, end=None):
+    """ Read a file (or its bytes within [start, end)) into memory. """
+    with open(fname, "rb") as f:
+        start = 0 if start is None else start
+        f.seek(start)
+
+        return f.read() if end is None else f.read(end - start)
+
+
 def send_file(src, dst):
     """ Copy a file. """
     shutil.copyfile(src, dst)
@@ -45,27 +57,99 @@ def send_directory(dirname, dst):
         shutil.move(dirname, dst)
 
 
-def read_dframe(path, chunksize=None):
-    """ Read a dataframe from local disk. """
-    assert os.path.isfile(path)
-    return pd.read_csv(path, index_col=0, chunksize=chunksize)
+def write_bytes(data, fname):
+    """ Write bytes from memory to a file. """
+    with open(fname, "wb") as f:
+        f.write(data)
+
+
+def read_dframe(path, chunksize=None, columns=None, filters=None,
+                fname=None):
+    """
+    Read a dataframe from local disk. Binary columnar files are picked by
+    extension (see columnar.py), and csv files are read otherwise.
+
+    columns restricts the columns that are read, and filters is a list of
+    (column, op, value) predicates that each returned row satisfies.
+
+    path can also be a binary file object (e.g. a BytesIO), in which case
+    fname names the file (to pick its format).
+    """
+    fname = path if fname is None else fname
+    if isinstance(path, str):
+        assert os.path.isfile(path)
 
+    if columnar.is_columnar_path(fname):
+        return columnar.read_dframe(path, columns=columns, filters=filters,
+                                    chunksize=chunksize, fname=fname)
 
-def write_dframe(dframe, path, header=True, index=True):
-    """ Write a dataframe to local disk. """
-    dframe.to_csv(path, index=index, header=header)
+    if columns is None and filters is None:
+        return pd.read_csv(path, index_col=0, chunksize=chunksize)
+
+    header = pd.read_csv(_rewound(path), nrows=0).columns.tolist()
+    index_name = pd.read_csv(_rewound(path), index_col=0, nrows=0).index.name
+    columns = header[1:] if columns is None else columns
+    columns = [c for c in columns if c != index_name]
+
+    reqd = set(columns) | set(f[0] for f in filters or [])
+    usecols = [0] + [i for (i, c) in enumerate(header) if i > 0 and c in reqd]
+
+    reader = pd.read_csv(_rewound(path), index_col=0, usecols=usecols,
+                         chunksize=chunksize)
+
+    if chunksize is None:
+        return columnar.filter_dframe(reader, filters)[columns]
+
+    return contextlib.closing(_filtered_chunks(reader, filters, columns))
+
+
+def _rewound(f):
+    """ Rewinds file objects so that they can be read again """
+    if not isinstance(f, str):
+        f.seek(0)
+
+    return f
 
 
-def read_network(net_fname, chkpt_fname):
-    """ Read a PyTorch model from disk. """
+def _filtered_chunks(reader, filters, columns):
+    with reader:
+        for chunk in reader:
+            yield columnar.filter_dframe(chunk, filters)[columns]
+
+
+def write_dframe(dframe, path, header=True, index=True, fname=None):
+    """
+    Write a dataframe to local disk. path can also be a file object, in
+    which case fname names the file (to pick its format).
+    """
+    fname = path if fname is None else fname
+    if columnar.is_columnar_path(fname):
+        assert header and index, "binary dataframes always store both"
+        columnar.write_dframe(dframe, path, fname=fname)
+    else:
+        dframe.to_csv(path, index=index, header=header)
+
+
+def read_network(net_fname, chkpt_fname, device=None):
+    """
+    Read a PyTorch model from disk onto a device
+    (default: CUDA if available, otherwise the CPU).
+    """
+    import torch
+
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+
     model = load_source(net_fname).InstantiatedModel
-    model.load_state_dict(torch.load(chkpt_fname))
+    model.load_state_dict(torch.load(chkpt_fname, map_location=device))
 
-    return model.cuda()
+    return model.to(device)
 
 
 def write_network(net, path):
     """ Write a PyTorch model to disk. """
+    import torch
+
     torch.save(net, path)
 
 
@@ -76,8 +160,13 @@ def open_h5(fname):
 
 
 def read_h5(fname, dset_name="/main"):
-    """ Read a specific dataset from an hdf5. """
-    assert os.path.isfile(fname), "File {} doesn't exist".format(fname)
+    """
+    Read a specific dataset from an hdf5 (given by name or as a binary
+    file object).
+    """
+    if isinstance(fname, str):
+        assert os.path.isfile(fname), "File {} doesn't exist".format(fname)
+
     with h5py.File(fname, "r") as f:
         return f[dset_name][()]
 
@@ -94,9 +183,12 @@ def write_h5(data, fname, dset_name="/main", chunk_size=None):
 
 
 def read_edge_csv(fname, delim=";", only_confident=False):
-    """ Read the first three fields of a csv file. """
+    """
+    Read the first three fields of a csv file (given by name or as a
+    binary file object).
+    """
     edges = []
-    with open(fname) as f:
+    with _text_file(fname) as f:
         for l in f.readlines():
             fields = l.strip().split(delim)
 
@@ -121,14 +213,31 @@ def read_edge_csv(fname, delim=";", only_confident=False):
 def write_edge_csv(edges, fname, delim=";"):
     """
     Write a three-field csv file formatted as
-    (cleft_id, presyn_segid, postsyn_segid).
+    (cleft_id, presyn_segid, postsyn_segid). fname can also be a binary
+    file object.
     """
-    with open(fname, "w+") as f:
+    with _text_file(fname, "w+") as f:
         for (cleft_id, presyn_id, postsyn_id) in edges:
             content = delim.join(map(str, (cleft_id, presyn_id, postsyn_id)))
             f.write(f"{content}\n")
 
 
+@contextlib.contextmanager
+def _text_file(f, mode="r"):
+    """ Opens a filename, or wraps a binary file object, for text IO """
+    if isinstance(f, str):
+        with open(f, mode) as textf:
+            yield textf
+        return
+
+    textf = io.TextIOWrapper(f, write_through=True)
+    try:
+        yield textf
+    finally:
+        # (closing the wrapper would also close f)
+        textf.detach()
+
+
 def load_source(fname, module_name="importedmodule"):
     """ Import a module from source """
     loader = importlib.machinery.SourceFileLoader(module_name, fname)
@@ -0,0 +1,123 @@
+"""
+In-Memory COPY Buffers
+
+Formats dataframes for Postgres' COPY ... FROM STDIN, either as csv or
+in the binary COPY format. Columns are first cast to the types of the
+(reflected) destination table, so that integer columns holding floats
+(e.g. after a merge introduced NaNs) are written as integers.
+"""
+
+import io
+import struct
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+
+BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+BINARY_TRAILER = struct.pack(">h", -1)
+
+
+def cast_columns(dframe, table):
+    """
+    Casts float columns bound for integer table columns to integers.
+    Missing values become nullable integers (written as NULL).
+    """
+    casts = dict()
+    for colname in dframe.columns:
+        coltype = table.c[str(colname)].type
+        values = dframe[colname]
+
+        if (not isinstance(coltype, sa.Integer)
+                or not pd.api.types.is_float_dtype(values.dtype)):
+            continue
+
+        present = values.dropna().values
+        assert np.all(present == np.round(present)), (
+            f"non-integer values in integer column {colname}")
+
+        casts[colname] = "Int64" if values.hasnans else np.int64
+
+    return dframe.astype(casts) if len(casts) > 0 else dframe
+
+
+def csv_buffer(dframe):
+    """ A csv buffer for COPY ... WITH (FORMAT csv) """
+    buf = io.StringIO()
+    dframe.to_csv(buf, index=False, header=False)
+    buf.seek(0)
+
+    return buf
+
+
+def binary_buffer(dframe, table):
+    """ A buffer for COPY ... WITH (FORMAT binary) """
+    fmts = [binary_format(table.c[str(c)].type) for c in dframe.columns]
+
+    if all(fmt is not None for fmt in fmts) and not dframe.isna().any().any():
+        rows = fixed_width_rows(dframe, fmts)
+    else:
+        rows = variable_width_rows(dframe, fmts)
+
+    return io.BytesIO(b"".join((BINARY_HEADER, rows, BINARY_TRAILER)))
+
+
+def binary_format(coltype):
+    """
+    The (numpy) format of a column type within binary COPY data, or None
+    for (utf-8 encoded) text
+    """
+    if isinstance(coltype, sa.BigInteger):
+        return ">i8"
+    elif isinstance(coltype, sa.SmallInteger):
+        return ">i2"
+    elif isinstance(coltype, sa.Integer):
+        return ">i4"
+    elif isinstance(coltype, sa.REAL):
+        return ">f4"
+    elif isinstance(coltype, sa.Float):
+        return ">f8"
+    elif isinstance(coltype, sa.Boolean):
+        return "?"
+    elif isinstance(coltype, sa.String):
+        return None
+
+    raise TypeError(f"binary COPY not supported for {coltype} columns")
+
+
+def fixed_width_rows(dframe, fmts):
+    """ Formats every row at once for numeric columns without NULLs """
+    fields = [("numfields", ">i2")]
+    for (i, fmt) in enumerate(fmts):
+        fields.extend(((f"len{i}", ">i4"), (f"val{i}", fmt)))
+
+    rows = np.empty((len(dframe),), dtype=fields)
+    rows["numfields"] = len(fmts)
+    for (i, (colname, fmt)) in enumerate(zip(dframe.columns, fmts)):
+        rows[f"len{i}"] = np.dtype(fmt).itemsize
+        rows[f"val{i}"] = dframe[colname].values
+
+    return rows.tobytes()
+
+
+def variable_width_rows(dframe, fmts):
+    """ Formats each row in turn for text columns or NULLs """
+    numfields = struct.pack(">h", len(fmts))
+    null = struct.pack(">i", -1)
+
+    def field(value, fmt):
+        if pd.isna(value):
+            return null
+
+        data = (str(value).encode() if fmt is None
+                else np.array(value, dtype=fmt).tobytes())
+
+        return struct.pack(">i", len(data)) + data
+
+    chunks = list()
+    for row in dframe.itertuples(index=False, name=None):
+        chunks.append(numfields)
+        chunks.extend(field(v, fmt) for (v, fmt) in zip(row, fmts))
+
+    return b"".join(chunks)
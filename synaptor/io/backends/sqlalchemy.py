@@ -1,40 +1,45 @@
 """ Database functionality through SQLAlchemy """
 
-import re
-import shutil
-import tempfile
+import io
+
 import sqlalchemy as sa
 import psycopg2
+from psycopg2 import sql as psql
+import numpy as np
 import pandas as pd
 
-from . import local
+from . import pgcopy
+from . import utils
 
 
-__all__ = ["open_db_metadata", "create_db_tables",
+__all__ = ["open_db_metadata", "db_metadata", "db_table", "create_db_tables",
            "execute_db_statement", "execute_db_statements",
-           "read_dframe", "write_dframe_direct", "write_dframe_copy_from"]
+           "read_dframe", "iter_dframes", "iter_groups", "iter_arrays",
+           "copy_to", "read_dframe_copy_to", "write_dframe_direct",
+           "write_dframe_copy_from"]
 
 # Pool of engines to databases used so far
 ENGINES = dict()
-# Pulling these from
-# https://docs.sqlalchemy.org/en/latest/core/engines.html#supported-databases
-REGEXPS = [re.compile("postgresql\+psycopg2://"),
-           re.compile("postgresql://"),
-           re.compile("postgresql\+pg8000://"),
-           re.compile("mysql://"),
-           re.compile("mysql\+mysqldb://"),
-           re.compile("mysql\+mysqlconnector://"),
-           re.compile("mysql\+oursql://"),
-           re.compile("oracle://"),
-           re.compile("oracle\+cx_oracle://"),
-           re.compile("mssql\+pyodbc://"),
-           re.compile("mssql\+pymssql://"),
-           re.compile("sqlite:///")]
+# Reflected metadata for each database (see db_metadata)
+METADATA = dict()
+# Bounds on the connection pool of each engine
+POOL_SIZE = 4
+MAX_OVERFLOW = 4
+# Rows per batch when streaming results (see iter_rows)
+BATCH_SIZE = 100000
+# Database URL patterns (see utils.DB_REGEXPS)
+REGEXPS = utils.DB_REGEXPS
 
 
 def init_engine(url):
     if url not in ENGINES:
-        ENGINES[url] = sa.create_engine(url)
+        if url.startswith("sqlite"):
+            ENGINES[url] = sa.create_engine(url)
+        else:
+            # pre-ping replaces stale connections instead of failing
+            ENGINES[url] = sa.create_engine(url, pool_size=POOL_SIZE,
+                                            max_overflow=MAX_OVERFLOW,
+                                            pool_pre_ping=True)
 
     return ENGINES[url]
 
@@ -48,14 +53,36 @@ def open_db_metadata(url):
     return metadata
 
 
+def db_metadata(url, refresh=False):
+    """
+    Reflected metadata for a database. This is only reflected once per
+    process (unless refresh=True), so it shouldn't be modified.
+    """
+    if refresh or url not in METADATA:
+        METADATA[url] = open_db_metadata(url)
+
+    return METADATA[url]
+
+
+def db_table(url, tablename):
+    """ A reflected table, reflecting the database again if it's new """
+    metadata = db_metadata(url)
+    if tablename not in metadata.tables:
+        metadata = db_metadata(url, refresh=True)
+
+    return metadata.tables[tablename]
+
+
 def create_db_tables(url, metadata):
     engine = init_engine(url)
     metadata.create_all(engine)
+    METADATA.pop(url, None)
 
 
 def drop_db_tables(url, metadata, tables=None):
     engine = init_engine(url)
     metadata.drop_all(engine, tables=tables)
+    METADATA.pop(url, None)
     return open_db_metadata(url)
 
 
@@ -120,25 +147,148 @@ def read_dframes(url, statements, index_cols=None):
     return results
 
 
+def iter_rows(url, statement, batch_size=None):
+    """
+    Streams the results of a statement as (column names, row batches).
+    Postgres results are read through a named server-side cursor, so
+    only one batch of rows is held in memory at a time.
+    """
+    batch_size = BATCH_SIZE if batch_size is None else batch_size
+    engine = init_engine(url)
+
+    with engine.connect() as conn:
+        result = conn.execution_options(
+                     stream_results=True, yield_per=batch_size
+                     ).execute(statement)
+
+        for rows in result.partitions(batch_size):
+            yield list(result.keys()), rows
+
+
+def iter_dframes(url, statement, batch_size=None, index_col=None,
+                 dtypes=None):
+    """
+    Streams the results of a statement as dataframes of (at most)
+    batch_size rows. dtypes optionally maps column names to their types.
+    """
+    for (colnames, rows) in iter_rows(url, statement, batch_size):
+        dframe = pd.DataFrame.from_records(rows, columns=colnames)
+
+        if dtypes is not None:
+            dframe = dframe.astype(dtypes)
+
+        if index_col is not None:
+            dframe = dframe.set_index(index_col)
+
+        yield dframe
+
+
+def iter_groups(url, statement, groupcol, batch_size=None, index_col=None,
+                dtypes=None):
+    """
+    Streams the results of a select statement as (value, dataframe) pairs
+    for each value of groupcol. The statement is ordered by groupcol, so
+    each group is yielded as soon as its rows are read, and only one batch
+    (plus the current group) is held in memory at a time.
+    """
+    statement = statement.order_by(statement.selected_columns[groupcol])
+
+    pending_value, pending = None, list()
+    for dframe in iter_dframes(url, statement, batch_size=batch_size,
+                               dtypes=dtypes):
+        values = dframe[groupcol].to_numpy()
+        starts = np.flatnonzero(values[1:] != values[:-1]) + 1
+        bounds = zip(np.concatenate(([0], starts)),
+                     np.concatenate((starts, [len(dframe)])))
+
+        for (start, end) in bounds:
+            value = values[start]
+            if len(pending) > 0 and value != pending_value:
+                yield pending_value, group_dframe(pending, index_col)
+                pending = list()
+
+            pending_value = value
+            pending.append(dframe.iloc[start:end])
+
+    if len(pending) > 0:
+        yield pending_value, group_dframe(pending, index_col)
+
+
+def group_dframe(pieces, index_col=None):
+    dframe = pieces[0] if len(pieces) == 1 else pd.concat(pieces)
+
+    return dframe if index_col is None else dframe.set_index(index_col)
+
+
+def iter_arrays(url, statement, batch_size=None, dtypes=None):
+    """
+    Streams the results of a statement as dicts mapping each column name
+    to a numpy array of (at most) batch_size values.
+    """
+    dtypes = dict() if dtypes is None else dtypes
+
+    for (colnames, rows) in iter_rows(url, statement, batch_size):
+        columns = zip(*rows)
+        yield {name: np.array(values, dtype=dtypes.get(name))
+               for (name, values) in zip(colnames, columns)}
+
+
+def copy_to(url, statement, buf=None, binary=False):
+    """
+    Exports the results of a statement (or a whole table) with COPY ...
+    TO STDOUT into a buffer (default: a new BytesIO), which is rewound
+    and returned. This is usually much faster than fetching rows for bulk
+    exports. csv exports include a header.
+    """
+    engine = init_engine(url)
+    buf = io.BytesIO() if buf is None else buf
+
+    if isinstance(statement, sa.Table):
+        statement = sa.select(statement)
+
+    query = statement.compile(dialect=engine.dialect,
+                              compile_kwargs={"literal_binds": True})
+    fmt = "binary" if binary else "csv, HEADER"
+
+    with engine.connect() as conn:
+        with conn.connection.cursor() as cur:
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT {fmt})",
+                            buf)
+
+    buf.seek(0)
+
+    return buf
+
+
+def read_dframe_copy_to(url, statement, index_col=None, dtypes=None):
+    """ Reads the results of a statement through a csv COPY ... TO STDOUT """
+    buf = copy_to(url, statement)
+
+    return pd.read_csv(buf, index_col=index_col, dtype=dtypes)
+
+
 def write_dframe_direct(dframe, url, table, if_exists="append", index=True):
     engine = init_engine(url)
     dframe.to_sql(table, engine, if_exists=if_exists, index=index)
 
 
-def write_dframe_copy_from(dframe, url, table, index=False, num_retries=3):
-    """ COPY FROM a csv is often MUCH faster than dframe.to_sql """
+def write_dframe_copy_from(dframe, url, table, index=False, num_retries=3,
+                           binary=False):
+    """
+    COPY FROM an in-memory buffer is often MUCH faster than dframe.to_sql.
+    binary=True uses the binary COPY format instead of csv.
+    """
 
     if index:
         dframe = dframe.reset_index()
 
-    temp_file = tempfile.NamedTemporaryFile()
-    local.write_dframe(dframe, temp_file.name, index=False, header=False)
-    clean_file_floats(temp_file.name)
-    columns = list(str(c) for c in dframe.columns)
+    engine = init_engine(url)
+    reflected = db_table(url, table)
 
     for i in range(num_retries):
         try:
-            copy_from_fname(temp_file.name, table, columns=columns, url=url)
+            with engine.begin() as conn:
+                copy_dframe(dframe, reflected, conn.connection, binary=binary)
             break
         except sa.exc.DatabaseError as e:
             # connection likely stale, retrying...
@@ -159,54 +309,76 @@ def write_dframe_copy_from(dframe, url, table, index=False, num_retries=3):
             pass
 
 
-def copy_from_fname(fname, table, columns=None, conn=None, url=None):
-    assert url is not None or conn is not None, "need conn or url specified"
+def copy_dframe(dframe, table, conn, binary=False):
+    """
+    COPYs a dataframe into a (reflected) table through a DBAPI connection,
+    streaming it from an in-memory buffer. The caller commits.
+    """
+    dframe = pgcopy.cast_columns(dframe, table)
+    columns = [str(c) for c in dframe.columns]
+
+    if binary:
+        buf, fmt = pgcopy.binary_buffer(dframe, table), "binary"
+    else:
+        buf, fmt = pgcopy.csv_buffer(dframe), "csv"
 
-    commit = conn is None
-    if conn is None:
-        engine = init_engine(url)
-        conn = engine.raw_connection()
+    statement = psql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT {})").format(
+                    psql.Identifier(table.name),
+                    psql.SQL(", ").join(map(psql.Identifier, columns)),
+                    psql.SQL(fmt))
 
     with conn.cursor() as cur:
-        with open(fname) as f:
-            cur.copy_from(f, table, sep=",", null="", columns=columns)
+        cur.copy_expert(statement.as_string(cur), buf)
 
-    if commit:
-        conn.commit()
-        conn.close()
 
+def write_dframes_copy_from(dframes, url, tables, index=False,
+                            returning=None, binary=False):
+    """
+    Write multiple tables as a single transaction.
 
-def write_dframes_copy_from(dframes, url, tables, index=False):
-    """ Write multiple tables as a single transaction. """
+    returning maps table names to columns that the database assigns (e.g.
+    ids). These tables are written by INSERT ... RETURNING instead, and
+    a dict of the returned column dataframes is returned. binary=True
+    uses the binary COPY format for the others.
+    """
     assert len(dframes) == len(tables)
+    returning = dict() if returning is None else returning
     engine = init_engine(url)
 
-    conn = engine.raw_connection()
-    temp_file = tempfile.NamedTemporaryFile()
-    for (dframe, table) in zip(dframes, tables):
+    returned = dict()
+    with engine.begin() as conn:
+        for (dframe, table) in zip(dframes, tables):
 
-        if index:
-            dframe = dframe.reset_index()
+            if index:
+                dframe = dframe.reset_index()
 
-        local.write_dframe(dframe, temp_file.name, index=False, header=False)
-        clean_file_floats(temp_file.name)
-        columns = list(str(c) for c in dframe.columns)
+            if table in returning:
+                returned[table] = insert_returning(
+                                      conn, dframe, db_table(url, table),
+                                      returning[table])
+                continue
 
-        copy_from_fname(temp_file.name, table, columns=columns, conn=conn)
+            copy_dframe(dframe, db_table(url, table), conn.connection,
+                        binary=binary)
 
-    conn.commit()
-    conn.close()
+    return returned if len(returning) > 0 else None
 
 
-def clean_file_floats(fname):
-    temp_file = tempfile.NamedTemporaryFile()
+def insert_returning(conn, dframe, table, columns):
+    """
+    INSERTs a dataframe into a (reflected) table within a connection and
+    returns the requested columns of the new rows as a dataframe.
+    """
+    dframe = pgcopy.cast_columns(dframe, table)
+    rows = (dframe.astype(object).where(dframe.notna(), None)
+                  .to_dict("records"))
+    if len(rows) == 0:
+        return pd.DataFrame(columns=columns)
 
-    with open(fname) as f:
-        with open(temp_file.name, "w+") as f2:
-            for line in f:
-                f2.write(line.replace(".0", ""))
+    statement = table.insert().returning(*(table.c[c] for c in columns))
+    result = conn.execute(statement, rows)
 
-    shutil.copy(temp_file.name, fname)
+    return pd.DataFrame(result.all(), columns=columns)
 
 
 def create_index(url, tablename, *colnames):
@@ -0,0 +1,119 @@
+"""
+Concurrent Object Transfers
+
+Runs many small object transfers (e.g. the continuation files pulled by
+match_contins) on a shared thread pool within the current process. The
+remote backends (gcloud, aws, fakebucket) only define how to transfer a
+single object, and use these functions for everything else.
+"""
+
+import os
+import threading
+import concurrent.futures
+
+from . import utils
+
+
+# Maximum number of concurrent transfers (see set_parallelism)
+PARALLELISM = int(os.environ.get("SYNAPTOR_IO_PARALLELISM", 16))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def set_parallelism(parallel):
+    """ Sets the maximum number of concurrent transfers """
+    global _executor, PARALLELISM
+    assert parallel > 0, "need at least one transfer thread"
+
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+        PARALLELISM = parallel
+
+
+def executor():
+    """ The shared transfer thread pool """
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                            PARALLELISM, thread_name_prefix="synaptor-io")
+
+    return _executor
+
+
+def map_transfers(fn, *iterables, check=True):
+    """
+    Applies a transfer function concurrently, returning the results in
+    order. Failed transfers return None (after printing the error) unless
+    check=True.
+    """
+    args = list(zip(*iterables))
+
+    if len(args) == 1:  # not worth the round trip through the pool
+        return [run_transfer(fn, *args[0], check=check)]
+
+    futures = [executor().submit(run_transfer, fn, *a, check=check)
+               for a in args]
+
+    return [f.result() for f in futures]
+
+
+def run_transfer(fn, *args, check=True):
+    try:
+        return fn(*args)
+    except Exception as e:
+        if check:
+            raise
+        print(f"Transfer failed: {e}")
+
+
+def pull_files(pull_file, remote_paths, check=True, local_dir=None):
+    """
+    Pulls remote objects to local_dir (default: the current directory)
+    named by their basenames. Returns the local filenames.
+    """
+    local_fnames = [os.path.basename(p) for p in remote_paths]
+    if local_dir is not None:
+        local_fnames = [os.path.join(local_dir, f) for f in local_fnames]
+
+    map_transfers(pull_file, remote_paths, local_fnames, check=check)
+
+    return local_fnames
+
+
+def pull_directory(list_paths, pull_file, remote_dir, check=True):
+    """
+    Pulls the objects under a remote "directory" to a local directory of
+    the same basename. This will currently break if the remote dir has
+    subdirectories.
+    """
+    local_dirname = os.path.basename(utils.check_no_slash(remote_dir))
+    os.makedirs(local_dirname, exist_ok=True)
+
+    return pull_files(pull_file, list_paths(remote_dir),
+                      check=check, local_dir=local_dirname)
+
+
+def send_files(send_file, local_names, remote_dir, check=True):
+    """ Sends local files to a remote "directory" """
+    remote_paths = [os.path.join(remote_dir, os.path.basename(f))
+                    for f in local_names]
+
+    map_transfers(send_file, local_names, remote_paths, check=check)
+
+
+def send_directory(send_file, local_dir, remote_dir, check=True):
+    """ Sends a local directory to a subdirectory of remote_dir """
+    remote_dir = os.path.join(
+                     remote_dir, os.path.basename(
+                                     utils.check_no_slash(local_dir)))
+
+    local_names = [os.path.join(local_dir, f)
+                   for f in sorted(os.listdir(local_dir))]
+
+    send_files(send_file, local_names, remote_dir, check=check)
@@ -1,6 +1,29 @@
 """ Utilities for Cloud Backends """
 
 
+import re
+
+
+# Kept here (instead of within each backend) to recognize paths without
+# importing the backend client libraries
+GCLOUD_REGEXP = re.compile("gs://")
+AWS_REGEXP = re.compile("s3://")
+# Pulling these from
+# https://docs.sqlalchemy.org/en/latest/core/engines.html#supported-databases
+DB_REGEXPS = [re.compile("postgresql\+psycopg2://"),
+              re.compile("postgresql://"),
+              re.compile("postgresql\+pg8000://"),
+              re.compile("mysql://"),
+              re.compile("mysql\+mysqldb://"),
+              re.compile("mysql\+mysqlconnector://"),
+              re.compile("mysql\+oursql://"),
+              re.compile("oracle://"),
+              re.compile("oracle\+cx_oracle://"),
+              re.compile("mssql\+pyodbc://"),
+              re.compile("mssql\+pymssql://"),
+              re.compile("sqlite:///")]
+
+
 def parse_remote_path(remote_path):
     """
     Parses a remote pathname into its protocol, bucket, and key. These
@@ -6,25 +6,32 @@ Nicholas Turner <nturner@cs.princeton.edu>, 2018
 
 import os
 import warnings
+import tempfile
+import contextlib
+from io import BytesIO
 
 from . import backends as bck
 from . import utils
 
 
-GCLOUD_REGEXP = bck.gcloud.REGEXP
-AWS_REGEXP = bck.aws.REGEXP
-DB_REGEXPS = bck.sqlalchemy.REGEXPS
+GCLOUD_REGEXP = bck.utils.GCLOUD_REGEXP
+AWS_REGEXP = bck.utils.AWS_REGEXP
+DB_REGEXPS = bck.utils.DB_REGEXPS
 
+# Remote files up to this size (in bytes) are read directly into memory,
+# and larger ones are spilled to a temporary local file
+SPILL_THRESHOLD = int(os.environ.get("SYNAPTOR_SPILL_THRESHOLD", 2 ** 28))
 
-def pull_file(path):
+
+def pull_file(path, local_fname=None):
     """
     Pulls a file from storage. The storage can be
-    local or remote as specified by the pathname
+    local or remote as specified by the pathname. Remote files
+    are pulled to local_fname (default: their basename)
     """
-    if GCLOUD_REGEXP.match(path):
-        return bck.gcloud.pull_file(path)
-    elif AWS_REGEXP.match(path):
-        return bck.aws.pull_file(path)
+    backend = remote_backend(path)
+    if backend is not None:
+        return backend.pull_file(path, local_fname)
     else:  # local
         return bck.local.pull_file(path)
 
@@ -39,10 +46,9 @@ def pull_files(paths, check=True):
     if len(paths) == 0:
         return list()
 
-    if GCLOUD_REGEXP.match(paths[0]):
-        return bck.gcloud.pull_files(paths, check=check)
-    elif AWS_REGEXP.match(paths[0]):
-        return bck.aws.pull_files(paths, check=check)
+    backend = remote_backend(paths[0])
+    if backend is not None:
+        return backend.pull_files(paths, check=check)
     else:  # local
         return bck.local.pull_files(paths)
 
@@ -52,14 +58,25 @@ def pull_directory(dir_path, check=True):
     Pulls a directory from storage. The storage can be
     local or remote as specified by the pathname
     """
-    if GCLOUD_REGEXP.match(dir_path):
-        return bck.gcloud.pull_directory(dir_path, check=check)
-    elif AWS_REGEXP.match(dir_path):
-        return bck.aws.pull_directory(dir_path, check=check)
+    backend = remote_backend(dir_path)
+    if backend is not None:
+        return backend.pull_directory(dir_path, check=check)
     else:  # local
         return bck.local.pull_directory(dir_path)
 
 
+def read_bytes(path, start=None, end=None):
+    """
+    Reads a file (or its bytes within [start, end)) into memory. The
+    storage can be local or remote as specified by the pathname
+    """
+    backend = remote_backend(path)
+    if backend is not None:
+        return backend.read_bytes(path, start=start, end=end)
+    else:  # local
+        return bck.local.read_bytes(path, start=start, end=end)
+
+
 def send_file(local_path, path):
     """
     Sends a local file to storage. The storage can be
@@ -68,10 +85,9 @@ def send_file(local_path, path):
     if local_path == path:
         return
 
-    if GCLOUD_REGEXP.match(path):
-        bck.gcloud.send_file(local_path, path)
-    elif AWS_REGEXP.match(path):
-        bck.aws.send_file(local_path, path)
+    backend = remote_backend(path)
+    if backend is not None:
+        backend.send_file(local_path, path)
     else:
         warnings.warn(f"Pathname {path} doesn't match remote pattern",
                       Warning)
@@ -86,10 +102,9 @@ def send_files(local_paths, dst_dir):
     if len(local_paths) == 0:
         return
 
-    if GCLOUD_REGEXP.match(dst_dir):
-        bck.gcloud.send_files(local_paths, dst_dir)
-    elif AWS_REGEXP.match(dst_dir):
-        bck.aws.send_files(local_paths, dst_dir)
+    backend = remote_backend(dst_dir)
+    if backend is not None:
+        backend.send_files(local_paths, dst_dir)
     else:
         warnings.warn(f"Pathname {dst_dir} doesn't match remote pattern",
                       Warning)
@@ -104,32 +119,158 @@ def send_directory(local_dir, path):
     if local_dir == path:
         return
 
-    if GCLOUD_REGEXP.match(path):
-        bck.gcloud.send_directory(local_dir, path)
-    elif AWS_REGEXP.match(path):
-        bck.aws.send_directory(local_dir, path)
+    backend = remote_backend(path)
+    if backend is not None:
+        backend.send_directory(local_dir, path)
     else:
         warnings.warn("Pathname {} doesn't match remote pattern".format(path),
                       Warning)
         bck.local.send_directory(local_dir, path)
 
 
-def read_dframe(path_or_head, basename=None, chunksize=None):
+def write_bytes(data, path):
+    """
+    Writes bytes from memory to storage. The storage can be
+    local or remote as specified by the pathname
+    """
+    backend = remote_backend(path)
+    if backend is not None:
+        backend.write_bytes(data, path)
+    else:  # local
+        bck.local.write_bytes(data, path)
+
+
+def fetch(path):
+    """
+    Fetches a file for reading. Returns the path itself for local files,
+    a BytesIO for remote files up to SPILL_THRESHOLD bytes, and the path
+    of a (uniquely named) temporary copy for larger remote files.
+    """
+    if not is_remote_path(path):
+        return path
+
+    # A single request for files under the threshold
+    data = read_bytes(path, start=0, end=SPILL_THRESHOLD + 1)
+    if len(data) <= SPILL_THRESHOLD:
+        return BytesIO(data)
+
+    spill_fname = os.path.join(tempfile.gettempdir(), utils.temp_path(path))
+    try:
+        spill_file(path, data, spill_fname)
+    except BaseException:
+        if os.path.exists(spill_fname):
+            os.remove(spill_fname)
+        raise
+
+    return spill_fname
+
+
+def spill_file(path, head, spill_fname):
+    """
+    Writes a remote file to spill_fname, starting with the bytes already
+    read from its head. The rest is read in ranges of SPILL_THRESHOLD
+    bytes, so each byte is only downloaded once.
+    """
+    size = remote_backend(path).object_size(path)
+
+    with open(spill_fname, "wb") as f:
+        f.write(head)
+
+        start = len(head)
+        while start < size:
+            end = min(start + SPILL_THRESHOLD, size)
+            f.write(read_bytes(path, start=start, end=end))
+            start = end
+
+
+@contextlib.contextmanager
+def fetched(path):
+    """ fetch() as a context, which removes any spilled copy afterwards """
+    with fetched_files([path]) as sources:
+        yield sources[0]
+
+
+@contextlib.contextmanager
+def fetched_files(paths):
+    """
+    Fetches multiple files concurrently (see fetch) as a context, which
+    removes any spilled copies afterwards.
+    """
+    sources = bck.transfer.map_transfers(fetch, paths)
+    try:
+        yield sources
+
+    finally:
+        for (path, source) in zip(paths, sources):
+            if isinstance(source, str) and source != path:
+                os.remove(source)
+
+
+def upload(write_fn, path):
+    """
+    Writes to a path through write_fn(dst), where dst is the path itself
+    for local files and a BytesIO that is uploaded for remote files.
+    """
+    if not is_remote_path(path):
+        write_fn(path)
+        return
+
+    buf = BytesIO()
+    write_fn(buf)
+    write_bytes(buf.getbuffer(), path)
+
+
+def read_dframe(path_or_head, basename=None, chunksize=None,
+                columns=None, filters=None):
     """
     Reads a dataframe - path can specify remote
-    storage in Google Cloud or AWS S3
+    storage in Google Cloud or AWS S3. The file format is picked
+    by extension (csv by default), and columns and row filters are
+    passed along to the local backend.
+
+    With a chunksize, this returns a context-managed reader of row
+    chunks. Remote files are fetched when this is called, and any
+    spilled local copy is removed when the reader is closed.
     """
     if basename is not None:
         path = os.path.join(path_or_head, basename)
     else:
         path = path_or_head
 
-    if is_remote_path(path):
-        local_fname = pull_file(path)
-    else:
-        local_fname = path
+    if chunksize is None:
+        with fetched(path) as source:
+            return bck.local.read_dframe(source, columns=columns,
+                                         filters=filters, fname=path)
+
+    # the chunks are read lazily, so any spilled copy is kept until the
+    # returned reader is closed
+    with contextlib.ExitStack() as stack:
+        source = stack.enter_context(fetched(path))
+        reader = stack.enter_context(
+                     bck.local.read_dframe(source, chunksize=chunksize,
+                                           columns=columns, filters=filters,
+                                           fname=path))
+
+        chunks = read_chunks(reader, stack.pop_all())
+
+    return contextlib.closing(chunks)
 
-    return bck.local.read_dframe(local_fname, chunksize=chunksize)
+
+def read_chunks(reader, stack):
+    """
+    Yields the chunks of a dataframe reader, and closes stack (an ExitStack)
+    once they're read or the generator is closed. The generator is started
+    before it's returned, so closing it early also closes stack.
+    """
+    def chunks():
+        with stack:
+            yield
+            yield from reader
+
+    generator = chunks()
+    next(generator)
+
+    return generator
 
 
 def write_dframe(dframe, path_or_head, basename=None):
@@ -142,15 +283,8 @@ def write_dframe(dframe, path_or_head, basename=None):
     else:
         path = path_or_head
 
-    if is_remote_path(path):
-        local_fname = utils.temp_path(path)
-    else:
-        local_fname = path
-
-    bck.local.write_dframe(dframe, local_fname)
-
-    if is_remote_path(path):
-        send_file(local_fname, path)
+    upload(lambda dst: bck.local.write_dframe(dframe, dst, fname=path),
+           path)
 
 
 def read_edge_csv(path_or_head, basename=None,
@@ -166,13 +300,9 @@ def read_edge_csv(path_or_head, basename=None,
     else:
         path = path_or_head
 
-    if is_remote_path(path):
-        local_fname = pull_file(path)
-    else:
-        local_fname = path
-
-    return bck.local.read_edge_csv(local_fname, delim=delim,
-                                   only_confident=only_confident)
+    with fetched(path) as source:
+        return bck.local.read_edge_csv(source, delim=delim,
+                                       only_confident=only_confident)
 
 
 def write_edge_csv(edges, path_or_head, basename=None, delim=";"):
@@ -187,21 +317,15 @@ def write_edge_csv(edges, path_or_head, basename=None, delim=";"):
     else:
         path = path_or_head
 
-    if is_remote_path(path):
-        local_fname = utils.temp_path(path)
-    else:
-        local_fname = path
-
-    bck.local.write_edge_csv(edges, local_fname, delim=delim)
-
-    if is_remote_path(path):
-        send_file(local_fname, path)
+    upload(lambda dst: bck.local.write_edge_csv(edges, dst, delim=delim),
+           path)
 
 
-def read_network(net_fname, chkpt_fname):
+def read_network(net_fname, chkpt_fname, device=None):
     """
     Reads a saved Torch network - paths can specify remote
-    storage in Google Cloud or AWS S3
+    storage in Google Cloud or AWS S3. The network is loaded onto
+    device (default: CUDA if available, otherwise the CPU)
     """
     if is_remote_path(net_fname):
         net_fname = pull_file(net_fname)
@@ -209,7 +333,7 @@ def read_network(net_fname, chkpt_fname):
     if is_remote_path(chkpt_fname):
         chkpt_fname = pull_file(chkpt_fname)
 
-    return bck.local.read_network(net_fname, chkpt_fname)
+    return bck.local.read_network(net_fname, chkpt_fname, device=device)
 
 
 def write_network(net, prefix_or_head, basename=None):
@@ -262,12 +386,8 @@ def read_h5(path_or_head, basename=None):
     else:
         path = path_or_head
 
-    if is_remote_path(path):
-        local_fname = pull_file(path)
-    else:
-        local_fname = path
-
-    return bck.local.read_h5(local_fname)
+    with fetched(path) as source:
+        return bck.local.read_h5(source)
 
 
 def write_h5(data, path_or_head, basename=None, chunk_size=None):
@@ -280,23 +400,46 @@ def write_h5(data, path_or_head, basename=None, chunk_size=None):
     else:
         path = path_or_head
 
-    if is_remote_path(path):
-        local_fname = utils.temp_path(path)
-    else:
-        local_fname = path
+    upload(lambda dst: bck.local.write_h5(data, dst, chunk_size=chunk_size),
+           path)
 
-    bck.local.write_h5(data, local_fname, chunk_size=chunk_size)
 
-    if is_remote_path(path):
-        send_file(local_fname, path)
+# Defining db versions of a few functions
+# (wrapped so that sqlalchemy is only imported when these are called)
+def read_db_dframe(*args, **kwargs):
+    return bck.sqlalchemy.read_dframe(*args, **kwargs)
 
 
-# Defining db versions of a few functions
-read_db_dframe = bck.sqlalchemy.read_dframe
-write_db_dframe = bck.sqlalchemy.write_dframe_copy_from
-read_db_dframes = bck.sqlalchemy.read_dframes
-write_db_dframes = bck.sqlalchemy.write_dframes_copy_from
-create_index = bck.sqlalchemy.create_index
+def write_db_dframe(*args, **kwargs):
+    return bck.sqlalchemy.write_dframe_copy_from(*args, **kwargs)
+
+
+def read_db_dframes(*args, **kwargs):
+    return bck.sqlalchemy.read_dframes(*args, **kwargs)
+
+
+def write_db_dframes(*args, **kwargs):
+    return bck.sqlalchemy.write_dframes_copy_from(*args, **kwargs)
+
+
+def iter_db_dframes(*args, **kwargs):
+    return bck.sqlalchemy.iter_dframes(*args, **kwargs)
+
+
+def iter_db_groups(*args, **kwargs):
+    return bck.sqlalchemy.iter_groups(*args, **kwargs)
+
+
+def iter_db_arrays(*args, **kwargs):
+    return bck.sqlalchemy.iter_arrays(*args, **kwargs)
+
+
+def read_db_dframe_copy(*args, **kwargs):
+    return bck.sqlalchemy.read_dframe_copy_to(*args, **kwargs)
+
+
+def create_index(*args, **kwargs):
+    return bck.sqlalchemy.create_index(*args, **kwargs)
 
 
 def is_remote_path(uri):
@@ -304,5 +447,20 @@ def is_remote_path(uri):
     return GCLOUD_REGEXP.match(uri) or AWS_REGEXP.match(uri)
 
 
+def remote_backend(uri):
+    """
+    The backend module for a remote uri (None for local paths). Remote
+    uris map to the fake bucket backend when it's enabled.
+    """
+    if not is_remote_path(uri):
+        return None
+    elif bck.fakebucket.ROOT is not None:
+        return bck.fakebucket
+    elif GCLOUD_REGEXP.match(uri):
+        return bck.gcloud
+    else:
+        return bck.aws
+
+
 def is_db_url(uri):
     return any(regexp.match(uri) for regexp in DB_REGEXPS)
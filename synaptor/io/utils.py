@@ -12,8 +12,8 @@ from .. import bbox
 from . import backends as bck
 
 
-AWS_REGEXP = bck.aws.REGEXP
-GCLOUD_REGEXP = bck.gcloud.REGEXP
+AWS_REGEXP = bck.utils.AWS_REGEXP
+GCLOUD_REGEXP = bck.utils.GCLOUD_REGEXP
 BBOX_REGEXP = re.compile("-?[0-9]+_-?[0-9]+_-?[0-9]+--?[0-9]+_-?[0-9]+_-?[0-9]+")
 SPLIT_REGEXP = re.compile("[0-9]--?[0-9]")
 STORAGESTR_FILENAME = "/root/storagestr"
@@ -0,0 +1,58 @@
+"""
+Lazy Submodule Loading
+
+Packages whose submodules pull in heavy dependencies (torch, cloudvolume,
+cloud storage clients, sqlalchemy, ...) declare their submodules and
+re-exported names with attach(). Each submodule is then imported on first
+attribute access (PEP 562) instead of when the package is imported, so
+scripts only pay for the dependencies they use.
+"""
+
+
+import sys
+import importlib
+
+
+def attach(package, submodules=(), attributes=None, aliases=None):
+    """
+    Creates the module-level __getattr__, __dir__ and __all__ for a package.
+
+    Args:
+        package (str): The package name (i.e. __name__).
+        submodules (list): Submodules to import on access.
+        attributes (dict): Maps each (relative, possibly dotted) submodule
+            name to a list of names re-exported from it.
+        aliases (dict): Maps alternative names to submodules.
+
+    Returns:
+        function: __getattr__ for the package.
+        function: __dir__ for the package.
+        list: __all__ for the package.
+    """
+    attributes = dict() if attributes is None else attributes
+    aliases = dict() if aliases is None else aliases
+
+    submodules = set(submodules)
+    attr_to_module = {name: module for (module, names) in attributes.items()
+                      for name in names}
+
+    def __getattr__(name):
+        if name in submodules:
+            return importlib.import_module(f"{package}.{name}")
+
+        elif name in aliases:
+            return importlib.import_module(f"{package}.{aliases[name]}")
+
+        elif name in attr_to_module:
+            module = importlib.import_module(
+                         f"{package}.{attr_to_module[name]}")
+            return getattr(module, name)
+
+        raise AttributeError(f"module {package!r} has no attribute {name!r}")
+
+    __all__ = sorted(submodules | set(aliases) | set(attr_to_module))
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[package])) | set(__all__))
+
+    return __getattr__, __dir__, __all__
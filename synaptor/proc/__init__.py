@@ -1,19 +1,12 @@
-from . import seg
-from . import edge
-from . import overlap
-from . import candidate
-from . import anchor
-from . import norm
+from .. import lazy
 
-from . import tasks
-from .tasks import cc_task
-from .tasks import merge_ccs_task
-from .tasks import edge_task
-from .tasks import merge_edges_task
-from .tasks import remap_ids_task
-from .tasks import overlap_task
 
-from . import io
-from . import utils
-
-from . import tasks_w_io
+# Submodules are imported on first use (see synaptor/lazy.py)
+__getattr__, __dir__, __all__ = lazy.attach(
+    __name__,
+    submodules=["seg", "edge", "overlap", "candidate", "anchor", "norm",
+                "tasks", "io", "utils", "tasks_w_io",
+                "colnames", "hashing", "repr"],
+    attributes={
+        "tasks": ["cc_task", "merge_ccs_task", "edge_task",
+                  "merge_edges_task", "remap_ids_task", "overlap_task"]})
@@ -91,3 +91,14 @@ postsyn_basin = "postsyn_basin"
 basin_cols = [presyn_basin, postsyn_basin]
 
 partnerhash = "partnerhash"
+
+# Summed network outputs within each segment close to a cleft
+# (see edge/weights.py)
+wt_segid = "segid"
+presyn_wt_sum = "presyn_wt_sum"
+postsyn_wt_sum = "postsyn_wt_sum"
+wt_seg_sz = "seg_sz"
+wt_seg_x = "seg_x"
+wt_seg_y = "seg_y"
+wt_seg_z = "seg_z"
+wt_seg_coord_cols = [wt_seg_x, wt_seg_y, wt_seg_z]
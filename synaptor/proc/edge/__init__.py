@@ -1,17 +1,16 @@
-from . import asynet
-from .asynet import infer_edges
+from ... import lazy
 
-from . import pruner
-from .pruner import prune_candidates, max_candidates
 
-from . import locs
-
-from . import assign
-
-from . import score
-
-from . import misc
-from .misc import add_cleft_sizes, add_cleft_locs
-from .misc import upsample_edge_info
-
-from . import merge
+# Submodules are imported on first use (see synaptor/lazy.py),
+# since most of them need torch
+__getattr__, __dir__, __all__ = lazy.attach(
+    __name__,
+    submodules=["asynet", "device", "dilation", "inference", "pruner",
+                "locs", "patches", "assign", "weights", "score", "misc",
+                "merge"],
+    attributes={
+        "asynet": ["infer_edges"],
+        "inference": ["BatchedInference"],
+        "pruner": ["prune_candidates", "max_candidates"],
+        "misc": ["add_cleft_sizes", "add_cleft_locs",
+                 "upsample_edge_info"]})
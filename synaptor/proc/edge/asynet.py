@@ -4,20 +4,23 @@
 import random
 import copy
 import operator
-import itertools
 
 import torch
 
 import numpy as np
-import scipy.ndimage as ndimage
 import pandas as pd
 
 from ...types import bbox
 from ... import seg_utils
 from .. import colnames as cn
 from . import locs
+from . import dilation
+from . import patches
 from . import score
 from . import assign
+from . import weights
+from .inference import BatchedInference, DEFAULT_BATCH_SIZE
+from . import device as dev
 
 
 RECORD_SCHEMA = [cn.seg_id, cn.presyn_id, cn.postsyn_id,
@@ -31,11 +34,18 @@ def infer_edges(net, img, cleft, seg, patchsz, root_seg=None, offset=(0, 0, 0),
                 cleft_ids=None, dil_param=5, loc_type="centroid",
                 samples_per_cleft=None, score_type="avg", alpha=1,
                 pre_type=None, post_type=None, assign_type="max",
-                thresh=None, thresh2=None):
+                thresh=None, thresh2=None,
+                batch_size=DEFAULT_BATCH_SIZE, device=None,
+                precision="fp32", cached_weights=None, return_weights=False):
     """
     Runs a trained network over the synaptic clefts within the dataset
     and infers the synaptic partners involved at each synapse
 
+    cached_weights can pass the summed network outputs for some clefts
+    from a previous run (see weights.py), which skips inference for
+    those clefts. return_weights=True also returns the weights for
+    every cleft.
+
     Returns a DataFrame mapping synaptic cleft segment id to a tuple of
     synaptic partners (presynaptic,postsynaptic)
     """
@@ -43,45 +53,47 @@ def infer_edges(net, img, cleft, seg, patchsz, root_seg=None, offset=(0, 0, 0),
     if cleft_ids is None:
         cleft_ids = seg_utils.nonzero_unique_ids(cleft)
 
-    cleft_locs = locs.pick_cleft_locs(cleft, cleft_ids, loc_type,
-                                      samples_per_cleft, patchsz)
+    if cached_weights is not None:
+        to_infer = [cid for cid in cleft_ids if cid not in cached_weights[0]]
+    else:
+        to_infer = cleft_ids
+
+    if len(to_infer) > 0:
+        cleft_locs = locs.pick_cleft_locs(cleft, to_infer, loc_type,
+                                          samples_per_cleft, patchsz)
+    else:
+        cleft_locs = dict()
 
     # whether or not we should record watershed ids
     record_basins = root_seg is not None
 
-    edges = []  # list of dict records
-    for (cid, cid_locs) in cleft_locs.items():
-
-        wt_sums = dict()
-        wt_avgs = dict()
-        seg_szs = dict()
-        seg_locs = dict()
-        for loc in cid_locs:
-            box = bbox.containing_box(loc, patchsz, cleft.shape)
-            box_offset = box.min() + offset
+    all_weights = infer_cleft_weights(net, img, cleft, seg,
+                                      cleft_locs, patchsz,
+                                      dil_param=dil_param,
+                                      offset=offset,
+                                      batch_size=batch_size,
+                                      device=device,
+                                      precision=precision,
+                                      verbose=True)
 
-            img_p, clf_p, seg_p = get_patches(img, cleft, seg, box, cid)
-
-            segids = find_close_segments(clf_p, seg_p, dil_param)
-            if len(segids) == 0:
-                print(f"skipping {cid}, no close segments")
-                continue
+    if cached_weights is not None:
+        all_weights = weights.merge_weights(cached_weights, all_weights)
 
-            new_weights, new_szs = infer_patch_weights(net, img_p, clf_p,
-                                                       seg_p, segids)
+    cleft_sums, cleft_szs, cleft_seg_locs = all_weights
 
-            wt_sums = dict_tuple_sum(new_weights, wt_sums)
-            seg_szs = dict_sum(seg_szs, new_szs)
-            wt_avgs = update_avgs(wt_sums, seg_szs)
+    edges = []  # list of dict records
+    for cid in cleft_ids:
 
-            new_locs = random_locs(seg_p[0, 0, :].transpose((2, 1, 0)),
-                                   segids, offset=box_offset)
-            seg_locs = update_locs(new_locs, seg_locs)
+        wt_sums = cleft_sums[cid]
+        seg_szs = cleft_szs[cid]
+        seg_locs = cleft_seg_locs[cid]
 
         if len(wt_sums) == 0:  # hallucinated synapse - or no segmentation
             print(f"skipping {cid}, no segs")
             continue
 
+        wt_avgs = update_avgs(wt_sums, seg_szs)
+
         pre_scores, post_scores = score.compute_scores(wt_avgs, wt_sums,
                                                        seg_szs, alpha=alpha,
                                                        pre_type=pre_type,
@@ -111,13 +123,20 @@ def infer_edges(net, img, cleft, seg, patchsz, root_seg=None, offset=(0, 0, 0),
                                          pre_w, post_w,
                                          pre_sz, post_sz))
 
-    return make_record_dframe(edges, record_basins)
+    edges = make_record_dframe(edges, record_basins)
+
+    if return_weights:
+        return edges, all_weights
+    else:
+        return edges
 
 
 def infer_all_weights(net, img, cleft, seg, patchsz, offset=(0, 0, 0),
                       cleft_ids=None, dil_param=5, loc_type="centroid",
                       samples_per_cleft=None, alpha=1,
-                      return_sums=False, return_szs=False):
+                      return_sums=False, return_szs=False,
+                      batch_size=DEFAULT_BATCH_SIZE, device=None,
+                      precision="fp32"):
 
     """
     """
@@ -127,33 +146,24 @@ def infer_all_weights(net, img, cleft, seg, patchsz, offset=(0, 0, 0),
     cleft_locs = locs.pick_cleft_locs(cleft, cleft_ids, loc_type,
                                       samples_per_cleft, patchsz)
 
+    all_sums, all_szs, _ = infer_cleft_weights(net, img, cleft, seg,
+                                               cleft_locs, patchsz,
+                                               dil_param=dil_param,
+                                               batch_size=batch_size,
+                                               device=device,
+                                               precision=precision)
+
     cleft_avgs = dict()
     cleft_sums = dict()
     cleft_szs = dict()
-    for (cid, cid_locs) in cleft_locs.items():
-
-        wt_sums = dict()
-        wt_avgs = dict()
-        seg_szs = dict()
-        for loc in cid_locs:
-            box = bbox.containing_box(loc, patchsz, cleft.shape)
-
-            img_p, clf_p, seg_p = get_patches(img, cleft, seg, box, cid)
-
-            segids = find_close_segments(clf_p, seg_p, dil_param)
-            if len(segids) == 0:
-                continue
+    for cid in cleft_locs.keys():
 
-            new_weights, new_szs = infer_patch_weights(net, img_p, clf_p,
-                                                       seg_p, segids)
-            wt_sums = dict_tuple_sum(new_weights, wt_sums)
-            seg_szs = dict_sum(seg_szs, new_szs)
-            wt_avgs = update_avgs(wt_sums, seg_szs)
+        wt_sums, seg_szs = all_sums[cid], all_szs[cid]
 
         if len(wt_sums) == 0:  # hallucinated synapse - or no segmentation
             continue
 
-        cleft_avgs[cid] = wt_avgs
+        cleft_avgs[cid] = update_avgs(wt_sums, seg_szs)
         cleft_sums[cid] = wt_sums
         cleft_szs[cid] = seg_szs
 
@@ -171,6 +181,65 @@ def infer_all_weights(net, img, cleft, seg, patchsz, offset=(0, 0, 0),
         return return_val
 
 
+def infer_cleft_weights(net, img, cleft, seg, cleft_locs, patchsz,
+                        dil_param=5, offset=None,
+                        batch_size=DEFAULT_BATCH_SIZE, device=None,
+                        precision="fp32", verbose=False):
+    """
+    Runs the network over a patch around each sampled location of each
+    cleft, batching patches across clefts.
+
+    Returns the summed weights and sizes of the segments close to each
+    cleft as dicts (cleft id -> seg id -> value). Also returns a random
+    location within each segment when offset is given (and empty dicts
+    otherwise).
+    """
+    wt_sums = {cid: dict() for cid in cleft_locs.keys()}
+    seg_szs = {cid: dict() for cid in cleft_locs.keys()}
+    seg_locs = {cid: dict() for cid in cleft_locs.keys()}
+
+    def accumulator(cid, seg_p, segids):
+        def accumulate(output):
+            new_weights, new_szs = seg_weights(output, seg_p, segids)
+            wt_sums[cid] = dict_tuple_sum(new_weights, wt_sums[cid])
+            seg_szs[cid] = dict_sum(seg_szs[cid], new_szs)
+
+        return accumulate
+
+    with make_engine(net, batch_size, device, precision) as engine:
+        for (cid, box) in locs.plan_patches(cleft_locs, patchsz, cleft.shape):
+            net_input, seg_p = fill_net_input(engine, img, cleft, seg,
+                                              box, cid)
+
+            segids = find_close_segments(net_input[:, 1:], seg_p, dil_param,
+                                         device=engine.device)
+            if len(segids) == 0:
+                if verbose:
+                    print(f"skipping {cid}, no close segments")
+                continue
+
+            engine.add(net_input, accumulator(cid, seg_p, segids))
+
+            if offset is not None:
+                new_locs = random_locs(seg[box.index()], segids,
+                                       offset=box.min() + offset)
+                seg_locs[cid] = update_locs(new_locs, seg_locs[cid])
+
+    return wt_sums, seg_szs, seg_locs
+
+
+def make_engine(net, batch_size=DEFAULT_BATCH_SIZE, device=None,
+                precision="fp32"):
+    """ Creates a batched inference engine for an assignment network """
+    return BatchedInference(net, batch_size=batch_size, device=device,
+                            postproc=format_output, precision=precision)
+
+
+def format_output(output):
+    """ Takes the (only) output of the network, and applies a sigmoid """
+    return torch.sigmoid(output[0])
+
+
 def infer_single_patch(net, img, cleft, seg, patchsz,
                        loc=None, cleft_id=None):
 
@@ -181,7 +250,7 @@ def infer_single_patch(net, img, cleft, seg, patchsz,
 
     cleft_id = cleft[loc] if cleft_id is None else cleft_id
 
-    box = containing_box(patchsz, cleft, loc)
+    box = bbox.containing_box(loc, patchsz, cleft.shape)
 
     img_p, clf_p, seg_p = get_patches(img, cleft, seg, box, cleft_id)
 
@@ -192,7 +261,9 @@ def infer_single_patch(net, img, cleft, seg, patchsz,
 
 def infer_whole_edges(net, img, cleft, seg,
                       patchsz, dil_param=5,
-                      cleft_ids=None, bboxes=None):
+                      cleft_ids=None, bboxes=None,
+                      batch_size=DEFAULT_BATCH_SIZE, device=None,
+                      precision="fp32"):
 
     if cleft_ids is None:
         cleft_ids = seg_utils.nonzero_unique_ids(cleft)
@@ -200,52 +271,76 @@ def infer_whole_edges(net, img, cleft, seg,
     if bboxes is None:
         bboxes = seg_utils.bounding_boxes(cleft)
 
-    all_weights = {}
-
-    for (iter_i, i) in enumerate(cleft_ids):
-        weights, _ = infer_whole_edge(net, img, cleft, seg,
-                                      i, patchsz, dil_param,
-                                      bboxes)
+    all_weights = {i: dict() for i in cleft_ids}
+    all_szs = {i: dict() for i in cleft_ids}
 
-        all_weights[i] = weights
+    with make_engine(net, batch_size, device, precision) as engine:
+        for i in cleft_ids:
+            add_whole_edge(engine, img, cleft, seg, i, patchsz,
+                           all_weights, all_szs, dil_param, bboxes)
 
     return all_weights
 
 
 def infer_whole_edge(net, img, cleft, seg, cleft_id,
-                     patchsz, dil_param=5, cleft_boxes=None):
+                     patchsz, dil_param=5, cleft_boxes=None,
+                     batch_size=DEFAULT_BATCH_SIZE, device=None,
+                     precision="fp32"):
 
-    bboxes = pick_cleft_bboxes(cleft, cleft_id, patchsz, cleft_boxes)
+    all_weights, all_szs = {cleft_id: dict()}, {cleft_id: dict()}
 
-    seg_weights, seg_szs = {}, {}
-    for box in bboxes:
-        img_p, clf_p, seg_p = get_patches(img, cleft, seg, box, cleft_id)
+    with make_engine(net, batch_size, device, precision) as engine:
+        add_whole_edge(engine, img, cleft, seg, cleft_id, patchsz,
+                       all_weights, all_szs, dil_param, cleft_boxes)
+
+    return all_weights[cleft_id], all_szs[cleft_id]
 
-        segids = find_close_segments(clf_p, seg_p, dil_param)
 
-        new_weights, new_szs = infer_patch_weights(net, img_p, clf_p,
-                                                   seg_p, segids)
-        seg_weights, seg_szs = dict_tuple_avg(new_weights, new_szs,
-                                              seg_weights, seg_szs)
+def add_whole_edge(engine, img, cleft, seg, cleft_id, patchsz,
+                   all_weights, all_szs, dil_param=5, cleft_boxes=None):
+    """
+    Adds the patches covering a cleft to an inference engine. The averaged
+    weights and sizes are stored in all_weights[cleft_id] and
+    all_szs[cleft_id] as the batches run.
+    """
+    bboxes = pick_cleft_bboxes(cleft, cleft_id, patchsz, cleft_boxes)
 
-    return seg_weights, seg_szs
+    def accumulator(seg_p, segids):
+        def accumulate(output):
+            new_weights, new_szs = seg_weights(output, seg_p, segids)
+            weights, szs = dict_tuple_avg(new_weights, new_szs,
+                                          all_weights[cleft_id],
+                                          all_szs[cleft_id])
+            all_weights[cleft_id], all_szs[cleft_id] = weights, szs
 
+        return accumulate
 
-def pick_cleft_bboxes(cleft, cleft_id, patchsz, cleft_boxes):
+    for box in bboxes:
+        net_input, seg_p = fill_net_input(engine, img, cleft, seg,
+                                          box, cleft_id)
 
-    cleft_mask = cleft == cleft_id
-    bboxes = []
+        segids = find_close_segments(net_input[:, 1:], seg_p, dil_param,
+                                     device=engine.device)
+        if len(segids) == 0:
+            continue
 
-    while cleft_mask.max():
-        locs = list(zip(*np.nonzero(cleft_mask)))
+        engine.add(net_input, accumulator(seg_p, segids))
 
-        loc = random.choice(locs)
-        box = containing_box(patchsz, cleft_mask, loc)
-        bboxes.append(box)
 
-        cleft_mask[box.index()] = False
+def pick_cleft_bboxes(cleft, cleft_id, patchsz, cleft_boxes=None):
+    """
+    Picks patch boxes which cover a cleft. Only searches within the
+    cleft's bounding box when cleft_boxes (id -> bbox) is passed.
+    """
+    if cleft_boxes is not None:
+        cleft_box = cleft_boxes[cleft_id]
+        voxels = (np.argwhere(cleft[cleft_box.index()] == cleft_id)
+                  + tuple(cleft_box.min()))
+    else:
+        voxels = np.argwhere(cleft == cleft_id)
 
-    return bboxes
+    return [box for (_, box) in
+            locs.covering_boxes(voxels, patchsz, cleft.shape)]
 
 
 def random_loc(seg, i, offset=(0, 0, 0)):
@@ -287,43 +382,27 @@ def get_patches(img, psd, seg, box, psdid):
     return img_p, psd_p, seg_p
 
 
-def find_close_segments(psd_p, seg_p, dil_param):
-
-    kernel = make_dilation_kernel(dil_param).astype("float32")
-    psd_mask = torch_dilation(psd_p, kernel, dil_param)
-
-    return seg_utils.nonzero_unique_ids(seg_p[psd_mask])
-
-
-def torch_dilation(seg, kernel, dil_param):
-
-    seg_v = to_tensor(seg, volatile=True)
-    ker_v = to_tensor(kernel, volatile=True)
-    sz = kernel.shape
-    padding = (sz[2]//2, sz[3]//2, sz[4]//2)
-
-    output = torch.nn.functional.conv3d(seg_v, ker_v, padding=padding)
-
-    return output.data.cpu().numpy().astype("bool")
+def fill_net_input(engine, img, cleft, seg, box, cleft_id):
+    """
+    Writes the network input for a patch directly into the engine's
+    input buffer. Also returns a (transposed) view of the seg patch.
+    """
+    net_input = engine.input_buffer(patches.input_shape(box, 2))
 
+    patches.fill_image(net_input[:, 0:1], img, box)
+    patches.fill_mask(net_input[:, 1:2], cleft, box, cleft_id)
 
-def make_dilation_kernel(dil_param):
+    return net_input, patches.transposed_view(seg, box)
 
-    kernel = ndimage.generate_binary_structure(2, 1)
-    kernel = ndimage.iterate_structure(kernel, dil_param)
-    z_component = np.zeros(kernel.shape, dtype=kernel.dtype)
 
-    width = kernel.shape[-1]
-    mid = width//2
+def find_close_segments(psd_p, seg_p, dil_param, device=None):
 
-    z_component[mid, mid] = 1
-    # kernel = np.stack((z_component,kernel,z_component),axis=0)
-    kernel = np.stack((kernel, kernel, kernel), axis=0)
+    psd_mask = dilation.dilate(psd_p, dil_param, device=device)
 
-    return kernel.reshape((1, 1, 3, width, width))
+    return seg_utils.nonzero_unique_ids(seg_p[psd_mask])
 
 
-def infer_patch(net, img_p, psd_p):
+def infer_patch(net, img_p, psd_p, device=None):
     """
     Runs an assignment network over a single patch, and returns
     the weights over each segment within the passed segmentation patch
@@ -332,8 +411,8 @@ def infer_patch(net, img_p, psd_p):
     """
     with torch.no_grad():
         # formatting
-        net_input = np.concatenate((img_p, psd_p), axis=1).astype("float32")
-        net_input = to_tensor(net_input, volatile=True)
+        net_input = to_tensor(make_net_input(img_p, psd_p), volatile=True,
+                              device=device)
 
         # network has only one output
         # and batch size = 1
@@ -342,38 +421,72 @@ def infer_patch(net, img_p, psd_p):
     return output
 
 
+def make_net_input(img_p, psd_p):
+    return np.concatenate((img_p, psd_p), axis=1).astype("float32")
+
+
 def seg_weights(output, seg, segids=None):
     """
     Finds the sum over the pre and post synaptic weights
     contained in each segment of seg
 
-    output should be a torch.cuda Tensor, and
+    output should be a torch Tensor, and
     seg should be a numpy array
     """
 
     if segids is None:
         segids = seg_utils.nonzero_unique_ids(seg)
 
-    weights = {}
-    sizes = {}
+    segids = list(segids)
+    if len(segids) == 0:
+        return {}, {}
+
+    weight_arr, size_arr = seg_weight_arrays(output, seg, segids)
 
-    presyn_output = output[0, ...]
-    postsyn_output = output[1, ...]
+    weights = {i: tuple(wts) for (i, wts) in zip(segids, weight_arr.tolist())}
+    sizes = dict(zip(segids, size_arr.tolist()))
 
-    for i in segids:
+    return weights, sizes
 
-        seg_mask = torch.from_numpy(
-                       (seg == i).astype("bool")).cuda()[0, 0, ...]
-        sizes[i] = torch.sum(seg_mask).item()
 
-        # pre_avg  = torch.sum(presyn_output[seg_mask]).item() / sizes[i]
-        # post_avg = torch.sum(postsyn_output[seg_mask]).item() / sizes[i]
-        pre_wt = torch.sum(presyn_output[seg_mask]).item()
-        post_wt = torch.sum(postsyn_output[seg_mask]).item()
+def seg_weight_arrays(output, seg, segids):
+    """
+    Sums the pre and post synaptic weights within each segment of segids
+    in one pass by relabeling seg to dense indices (0 to len(segids)-1)
+    and scattering the output into those bins on the output's device.
 
-        weights[i] = (pre_wt, post_wt)
+    Returns a (len(segids), 2) array of (pre, post) weight sums, and an
+    array of segment sizes, both ordered like segids.
+    """
+    num_segs = len(segids)
+    labels = dense_labels(seg[0, 0, ...], segids)
+    labels = torch.from_numpy(labels).to(output.device).reshape(-1)
 
-    return weights, sizes
+    # voxels outside of segids fall in the last bin, which is dropped
+    sizes = torch.bincount(labels, minlength=num_segs + 1)
+
+    flat_output = output[:2, ...].reshape(2, -1)
+    sums = torch.zeros((2, num_segs + 1),
+                       dtype=flat_output.dtype, device=output.device)
+    sums.scatter_add_(1, labels.expand(2, -1), flat_output)
+
+    return sums[:, :num_segs].t().cpu().numpy(), sizes[:num_segs].cpu().numpy()
+
+
+def dense_labels(seg, segids):
+    """
+    Relabels seg so that each segid maps to its index within segids, and
+    every other voxel maps to len(segids)
+    """
+    segids = np.asarray(segids, dtype=seg.dtype)
+    order = np.argsort(segids, kind="stable")
+    sorted_ids = segids[order]
+
+    inds = np.searchsorted(sorted_ids, seg)
+    inds[inds == len(sorted_ids)] = 0
+    found = sorted_ids[inds] == seg
+
+    return np.where(found, order[inds], len(segids)).astype(np.int64)
 
 
 def dict_tuple_avg(d1, s1, d2, s2):
@@ -500,9 +613,12 @@ def make_record_dframe(record_list, record_basins=True):
             return df[RECORD_SCHEMA]
 
 
-def to_tensor(np_arr, requires_grad=True, volatile=False):
-    """ Creates a torch.autograd.Variable from a np array """
+def to_tensor(np_arr, requires_grad=True, volatile=False, device=None):
+    """
+    Creates a torch tensor from a np array on a device
+    (default: CUDA if available, otherwise the CPU)
+    """
     tensor = torch.from_numpy(np_arr.copy())
     tensor.requires_grad = requires_grad and not volatile
 
-    return tensor.cuda()
+    return tensor.to(dev.get_device(device))
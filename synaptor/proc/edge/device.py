@@ -0,0 +1,65 @@
+"""
+Torch Device Handling
+
+Picks the device for network inference (CUDA when available, and the CPU
+otherwise), and prepares networks for inference on that device.
+"""
+
+import warnings
+
+import torch
+
+
+PRECISIONS = ("fp32", "bf16", "int8")
+
+
+def default_device():
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def get_device(device=None):
+    """ Returns a torch.device, picking the default device if None """
+    return torch.device(default_device() if device is None else device)
+
+
+def set_num_threads(num_threads=None):
+    """ Sets the number of CPU threads used by torch (if passed) """
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+
+def autocast_dtype(precision="fp32"):
+    """ The dtype to autocast inference to for a precision (or None) """
+    assert precision in PRECISIONS, f"unknown precision: {precision}"
+    return torch.bfloat16 if precision == "bf16" else None
+
+
+def prepare_network(net, device=None, precision="fp32", jit=False):
+    """
+    Moves a network to a device in eval mode for inference.
+
+    precision="int8" applies dynamic quantization to the network's linear
+    layers (CPU only). bf16 is applied by autocasting during inference
+    instead (see BatchedInference). jit=True compiles the network with
+    TorchScript, and falls back to the eager network if that fails.
+    """
+    assert precision in PRECISIONS, f"unknown precision: {precision}"
+    device = get_device(device)
+    net = net.to(device).eval()
+
+    if precision == "int8":
+        if device.type == "cpu":
+            net = torch.ao.quantization.quantize_dynamic(
+                      net, {torch.nn.Linear}, dtype=torch.qint8)
+        else:
+            warnings.warn("int8 inference is only supported on the CPU,"
+                          " running at full precision")
+
+    if jit:
+        try:
+            net = torch.jit.optimize_for_inference(torch.jit.script(net))
+        except Exception as e:
+            warnings.warn(f"TorchScript compilation failed ({e}),"
+                          " running the network eagerly")
+
+    return net
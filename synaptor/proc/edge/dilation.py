@@ -0,0 +1,98 @@
+"""
+Cleft Mask Dilation
+
+Dilates (5d, transposed) cleft masks to find the segments close to each
+cleft. The dilation covers one voxel along the slowest axis (z), and a
+Manhattan (diamond) neighborhood of radius dil_param within each plane.
+
+This runs on the CPU as a separable dilation of shifted boolean masks by
+default, and as a single conv3d with a cached kernel when a CUDA device
+is requested. Both paths give identical masks.
+"""
+
+import functools
+
+import numpy as np
+import scipy.ndimage as ndimage
+import torch
+
+from . import device as dev
+
+
+def dilate(mask, dil_param, device=None):
+    """
+    Dilates a (1,1,z,y,x) mask array. Returns a boolean array of the
+    same shape.
+    """
+    device = dev.get_device(device)
+
+    if device.type == "cuda":
+        return torch_dilate(mask, dil_param, device)
+    else:
+        return cpu_dilate(mask, dil_param)
+
+
+def cpu_dilate(mask, dil_param):
+    """
+    Separable binary dilation on the CPU. The in-plane diamond is built
+    by repeated cross (Manhattan radius 1) dilations.
+    """
+    mask = mask[0, 0, ...] != 0
+
+    dilated = mask.copy()
+    dilated[1:] |= mask[:-1]
+    dilated[:-1] |= mask[1:]
+
+    # iterate_structure (used to build the full kernel) never shrinks the
+    # neighborhood below radius 1
+    for _ in range(max(dil_param, 1)):
+        dilated = cross_dilate(dilated)
+
+    return dilated[np.newaxis, np.newaxis, ...]
+
+
+def cross_dilate(mask):
+    """ Dilates a (z,y,x) mask by one voxel along y and x """
+    dilated = mask.copy()
+
+    dilated[:, 1:] |= mask[:, :-1]
+    dilated[:, :-1] |= mask[:, 1:]
+    dilated[:, :, 1:] |= mask[:, :, :-1]
+    dilated[:, :, :-1] |= mask[:, :, 1:]
+
+    return dilated
+
+
+def torch_dilate(mask, dil_param, device):
+    """ Dilation as a single conv3d on a torch device """
+    kernel = torch_kernel(dil_param, str(device))
+    padding = tuple(sz // 2 for sz in kernel.shape[2:])
+
+    mask_t = torch.from_numpy(np.ascontiguousarray(mask, dtype="float32"))
+    with torch.no_grad():
+        output = torch.nn.functional.conv3d(mask_t.to(device), kernel,
+                                            padding=padding)
+
+    return (output != 0).cpu().numpy()
+
+
+@functools.lru_cache(maxsize=None)
+def dilation_kernel(dil_param):
+    """
+    The full (1,1,3,w,w) dilation kernel. The returned array is shared
+    between calls, so it shouldn't be modified.
+    """
+    kernel = ndimage.generate_binary_structure(2, 1)
+    kernel = ndimage.iterate_structure(kernel, dil_param)
+    width = kernel.shape[-1]
+
+    kernel = np.stack((kernel, kernel, kernel), axis=0)
+    kernel = kernel.reshape((1, 1, 3, width, width)).astype("float32")
+    kernel.flags.writeable = False
+
+    return kernel
+
+
+@functools.lru_cache(maxsize=None)
+def torch_kernel(dil_param, device):
+    return torch.from_numpy(dilation_kernel(dil_param).copy()).to(device)
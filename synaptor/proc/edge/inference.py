@@ -0,0 +1,156 @@
+"""
+Batched Network Inference
+
+Gathers network inputs from many patches (e.g. across clefts) into
+fixed-size batches, runs the network once per batch, and passes each
+patch's output back to a callback registered with its input.
+"""
+
+import numpy as np
+import torch
+
+from . import device as dev
+
+
+DEFAULT_BATCH_SIZE = 8
+
+
+class BatchedInference(object):
+    """
+    BatchedInference - a queue of network inputs that runs full batches
+
+    Each input is added with a callback, which receives that input's
+    output (without the batch dimension) once its batch runs. Callbacks
+    are called in the order the inputs were added. Inputs of differing
+    shapes are split into separate forward passes.
+
+    postproc is applied to the raw network output of each batch (e.g.
+    selecting an output and applying a sigmoid), and should return a
+    tensor indexed by batch sample.
+
+    device defaults to CUDA when available (and the CPU otherwise), and
+    precision="bf16" autocasts the forward pass to bfloat16. Outputs are
+    returned as float32.
+
+    Inputs can be written directly into the engine's batch buffer by
+    filling the array returned by input_buffer() and passing it to add().
+    Consecutive inputs from the buffer are then run without being copied
+    into a new batch.
+
+    Call flush() (or use as a context manager) to run any partial batch.
+    """
+
+    def __init__(self, net, batch_size=DEFAULT_BATCH_SIZE, device=None,
+                 postproc=None, precision="fp32"):
+        assert batch_size > 0, "batch_size needs to be positive"
+        self.net = net
+        self.batch_size = batch_size
+        self.device = dev.get_device(device)
+        self.postproc = postproc
+        self.autocast_dtype = dev.autocast_dtype(precision)
+        self.inputs = list()
+        self.slots = list()
+        self.callbacks = list()
+
+        self.buffer = None
+        self.slot = None
+
+    def input_buffer(self, shape, dtype="float32"):
+        """
+        Returns a preallocated array for the next input (with batch size 1)
+        which can be filled and passed to add(). The array is only valid
+        until the next call to add().
+        """
+        shape = tuple(shape)
+        if (self.buffer is None or self.buffer.shape[1:] != shape[1:]
+                or self.buffer.dtype != np.dtype(dtype)):
+            self.buffer = np.empty((self.batch_size,) + shape[1:],
+                                   dtype=dtype)
+
+        i = len(self.inputs)
+        self.slot = self.buffer[i:i+1]
+
+        return self.slot
+
+    def add(self, net_input, callback):
+        """
+        Adds a single network input to the queue. net_input should be a
+        5d numpy array with batch size 1.
+        """
+        assert net_input.shape[0] == 1, "expects one input at a time"
+        if self.slot is not None and net_input is self.slot:
+            self.slots.append((self.buffer, len(self.inputs)))
+        else:
+            self.slots.append(None)
+        self.slot = None
+
+        self.inputs.append(net_input)
+        self.callbacks.append(callback)
+
+        if len(self.inputs) >= self.batch_size:
+            self.run_batch()
+
+    def run_batch(self):
+        inputs, slots, callbacks = self.inputs, self.slots, self.callbacks
+        self.inputs, self.slots, self.callbacks = list(), list(), list()
+        self.slot = None
+        if len(inputs) == 0:
+            return
+
+        outputs = [None for _ in inputs]
+        for inds in shape_groups(inputs):
+            batch = stack_inputs([inputs[i] for i in inds],
+                                 [slots[i] for i in inds])
+            group_outputs = self.forward(batch)
+            for (i, output) in zip(inds, group_outputs):
+                outputs[i] = output
+
+        for (callback, output) in zip(callbacks, outputs):
+            callback(output)
+
+    def forward(self, batch):
+        batch = torch.from_numpy(batch)
+
+        with torch.no_grad(), torch.autocast(
+                                  self.device.type,
+                                  dtype=self.autocast_dtype,
+                                  enabled=self.autocast_dtype is not None):
+            output = self.net(batch.to(self.device))
+
+            if self.postproc is not None:
+                output = self.postproc(output)
+
+        return output.float()
+
+    def flush(self):
+        self.run_batch()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+
+def shape_groups(arrs):
+    """ Groups the indices of a list of arrays by array shape """
+    groups = dict()
+    for (i, arr) in enumerate(arrs):
+        groups.setdefault(arr.shape, list()).append(i)
+
+    return list(groups.values())
+
+
+def stack_inputs(inputs, slots):
+    """
+    Stacks network inputs into a batch. Inputs which fill consecutive
+    rows of the same input buffer are returned as a view of that buffer.
+    """
+    if all(slot is not None for slot in slots):
+        buf, first = slots[0]
+        if all(b is buf and j == first + k
+               for (k, (b, j)) in enumerate(slots)):
+            return buf[first:first+len(slots)]
+
+    return np.concatenate(inputs, axis=0)
@@ -75,26 +75,75 @@ def covering_patches(cleft, cleft_ids, patchsz):
 
     Returns a dictionary mapping each id to a list of locations
     """
-    bboxes = seg_utils.bounding_boxes(cleft)
-    locs = {i: list() for i in cleft_ids}
+    voxels = cleft_voxels(cleft, cleft_ids)
 
-    for cid in cleft_ids:
-        bbox_cid = bboxes[cid]
-        cleft_msk = cleft[bbox_cid.index()] == cid
-        msk_offset = bbox_cid.min()
+    return {cid: [loc for (loc, _) in
+                  covering_boxes(voxels[cid], patchsz, cleft.shape)]
+            for cid in cleft_ids}
 
-        while cleft_msk.max():
-            cid_locs = list(zip(*np.nonzero(cleft_msk)))
 
-            loc = random.choice(cid_locs) + msk_offset
-            patch = bbox.containing_box(loc, patchsz, cleft.shape)
+def cleft_voxels(cleft, cleft_ids):
+    """
+    Finds the coordinates of every voxel of each cleft in one pass over
+    the volume.
 
-            coverage = bbox_cid.intersect(patch).translate(-msk_offset)
-            cleft_msk[coverage.index()] = False
+    Returns a dictionary mapping each id to an (N,3) coordinate array
+    """
+    flat = cleft.ravel()
+    nonzero = np.flatnonzero(flat)
+    vals = flat[nonzero]
 
-            locs[cid].append(loc)
+    order = np.argsort(vals, kind="stable")
+    nonzero, vals = nonzero[order], vals[order]
 
-    return locs
+    ids = np.asarray(cleft_ids, dtype=vals.dtype)
+    first = np.searchsorted(vals, ids, "left")
+    last = np.searchsorted(vals, ids, "right")
+
+    coords = np.stack(np.unravel_index(nonzero, cleft.shape), axis=1)
+
+    return {cid: coords[lo:hi]
+            for (cid, lo, hi) in zip(cleft_ids, first, last)}
+
+
+def covering_boxes(voxels, patchsz, vol_shape):
+    """
+    Selects patch boxes which will cover all of the passed voxel
+    coordinates (e.g. from cleft_voxels).
+
+    Returns a list of (location, box) tuples
+    """
+    remaining = voxels
+    boxes = list()
+
+    while len(remaining) > 0:
+        i = random.randrange(len(remaining))
+        loc = tuple(int(c) for c in remaining[i])
+        box = bbox.containing_box(loc, patchsz, vol_shape)
+
+        covered = np.all((remaining >= tuple(box.min())) &
+                         (remaining < tuple(box.max())), axis=1)
+        remaining = remaining[~covered]
+
+        boxes.append((loc, box))
+
+    return boxes
+
+
+def plan_patches(cleft_locs, patchsz, vol_shape):
+    """
+    Computes the patch box around each sampled location of each cleft.
+
+    Returns a list of (cleft_id, box) tuples ordered by box position
+    (slowest axis first) so that consecutive patches are close together
+    within the volume.
+    """
+    plan = [(cid, bbox.containing_box(loc, patchsz, vol_shape))
+            for (cid, cid_locs) in cleft_locs.items() for loc in cid_locs]
+
+    plan.sort(key=lambda p: tuple(p[1].min())[::-1])
+
+    return plan
 
 
 def vol_center(cleft, cleft_ids, patchsz):
@@ -16,7 +16,7 @@ from ... import colnames as cn
 def merge_duplicate_clefts(full_info_df, dist_thr, res, maxgroupsize=100_000):
 
     full_info_df = full_info_df.reset_index()
-    conn_comps = []
+    union_find = utils.UnionFind()
 
     def find_new_comps(group):
         if len(group) > 1 and len(group) < maxgroupsize:
@@ -25,12 +25,14 @@ def merge_duplicate_clefts(full_info_df, dist_thr, res, maxgroupsize=100_000):
 
             pairs = find_pairs_within_dist(ids, coords, dist_thr, res)
 
-            conn_comps.extend(utils.find_connected_components(pairs))
+            union_find.add_edges(pairs)
         return 0
 
     full_info_df.groupby([cn.presyn_id, cn.postsyn_id]).apply(find_new_comps)
 
-    return utils.make_id_map(conn_comps)
+    src_ids, dst_ids = union_find.id_map_arrays()
+
+    return dict(zip(src_ids.tolist(), dst_ids.tolist()))
 
 
 def find_pairs_within_dist(ids, coords, dist_thr, res):
@@ -58,7 +60,7 @@ def merge_polyad_dups(edge_list, centroids, dist_thr, res):
 
     cleft_by_presyn = match_clefts_by_presyn(edge_list)
 
-    conn_comps = []
+    union_find = utils.UnionFind()
 
     for cleft_ids in cleft_by_presyn.values():
 
@@ -70,9 +72,11 @@ def merge_polyad_dups(edge_list, centroids, dist_thr, res):
         cleft_pairs = find_pairs_within_dist(cleft_ids, cleft_coords,
                                              dist_thr, res)
 
-        conn_comps.extend(utils.find_connected_components(cleft_pairs))
+        union_find.add_edges(cleft_pairs)
+
+    src_ids, dst_ids = union_find.id_map_arrays()
 
-    return utils.make_id_map(conn_comps)
+    return dict(zip(src_ids.tolist(), dst_ids.tolist()))
 
 
 def match_clefts_by_presyn(edge_list):
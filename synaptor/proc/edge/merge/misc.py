@@ -1,8 +1,14 @@
 """ Miscellaneous Functionality """
 
 
+from ....types import IdMap
+
+
 def update_id_map(id_map, next_map, reused_ids=False):
 
+    if isinstance(id_map, IdMap) and reused_ids:
+        return id_map.compose(next_map)
+
     # need to keep track of which keys are accounted
     # for within the current id_map
     new_keys = set(next_map.keys())
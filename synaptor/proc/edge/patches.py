@@ -0,0 +1,34 @@
+"""
+Patch Extraction for Network Inference
+
+Fills network input buffers directly from the chunk volumes, transposing
+(reversing axis order) to fit common network conventions along the way.
+Segmentation patches are returned as views without copying.
+"""
+
+import numpy as np
+
+
+def input_shape(box, num_channels):
+    """ The 5d network input shape for a patch within box """
+    return (1, num_channels) + tuple(box.shape())[::-1]
+
+
+def transposed_view(vol, box):
+    """ A 5d (transposed) view of the volume within box """
+    return vol[box.index()].transpose((2, 1, 0))[np.newaxis, np.newaxis, :]
+
+
+def fill_image(out, img, box):
+    """ Fills a (1,1,z,y,x) buffer with the image patch scaled to [0,1] """
+    np.divide(transposed_view(img, box), np.float32(255.), out=out)
+
+
+def fill_mask(out, seg, box, segid):
+    """ Fills a (1,1,z,y,x) buffer with the mask of segid in the patch """
+    np.equal(transposed_view(seg, box), segid, out=out)
+
+
+def fill_values(out, vol, box):
+    """ Fills a (1,1,z,y,x) buffer with the volume values in the patch """
+    np.copyto(out, transposed_view(vol, box), casting="unsafe")
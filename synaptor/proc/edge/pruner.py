@@ -7,11 +7,16 @@ import numpy as np
 from ...types import bbox
 from ... import seg_utils
 from . import locs
+from . import patches
+from .inference import BatchedInference, DEFAULT_BATCH_SIZE
+from . import device as dev
 
 
 def prune_candidates(net, img, seg, patchsz, candidates, cleft=None,
                      output_thresh=0, cleft_locs=None, prox=None,
-                     cleft_ids=None, loc_type="centroid"):
+                     cleft_ids=None, loc_type="centroid",
+                     batch_size=DEFAULT_BATCH_SIZE, device=None,
+                     precision="fp32"):
     """
     Apply pruner network to candidate list w/ threshold.
 
@@ -40,6 +45,12 @@ def prune_candidates(net, img, seg, patchsz, candidates, cleft=None,
             loc_type is not manual. Defaults to None.
         loc_type (str): A string specifying how to determine sample locations.
             See locs.py. Defaults to "centroid".
+        batch_size (int): The number of candidates to evaluate within each
+            network forward pass. Defaults to DEFAULT_BATCH_SIZE.
+        device (str): The torch device to run the network on. Defaults to
+            None (CUDA if available, otherwise the CPU).
+        precision (str): "fp32", "bf16" or "int8" (see device.py).
+            Defaults to "fp32".
 
     Returns:
         list: A subset of candidates whose output was greater than threshold.
@@ -58,26 +69,32 @@ def prune_candidates(net, img, seg, patchsz, candidates, cleft=None,
 
     pruned = list()
     outputs = list()
-    for (cid, presyn_id, postsyn_id) in candidates:
-        loc = cleft_locs[cid][0]
-        box = bbox.containing_box(loc, patchsz, img.shape)
 
-        img_p, syn_p, seg_p = get_patches(img, cleft, seg,
-                                          box, cid, prox=prox)
+    def record(candidate):
+        def record_output(output):
+            if output.item() > output_thresh:
+                pruned.append(candidate)
+                outputs.append(output.item())
 
-        output = predict_candidate(net, img_p, syn_p, seg_p,
-                                   presyn_id, postsyn_id)
+        return record_output
 
-        if output > output_thresh:
-            pruned.append((cid, presyn_id, postsyn_id))
-            outputs.append(output)
+    engine = BatchedInference(net, batch_size=batch_size, device=device,
+                              postproc=format_output, precision=precision)
+    with engine:
+        for candidate in candidates:
+            net_input = candidate_input(img, seg, patchsz, candidate,
+                                        cleft_locs, cleft=cleft, prox=prox,
+                                        engine=engine)
+            engine.add(net_input, record(tuple(candidate)))
 
     return pruned, outputs
 
 
 def max_candidates(net, img, seg, patchsz, candidates, cleft=None,
                    cleft_locs=None, prox=None, cleft_ids=None,
-                   loc_type="centroid"):
+                   loc_type="centroid",
+                   batch_size=DEFAULT_BATCH_SIZE, device=None,
+                   precision="fp32"):
     """
     Apply pruner network to candidate list, select maxima.
 
@@ -104,6 +121,12 @@ def max_candidates(net, img, seg, patchsz, candidates, cleft=None,
             loc_type is not manual. Defaults to None.
         loc_type (str): A string specifying how to determine sample locations.
             See locs.py. Defaults to "centroid".
+        batch_size (int): The number of candidates to evaluate within each
+            network forward pass. Defaults to DEFAULT_BATCH_SIZE.
+        device (str): The torch device to run the network on. Defaults to
+            None (CUDA if available, otherwise the CPU).
+        precision (str): "fp32", "bf16" or "int8" (see device.py).
+            Defaults to "fp32".
 
     Returns:
         list: A subset of candidates whose output was maximal for each pair_id.
@@ -122,28 +145,37 @@ def max_candidates(net, img, seg, patchsz, candidates, cleft=None,
 
     pruned = dict()
     max_outputs = dict()
-    for (cid, presyn_id, postsyn_id) in candidates:
-        loc = cleft_locs[cid][0]
-        box = bbox.containing_box(loc, patchsz, img.shape)
 
-        img_p, syn_p, seg_p = get_patches(img, cleft, seg,
-                                          box, cid, prox=prox)
+    def record(candidate):
+        def record_output(output):
+            cid, output = candidate[0], output.item()
+            if cid not in pruned or output > max_outputs[cid]:
+                pruned[cid] = candidate
+                max_outputs[cid] = output
 
-        output = predict_candidate(net, img_p, syn_p, seg_p,
-                                   presyn_id, postsyn_id)
+        return record_output
 
-        if cid in pruned:
-            if output > max_outputs[cid]:
-                pruned[cid] = (cid, presyn_id, postsyn_id)
-                max_outputs[cid] = output
-        else:
-            pruned[cid] = (cid, presyn_id, postsyn_id)
-            max_outputs[cid] = output
+    engine = BatchedInference(net, batch_size=batch_size, device=device,
+                              postproc=format_output, precision=precision)
+    with engine:
+        for candidate in candidates:
+            net_input = candidate_input(img, seg, patchsz, candidate,
+                                        cleft_locs, cleft=cleft, prox=prox,
+                                        engine=engine)
+            engine.add(net_input, record(tuple(candidate)))
 
     pruned = list(pruned.values())
     return pruned
 
 
+def format_output(output):
+    """ Takes the first output of networks which return a list of outputs """
+    if isinstance(output, (list, tuple)):
+        return output[0]
+
+    return output
+
+
 def get_patches(img, clf, seg, box, clfid, prox=None):
     """ Return 5d patches specified by the bbox for use in torch """
 
@@ -168,7 +200,47 @@ def format_patch(patch):
     return patch.transpose((2, 1, 0))[np.newaxis, np.newaxis, :]
 
 
-def predict_candidate(net, img_p, syn_p, seg_p, presyn_id, postsyn_id):
+def candidate_input(img, seg, patchsz, candidate, cleft_locs,
+                    cleft=None, prox=None, engine=None):
+    """
+    Formats the network input for a (pair_id, presyn, postsyn) triple.
+    The input is written directly into the engine's input buffer if an
+    inference engine is passed.
+    """
+    cid, presyn_id, postsyn_id = candidate
+
+    loc = cleft_locs[cid][0]
+    box = bbox.containing_box(loc, patchsz, img.shape)
+
+    if engine is None:
+        img_p, syn_p, seg_p = get_patches(img, cleft, seg,
+                                          box, cid, prox=prox)
+
+        return make_net_input(img_p, syn_p, seg_p, presyn_id, postsyn_id)
+
+    net_input = engine.input_buffer(patches.input_shape(box, 4))
+
+    patches.fill_image(net_input[:, 0:1], img, box)
+    if prox is not None:
+        patches.fill_values(net_input[:, 1:2], prox, box)
+    else:
+        patches.fill_mask(net_input[:, 1:2], cleft, box, cid)
+    patches.fill_mask(net_input[:, 2:3], seg, box, presyn_id)
+    patches.fill_mask(net_input[:, 3:4], seg, box, postsyn_id)
+
+    return net_input
+
+
+def make_net_input(img_p, syn_p, seg_p, presyn_id, postsyn_id):
+    presyn_p = (seg_p == presyn_id).astype("float32")
+    postsyn_p = (seg_p == postsyn_id).astype("float32")
+
+    return np.concatenate((img_p, syn_p, presyn_p, postsyn_p),
+                          axis=1).astype("float32")
+
+
+def predict_candidate(net, img_p, syn_p, seg_p, presyn_id, postsyn_id,
+                      device=None):
     """
     Runs an pruner network over a single patch
 
@@ -176,11 +248,9 @@ def predict_candidate(net, img_p, syn_p, seg_p, presyn_id, postsyn_id):
     """
     with torch.no_grad():
         # formatting
-        presyn_p = (seg_p == presyn_id).astype("float32")
-        postsyn_p = (seg_p == postsyn_id).astype("float32")
-        net_input = np.concatenate((img_p, syn_p, presyn_p, postsyn_p),
-                                   axis=1).astype("float32")
-        net_input = torch.from_numpy(net_input.copy()).cuda()
+        net_input = make_net_input(img_p, syn_p, seg_p,
+                                   presyn_id, postsyn_id)
+        net_input = torch.from_numpy(net_input).to(dev.get_device(device))
 
         # network has only one output
         # and batch size = 1
@@ -0,0 +1,75 @@
+"""
+Per-Cleft Network Output Weights
+
+Edge inference sums the network output within each segment close to each
+cleft. These weights are three dicts (cleft id -> seg id -> value):
+the (pre, post) weight sums, the segment sizes within the sampled patches,
+and a location within each segment.
+
+Storing the weights as a DataFrame lets us skip network inference when
+only the scoring or assignment parameters change.
+"""
+
+
+import numpy as np
+import pandas as pd
+
+from .. import colnames as cn
+
+
+WEIGHT_COLUMNS = [cn.seg_id, cn.wt_segid,
+                  cn.presyn_wt_sum, cn.postsyn_wt_sum, cn.wt_seg_sz,
+                  *cn.wt_seg_coord_cols]
+
+# Clefts without any close segments are stored as a single row with this
+# segment id, so that they aren't inferred again
+EMPTY_SEGID = 0
+
+
+def make_weight_dframe(wt_sums, seg_szs, seg_locs):
+    """ Flattens the weight dicts into a DataFrame """
+    rows = list()
+    for (cid, cid_sums) in wt_sums.items():
+        if len(cid_sums) == 0:
+            rows.append((cid, EMPTY_SEGID, 0., 0., 0, 0, 0, 0))
+            continue
+
+        cid_szs, cid_locs = seg_szs[cid], seg_locs.get(cid, dict())
+        for (segid, (pre_wt, post_wt)) in cid_sums.items():
+            loc = cid_locs.get(segid, (0, 0, 0))
+            rows.append((cid, segid, pre_wt, post_wt, cid_szs[segid], *loc))
+
+    dframe = pd.DataFrame(rows, columns=WEIGHT_COLUMNS)
+    dframe = dframe.astype({cn.seg_id: np.uint64, cn.wt_segid: np.uint64,
+                            cn.presyn_wt_sum: np.float64,
+                            cn.postsyn_wt_sum: np.float64,
+                            cn.wt_seg_sz: np.int64,
+                            **{col: np.int64 for col in cn.wt_seg_coord_cols}})
+
+    return dframe
+
+
+def split_weight_dframe(dframe):
+    """ Splits a weight DataFrame back into the weight dicts """
+    wt_sums, seg_szs, seg_locs = dict(), dict(), dict()
+
+    for (cid, cid_df) in dframe.groupby(cn.seg_id, sort=False):
+        cid_df = cid_df[cid_df[cn.wt_segid] != EMPTY_SEGID]
+        segids = cid_df[cn.wt_segid].tolist()
+
+        pre_wts = cid_df[cn.presyn_wt_sum].tolist()
+        post_wts = cid_df[cn.postsyn_wt_sum].tolist()
+        locs = cid_df[cn.wt_seg_coord_cols].itertuples(index=False,
+                                                        name=None)
+
+        cid = int(cid)
+        wt_sums[cid] = dict(zip(segids, zip(pre_wts, post_wts)))
+        seg_szs[cid] = dict(zip(segids, cid_df[cn.wt_seg_sz].tolist()))
+        seg_locs[cid] = dict(zip(segids, locs))
+
+    return wt_sums, seg_szs, seg_locs
+
+
+def merge_weights(weights1, weights2):
+    """ Combines two sets of weights for disjoint sets of clefts """
+    return tuple({**d1, **d2} for (d1, d2) in zip(weights1, weights2))
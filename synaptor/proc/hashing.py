@@ -7,11 +7,14 @@ import struct
 import hashlib
 import collections
 
+import numpy as np
 import pandas as pd
 
 
 HASHED_INDEX_NAME = "hashed_index"
 PRIME = 4839472903831
+# 2**64 / golden ratio - multiplicative hashing constant for id arrays
+GOLDEN_MULT = np.uint64(0x9E3779B97F4A7C15)
 
 
 def basehash(v, seed=54321, verbose=False):
@@ -47,6 +50,17 @@ def hashval(v, maxval):
     return basehash(pack_many(v)) % maxval
 
 
+def hash_ids(ids, maxval):
+    """
+    Hash an array of integer ids to indices below maxval. Vectorized
+    (multiplicative hashing), so it doesn't match hashval.
+    """
+    ids = np.asarray(ids, dtype=np.uint64)
+    mixed = (ids * GOLDEN_MULT) >> np.uint64(32)
+
+    return (mixed % np.uint64(maxval)).astype(np.int64)
+
+
 def hashtuple(t, maxval):
     """
     Hash a tuple of values to an index below maxval using
@@ -2,6 +2,8 @@ from . import seginfo
 from .seginfo import read_chunk_seg_info, write_chunk_seg_info
 from .seginfo import read_all_chunk_seg_infos, read_all_unique_seg_ids
 from .seginfo import read_merged_seg_info, write_merged_seg_info
+from .seginfo import pull_all_chunk_seg_info_files, iter_chunk_seg_infos
+from .seginfo import write_merged_seg_info_parts
 from .seginfo import read_mapped_seginfo_by_dst_hash
 from .seginfo import prep_chunk_seg_info
 from .seginfo import dedup_chunk_segs
@@ -15,12 +17,14 @@ from .continuation import read_continuation_graph, write_contin_graph_edges
 
 from . import network
 from .network import read_network_from_proc, write_network_to_proc
+from .network import pull_network_from_proc, network_checksum
 
 from . import edgeinfo
 from .edgeinfo import read_chunk_edge_info, write_chunk_edge_info
 from .edgeinfo import read_hashed_edge_info, read_max_n_edge_per_cleft
 from .edgeinfo import read_all_chunk_edge_infos
 from .edgeinfo import read_merged_edge_info, write_merged_edge_info
+from .edgeinfo import read_chunk_edge_weights, write_chunk_edge_weights
 
 from . import fullinfo
 from .fullinfo import read_full_info, write_full_info
@@ -32,7 +36,7 @@ from .idmap import read_dup_id_map, write_dup_id_map
 from .idmap import read_filtered_dup_id_map
 from .idmap import read_chunk_unique_ids, write_chunk_unique_ids
 from .idmap import read_unique_ids, pull_unique_id_files
-from .idmap import read_all_chunk_unique_ids
+from .idmap import read_all_chunk_unique_ids, iter_all_chunk_unique_ids
 from .idmap import write_seg_merge_map, write_chunked_seg_map
 
 from . import overlap
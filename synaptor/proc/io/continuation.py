@@ -4,11 +4,14 @@ import os
 import re
 
 import h5py
+import numpy as np
 import pandas as pd
 from sqlalchemy import select
 
 from ... import io
 from ..seg.continuation import Continuation, Face, ContinFile
+from ..seg.continuation import continuations_from_arrays
+from ..seg.continuation import arrays_from_continuations
 from .. import colnames as cn
 from . import filenames as fn
 
@@ -17,6 +20,9 @@ FACE_REGEXP = re.compile("f[0-2]_(hi|lo)")
 CONTINUATION_FILE_COLUMNS = [cn.contin_filename, cn.facehash]
 CONTIN_GRAPH_COLUMNS = [cn.graph_id1, cn.graph_id2]
 TABLENAME = "continuations"
+# Version 1 files store one dataset per segment under face_coords/
+# Version 2 files store concatenated segids, offsets, and coords arrays
+FACE_FILE_VERSION = 2
 
 
 def fname_face_tag(face):
@@ -50,21 +56,46 @@ def face_filename(proc_url, chunk_bounds, face, local=False):
         return os.path.join(proc_url, fn.contin_dirname, basename)
 
 
-def _read_face_file(fname):
-
-    continuations = list()
+def _read_face_file(fname, mmap=False):
+    """
+    Reads the continuations within a face file (given by name or as a
+    binary file object). Handles both the columnar layout and the older
+    layout with one dataset per segment. If mmap is True, uncompressed
+    coordinate arrays of named files are memory-mapped instead of read.
+    """
+    mmap = mmap and isinstance(fname, str)
 
     with h5py.File(fname, "r") as f:
         face_index = f["face_axis"][()]
         face_hi = f["hi_face"][()]
 
         face = Face(face_index, face_hi)
-        continuation_ids = f["face_coords"].keys()
 
-        for segid in continuation_ids:
-            coords = f[f"face_coords/{segid}"][()]
-            new_continuation = Continuation(int(segid), face, coords)
-            continuations.append(new_continuation)
+        if "face_coords" in f:
+            return _read_face_coords_group(f, face)
+
+        segids = f["segids"][()]
+        offsets = f["offsets"][()]
+        coords_offset = f["coords"].id.get_offset() if mmap else None
+
+        if coords_offset is None or f["coords"].compression is not None:
+            coords = f["coords"][()]
+        else:
+            coords = np.memmap(fname, mode="r", offset=coords_offset,
+                               dtype=f["coords"].dtype,
+                               shape=f["coords"].shape)
+
+    return continuations_from_arrays(segids, offsets, coords, face)
+
+
+def _read_face_coords_group(f, face):
+    """ Reads the version 1 layout (one dataset per segment) """
+    continuations = list()
+
+    for segid in f["face_coords"].keys():
+        coords = f[f"face_coords/{segid}"][()]
+        new_continuation = Continuation(int(segid), face, coords)
+        continuations.append(new_continuation)
 
     return continuations
 
@@ -91,11 +122,18 @@ def _read_legacy_file(fname):
     return continuations
 
 
-def _write_face_file(face_continuations, fname, face=None):
+def _write_face_file(face_continuations, fname, face=None,
+                     compression=None):
     """
-    Given a concrete local path, writes an hdf5 file describing each
-    continuation within a list. Each continuation within the list is assumed
-    to originate from the same face of a given chunk.
+    Given a concrete local path (or a binary file object), writes an hdf5
+    file describing each continuation within a list. Each continuation
+    within the list is assumed to originate from the same face of a given
+    chunk.
+
+    The coordinates of every continuation are concatenated into a single
+    dataset, and indexed by segids and offsets arrays. compression is
+    passed along to h5py for the coordinate array (e.g. "gzip"), and
+    prevents memory-mapped reads when set.
     """
 
     if face is None:
@@ -105,43 +143,47 @@ def _write_face_file(face_continuations, fname, face=None):
 
         face = face_continuations[0].face
 
-    if os.path.exists(fname):
+    if isinstance(fname, str) and os.path.exists(fname):
         os.remove(fname)
 
+    segids, offsets, coords = arrays_from_continuations(face_continuations)
+
+    # h5py can't chunk (and so compress) an empty dataset
+    compression = compression if len(coords) > 0 else None
+
     with h5py.File(fname, "w") as f:
+        f.attrs["version"] = FACE_FILE_VERSION
         f.create_dataset("face_axis", data=face.axis)
         f.create_dataset("hi_face", data=face.hi_index)
-        coord_group = f.create_group("face_coords")
-
-        for continuation in face_continuations:
-            coord_group.create_dataset(f"{continuation.segid}",
-                                       data=continuation.face_coords)
+        f.create_dataset("segids", data=segids)
+        f.create_dataset("offsets", data=offsets)
+        f.create_dataset("coords", data=coords, compression=compression)
 
 
-def read_face_continuations(proc_url, chunk_bounds, face):
+def read_face_continuations(proc_url, chunk_bounds, face, mmap=False):
     """ Reads the continuations for a single face """
     assert not io.is_db_url(proc_url), "Continuation IO not impl for dbs"
-    local_fname = io.pull_file(face_filename(proc_url, chunk_bounds, face))
+    with io.fetched(face_filename(proc_url, chunk_bounds, face)) as source:
+        return _read_face_file(source, mmap=mmap)
 
-    return _read_face_file(local_fname)
 
-
-def read_face_filenames(filenames):
+def read_face_filenames(filenames, mmap=False):
     """
-    Reads continuations for a set of face files by pulling the
-    files from storage directly.
+    Reads continuations for a set of face files by fetching the
+    files from storage directly (into memory when they're remote).
     """
-    local_filenames = io.pull_files(filenames)
-    return list(map(_read_face_file, local_filenames))
+    with io.fetched_files(filenames) as sources:
+        return list(_read_face_file(f, mmap=mmap) for f in sources)
 
 
-def write_face_continuations(continuations, proc_url, chunk_bounds, face):
+def write_face_continuations(continuations, proc_url, chunk_bounds, face,
+                             compression=None):
     assert not io.is_db_url(proc_url), "Continuation IO not impl for dbs"
-    local_fname = face_filename("", chunk_bounds, face, local=True)
     dst_fname = face_filename(proc_url, chunk_bounds, face, local=False)
 
-    _write_face_file(continuations, local_fname, face)
-    io.send_file(local_fname, dst_fname)
+    io.upload(lambda dst: _write_face_file(continuations, dst, face,
+                                           compression=compression),
+              dst_fname)
 
 
 def read_chunk_continuations(proc_url, chunk_bounds):
@@ -149,12 +191,11 @@ def read_chunk_continuations(proc_url, chunk_bounds):
     cloud_fnames = list(face_filename(proc_url, chunk_bounds, face)
                         for face in Face.all_faces())
 
-    local_fnames = io.pull_files(cloud_fnames)
-
     continuations = dict()
-    for fname in local_fnames:
-        face = face_from_filename(fname)
-        continuations[face] = _read_face_file(fname)
+    with io.fetched_files(cloud_fnames) as sources:
+        for (fname, source) in zip(cloud_fnames, sources):
+            face = face_from_filename(fname)
+            continuations[face] = _read_face_file(source)
 
     return continuations
 
@@ -181,15 +222,16 @@ def continuations_by_hash(proc_url, hashval):
                 for (fname, bbox, face) in zip(local_filenames, bboxes, faces))
 
 
-def write_chunk_continuations(continuations, proc_url, chunk_bounds):
+def write_chunk_continuations(continuations, proc_url, chunk_bounds,
+                              compression=None):
     assert not io.is_db_url(proc_url), "Continuation IO not impl for dbs"
-    local_fnames = list(face_filename("./", chunk_bounds, face, local=True)
-                        for face in Face.all_faces())
+    faces = Face.all_faces()
 
-    for (face, fname) in zip(Face.all_faces(), local_fnames):
-        _write_face_file(continuations[face], fname, face)
+    def write_face(face):
+        write_face_continuations(continuations[face], proc_url,
+                                 chunk_bounds, face, compression=compression)
 
-    io.send_files(local_fnames, os.path.join(proc_url, fn.contin_dirname))
+    io.backends.transfer.map_transfers(write_face, faces)
 
 
 def write_face_hashes(face_hashes, proc_url, chunk_bounds, proc_dir=None):
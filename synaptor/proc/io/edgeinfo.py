@@ -45,7 +45,11 @@ def read_hashed_edge_info(proc_url, partnerhash=None,
     """ Reads the edge information with a particular hash value. """
     assert partnerhash is not None or clefthash is not None, "Need hash value"
     assert partnerhash is None or clefthash is None, "Specify only one hash"
-    assert io.is_db_url(proc_url), "reading by hash not supported for files"
+
+    if not io.is_db_url(proc_url):
+        return read_hashed_edge_info_files(proc_url, partnerhash=partnerhash,
+                                           clefthash=clefthash,
+                                           merged=merged, dedup=dedup)
 
     metadata = io.open_db_metadata(proc_url)
 
@@ -69,6 +73,32 @@ def read_hashed_edge_info(proc_url, partnerhash=None,
         return io.read_db_dframe(proc_url, statement, index_col=cn.seg_id)
 
 
+def read_hashed_edge_info_files(proc_url, partnerhash=None,
+                                clefthash=None, merged=True, dedup=False):
+    """
+    File storage version of read_hashed_edge_info. The hash filter is
+    passed to the reader so that binary columnar files only assemble
+    the matching rows.
+    """
+    if partnerhash is not None:
+        filters = [(cn.partnerhash, "==", partnerhash)]
+    else:
+        filters = [(cn.clefthash, "==", clefthash)]
+
+    columns = EDGE_INFO_COLUMNS[1:]
+    if merged:
+        fnames = [os.path.join(proc_url, fn.merged_edgeinfo_fname)]
+    else:
+        edgeinfo_dir = os.path.join(proc_url, fn.edgeinfo_dirname)
+        fnames = io.pull_directory(edgeinfo_dir)
+
+    dframes = [io.read_dframe(f, columns=columns, filters=filters)
+               for f in fnames]
+    df = pd.concat(dframes) if len(dframes) > 0 else make_empty_df()
+
+    return df.loc[~df.index.duplicated()] if dedup else df
+
+
 def write_chunk_edge_info(dframe, proc_url, chunk_bounds,
                           tablename="corrupted_chunk_edges"):
     """ Writes edge info for a single chunk to storage. """
@@ -82,6 +112,44 @@ def write_chunk_edge_info(dframe, proc_url, chunk_bounds,
         io.write_dframe(dframe, chunk_info_fname(proc_url, chunk_bounds))
 
 
+def chunk_weights_fname(proc_url, chunk_bounds, checksum):
+    chunk_tag = io.fname_chunk_tag(chunk_bounds)
+    basename = fn.edgeweights_fmtstr.format(checksum=checksum, tag=chunk_tag)
+
+    return os.path.join(proc_url, fn.edgeweights_dirname, basename)
+
+
+def read_chunk_edge_weights(proc_url, chunk_bounds, checksum):
+    """
+    Reads the cached network output weights for a chunk (see
+    edge/weights.py). Returns None if nothing is cached for this chunk
+    and network checksum.
+    """
+    assert not io.is_db_url(proc_url), "weight caching not implemented for db"
+
+    fname = chunk_weights_fname(proc_url, chunk_bounds, checksum)
+    if not io.is_remote_path(fname) and not os.path.exists(fname):
+        return None
+
+    try:
+        return io.read_dframe(fname).reset_index()
+    except Exception as e:
+        print(e)
+        print("WARNING: no cached edge weights found")
+        return None
+
+
+def write_chunk_edge_weights(dframe, proc_url, chunk_bounds, checksum):
+    """ Writes the network output weights for a chunk to storage """
+    assert not io.is_db_url(proc_url), "weight caching not implemented for db"
+
+    fname = chunk_weights_fname(proc_url, chunk_bounds, checksum)
+    if not io.is_remote_path(fname):
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+
+    io.write_dframe(dframe.set_index(cn.seg_id), fname)
+
+
 def read_all_chunk_edge_infos(proc_url):
     """
     Reads all edge info for chunks within storage.
@@ -89,22 +157,22 @@ def read_all_chunk_edge_infos(proc_url):
     edge info subdirectory
     """
     if io.is_db_url(proc_url):
-        metadata = io.open_db_metadata(proc_url)
-        edges = metadata.tables["corrupted_chunk_edges"]
-        chunks = metadata.tables["chunks"]
+        edges = io.db_table(proc_url, "corrupted_chunk_edges")
+        chunks = io.db_table(proc_url, "chunks")
 
         edgecols = list(edges.c[name] for name in EDGE_INFO_COLUMNS)
         edgecols.append(edges.c[cn.chunk_tag])
-        edgestmt = select(edgecols)
+        edgestmt = select(*edgecols)
 
         chunkcols = list(chunks.c[name] for name in CHUNK_START_COLUMNS)
-        chunkstmt = select(chunkcols)
+        chunkstmt = select(*chunkcols)
 
-        results = io.read_db_dframes(proc_url, (edgestmt, chunkstmt),
-                                     index_cols=(cn.seg_id, "id"))
-        edge_df, chunk_df = results[0], results[1]
+        chunk_df = io.read_db_dframe(proc_url, chunkstmt)
 
-        chunk_id_to_df = dict(iter(edge_df.groupby(cn.chunk_tag)))
+        # streaming the edges of one chunk at a time
+        chunk_id_to_df = dict(io.iter_db_groups(proc_url, edgestmt,
+                                                cn.chunk_tag,
+                                                index_col=cn.seg_id))
         chunk_lookup = dict(zip(chunk_df[cn.chunk_tag],
                                 list(zip(chunk_df[cn.chunk_bx],
                                          chunk_df[cn.chunk_by],
@@ -1,10 +1,17 @@
 """ File storage conventions """
 
+import os
+
+
+# DataFrame file extension - this picks the file format (see io.read_dframe)
+# e.g. ".npz" or ".parquet" for binary columnar files, and csv otherwise
+dframe_ext = os.environ.get("SYNAPTOR_DFRAME_EXT", ".df")
+
 # Segment info files
 seginfo_dirname = "seg_infos"
-seginfo_fmtstr = "seg_info_{tag}.df"
-merged_seginfo_fname = "merged_cleft_info.df"
-merged_seginfo_fmtstr = "merged_cleft_info_{tag}.df"
+seginfo_fmtstr = "seg_info_{tag}" + dframe_ext
+merged_seginfo_fname = "merged_cleft_info" + dframe_ext
+merged_seginfo_fmtstr = "merged_cleft_info_{tag}" + dframe_ext
 
 # Segment continuations
 contin_dirname = "continuations"
@@ -13,31 +20,36 @@ contin_fmtstr = "continuations_{chunk_tag}_{face_tag}.h5"
 
 # Segmentation merging id maps
 idmap_dirname = "id_maps"
-idmap_fmtstr = "id_map_{tag}.df"
+idmap_fmtstr = "id_map_{tag}" + dframe_ext
 
 
 # Mapping to unique ids
 uniquemap_dirname = "unique_ids"
-uniquemap_fmtstr = "unique_ids_{tag}.df"
+uniquemap_fmtstr = "unique_ids_{tag}" + dframe_ext
 
 
 # Duplicate connection merging id map
-dup_map_fname = "dup_id_map.df"
-tagged_dup_fname = "dup_id_map_{i}.df"
+dup_map_fname = "dup_id_map" + dframe_ext
+tagged_dup_fname = "dup_id_map_{i}" + dframe_ext
 
 
 # Edge info files
 edgeinfo_dirname = "chunk_edges"
-edgeinfo_fmtstr = "chunk_edges_{tag}.df"
-merged_edgeinfo_fname = "merged_edges.df"
-final_edgeinfo_fname = "final_edgelist.df"
-tagged_final_edgeinfo_fname = "final_edgelist_{}.df"
+edgeinfo_fmtstr = "chunk_edges_{tag}" + dframe_ext
+merged_edgeinfo_fname = "merged_edges" + dframe_ext
+final_edgeinfo_fname = "final_edgelist" + dframe_ext
+tagged_final_edgeinfo_fname = "final_edgelist_{}" + dframe_ext
+
+# Cached network output weights ({checksum} identifies the network
+# and inference parameters)
+edgeweights_dirname = "edge_weights"
+edgeweights_fmtstr = "{checksum}/edge_weights_{tag}" + dframe_ext
 
 
 # Overlap matrices
 overlaps_dirname = "overlaps"
-overlaps_fmtstr = "chunk_overlap_{tag}.df"
-max_overlaps_fname = "max_overlaps.df"
+overlaps_fmtstr = "chunk_overlap_{tag}" + dframe_ext
+max_overlaps_fname = "max_overlaps" + dframe_ext
 
 
 # PyTorch network
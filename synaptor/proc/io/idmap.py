@@ -7,6 +7,7 @@ from sqlalchemy import select
 import pandas as pd
 
 from ... import io
+from ...types import IdMap
 from .. import colnames as cn
 from . import filenames as fn
 
@@ -31,6 +32,10 @@ def unique_ids_fname(storagestr, chunk_bounds):
 
 
 def make_dframe_from_dict(id_map):
+    if isinstance(id_map, IdMap):
+        return pd.DataFrame({cn.dst_id: id_map.dst_ids},
+                            index=pd.Index(id_map.src_ids, name=cn.src_id))
+
     df = pd.DataFrame(pd.Series(id_map), columns=[cn.dst_id])
     df.index.name = cn.src_id
 
@@ -40,7 +45,7 @@ def make_dframe_from_dict(id_map):
 def read_unique_ids(filename):
     dframe = io.read_dframe(filename)
 
-    return dict(zip(dframe.index, dframe[cn.dst_id]))
+    return IdMap(dframe.index.values, dframe[cn.dst_id].values)
 
 
 def pull_unique_id_files(storagestr, bboxes):
@@ -61,22 +66,20 @@ def read_chunk_unique_ids(proc_url, chunk_bounds):
     if io.is_db_url(proc_url):
 
         tag = io.fname_chunk_tag(chunk_bounds)
-        metadata = io.open_db_metadata(proc_url)
-        chunk_segs = metadata.tables["chunk_segs"]
+        chunk_segs = io.db_table(proc_url, "chunk_segs")
 
         columns = list(chunk_segs.c[name] for name in UNIQUE_ID_MAP_COLUMNS)
         statement = select(columns).where(chunk_segs.c[cn.chunk_tag] == tag)
 
         dframe = io.read_db_dframe(proc_url, statement)
 
-        return dict(zip(dframe[cn.seg_id], dframe["id"]))
+        return unique_id_dframe_to_map(dframe)
 
     else:
 
         fname = io.pull_file(unique_ids_fname(proc_url, chunk_bounds))
-        dframe = io.read_dframe(fname)
 
-        return dict(zip(dframe.index, dframe[cn.dst_id]))
+        return read_unique_ids(fname)
 
 
 def write_chunk_unique_ids(mapping, storagestr, chunk_bounds):
@@ -93,27 +96,29 @@ def write_chunk_unique_ids(mapping, storagestr, chunk_bounds):
 
 
 def read_all_chunk_unique_ids(proc_url):
+    return dict(iter_all_chunk_unique_ids(proc_url))
+
+
+def iter_all_chunk_unique_ids(proc_url):
+    """
+    Streams (chunk begin, unique id map) pairs for each chunk, reading
+    the rows of one chunk at a time.
+    """
     assert io.is_db_url(proc_url), "file unique id map not implemented yet"
 
-    metadata = io.open_db_metadata(proc_url)
-    chunk_segs = metadata.tables["chunk_segs"]
+    chunk_segs = io.db_table(proc_url, "chunk_segs")
 
     columns = list(chunk_segs.c[name] for name in UNIQUE_ID_MAP_COLUMNS)
     columns.append(chunk_segs.c[cn.chunk_tag])
-    statement = select(columns)
-
-    dframe = io.read_db_dframe(proc_url, statement)
-
-    chunk_tag_to_df = dict(iter(dframe.groupby(cn.chunk_tag)))
-
-    map_lookup = {io.bbox_from_tag(tag).min(): unique_id_dframe_to_map(df)
-                  for (tag, df) in chunk_tag_to_df.items()}
+    statement = select(*columns)
 
-    return map_lookup
+    for (tag, dframe) in io.iter_db_groups(proc_url, statement,
+                                           cn.chunk_tag):
+        yield io.bbox_from_tag(tag).min(), unique_id_dframe_to_map(dframe)
 
 
 def unique_id_dframe_to_map(dframe):
-    return dict(zip(dframe[cn.seg_id], dframe["id"]))
+    return IdMap(dframe[cn.seg_id].values, dframe["id"].values)
 
 
 def write_seg_merge_map(seg_merge_df, proc_url):
@@ -168,7 +173,7 @@ def read_chunk_id_map(proc_url, chunk_bounds):
         fname = io.pull_file(cleft_map_fname(proc_url, chunk_bounds))
         dframe = io.read_dframe(fname)
 
-    return dict(zip(dframe.index, dframe.dst_id))
+    return IdMap(dframe.index.values, dframe[cn.dst_id].values)
 
 
 def write_chunk_id_map(id_map, proc_url, chunk_bounds):
@@ -216,7 +221,7 @@ def read_dup_id_map(proc_url):
 
     else:
         try:
-            dframe = io.read_dframe(proc_url, "dup_id_map.df")
+            dframe = io.read_dframe(proc_url, fn.dup_map_fname)
         except Exception as e:
             print(e)
             print("WARNING: no dup id map found, passing empty dup mapping")
@@ -234,12 +239,13 @@ def read_filtered_dup_id_map(storagestr, src_ids, chunksize=100000):
     else:
         try:
             mapping = dict()
-            for subdf in io.read_dframe(
-                             storagestr, fn.dup_map_fname,
-                             chunksize=chunksize):
-                reqd_rows = subdf.loc[src_ids.intersection(subdf.index)]
-                mapping.update(
-                    dict(zip(reqd_rows.index, reqd_rows[cn.dst_id])))
+            filters = [(cn.src_id, "in", src_ids)]
+            with io.read_dframe(storagestr, fn.dup_map_fname,
+                                chunksize=chunksize,
+                                filters=filters) as reader:
+                for subdf in reader:
+                    mapping.update(
+                        dict(zip(subdf.index, subdf[cn.dst_id])))
 
         except Exception as e:
             print(e)
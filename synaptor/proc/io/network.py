@@ -2,19 +2,57 @@
 
 
 import os
+import hashlib
 
 from ... import io
 from . import filenames as fn
 
 
-def read_network_from_proc(proc_dir_path):
+def network_fnames(proc_dir_path):
 
     model_fname = os.path.join(proc_dir_path,
                                fn.network_dirname, fn.network_fname)
     chkpt_fname = os.path.join(proc_dir_path,
                                fn.network_dirname, fn.network_chkpt)
 
-    return io.read_network(model_fname, chkpt_fname)
+    return model_fname, chkpt_fname
+
+
+def read_network_from_proc(proc_dir_path, device=None):
+
+    model_fname, chkpt_fname = network_fnames(proc_dir_path)
+
+    return io.read_network(model_fname, chkpt_fname, device=device)
+
+
+def pull_network_from_proc(proc_dir_path, local_dir=None):
+    """
+    Pulls the network files locally (within local_dir if passed),
+    returns the local filenames
+    """
+    fnames = network_fnames(proc_dir_path)
+
+    if local_dir is None:
+        return tuple(io.pull_file(f) for f in fnames)
+
+    return tuple(io.pull_file(f, os.path.join(local_dir, os.path.basename(f)))
+                 for f in fnames)
+
+
+def network_checksum(local_fnames, *params):
+    """
+    A checksum of the network files (and any other parameters which
+    affect inference) for identifying cached inference results
+    """
+    digest = hashlib.sha256()
+    for fname in local_fnames:
+        with open(fname, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+
+    digest.update(repr(params).encode())
+
+    return digest.hexdigest()[:16]
 
 
 def write_network_to_proc(net_fname, chkpt_fname, proc_dir_path):
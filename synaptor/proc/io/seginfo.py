@@ -4,6 +4,7 @@
 import os
 
 from sqlalchemy import select, text
+import numpy as np
 import pandas as pd
 
 from ... import io
@@ -107,6 +108,35 @@ def read_all_chunk_seg_infos(proc_url):
     return io.utils.make_info_arr(dframe_lookup), os.path.dirname(fnames[0])
 
 
+def pull_all_chunk_seg_info_files(proc_url):
+    """
+    Pulls the seg info files for all chunks within storage without
+    reading them. Returns an array of local filenames arranged like the
+    result of read_all_chunk_seg_infos.
+    """
+    assert not io.is_db_url(proc_url), "not implemented for database backend"
+
+    seginfo_dir = os.path.join(proc_url, fn.seginfo_dirname)
+    fnames = io.pull_directory(seginfo_dir)
+    assert len(fnames) > 0, "No filenames returned"
+
+    fname_lookup = {io.bbox_from_fname(f).min(): f for f in fnames}
+
+    return io.utils.make_info_arr(fname_lookup), os.path.dirname(fnames[0])
+
+
+def iter_chunk_seg_infos(fname_arr, batch_rows):
+    """
+    Reads the seg info files within an array of filenames in batches of at
+    most batch_rows rows. Yields (flat chunk index, DataFrame) pairs in flat
+    array order.
+    """
+    for (i, fname) in enumerate(fname_arr.flat):
+        with io.read_dframe(fname, chunksize=batch_rows) as reader:
+            for batch in reader:
+                yield i, batch
+
+
 def make_empty_df():
     """ Make an empty dataframe as a placeholder. """
     df = pd.DataFrame(data=None, dtype=int, columns=SEG_INFO_COLUMNS)
@@ -140,14 +170,17 @@ def read_mapped_seginfo_by_dst_hash(proc_url, hashval):
 def read_all_unique_seg_ids(proc_url):
     assert io.is_db_url(proc_url), "Not implemented for file IO"
 
-    metadata = io.open_db_metadata(proc_url)
-    chunk_segs = metadata.tables[CHUNKED_TABLENAME]
+    chunk_segs = io.db_table(proc_url, CHUNKED_TABLENAME)
 
-    columns = [chunk_segs.c["id"]]
+    statement = select(chunk_segs.c["id"])
 
-    statement = select(columns)
+    batches = io.iter_db_arrays(proc_url, statement,
+                                dtypes={"id": np.uint64})
+    ids = [batch["id"] for batch in batches]
 
-    return io.read_db_dframe(proc_url, statement)["id"].tolist()
+    # an array (instead of a list) of ids is 8 bytes per id
+    return (np.concatenate(ids) if len(ids) > 0
+            else np.array([], dtype=np.uint64))
 
 
 def read_merged_seg_info(proc_url, hash_index=None):
@@ -194,6 +227,28 @@ def write_merged_seg_info(dframe, proc_url, hash_tag=None):
         io.write_dframe(dframe, proc_url, filename)
 
 
+def write_merged_seg_info_parts(dframes, proc_url):
+    """
+    Writes a sequence of merged seg info dataframes to storage as a single
+    dataframe file, holding only one of them in memory at a time.
+    """
+    assert not io.is_db_url(proc_url), "not implemented for database backend"
+
+    path = os.path.join(proc_url, fn.merged_seginfo_fname)
+    local_fname = io.temp_path(path) if io.is_remote_path(path) else path
+
+    if io.backends.columnar.is_columnar_path(path):
+        io.backends.columnar.write_dframe_parts(dframes, local_fname)
+
+    else:
+        with open(local_fname, "w") as f:
+            for (i, dframe) in enumerate(dframes):
+                io.backends.local.write_dframe(dframe, f, header=(i == 0))
+
+    if io.is_remote_path(path):
+        io.send_file(local_fname, path)
+
+
 def dedup_chunk_segs(proc_url):
     assert io.is_db_url(proc_url), "not implemented for file IO"
 
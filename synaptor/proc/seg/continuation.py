@@ -95,42 +95,82 @@ def extract_all_continuations(seg):
     continuation_ids = set()
 
     for face in Face.all_faces():
-        face_continuations = list()
 
         # Pulls the 2D face arr
         extracted = face.extract(seg)
 
         # Finds which segids are in the face, and extracts the coords
         # at which each segid exists
-        segid_lookup = make_id_lookup(extracted)
+        segids, offsets, coords = make_face_arrays(extracted)
 
-        for (segid, coords) in segid_lookup.items():
-            continuation_ids.add(segid)
-            face_continuations.append(Continuation(segid, face,
-                                                   np.array(coords)))
-
-        continuations[face] = face_continuations
+        continuation_ids.update(segids.tolist())
+        continuations[face] = continuations_from_arrays(segids, offsets,
+                                                        coords, face)
 
     return continuations, continuation_ids
 
 
-def make_id_lookup(face_arr):
+def make_face_arrays(face_arr):
     """
     Takes a 2D numpy array, and finds where the values are nonzero.
-    Returns a lookup from segid to the coords at which it exists
-    """
+    Returns (1) the sorted unique segids within the face, (2) an array
+    of offsets into the coordinate array for each segid, and (3) a
+    (num_voxels, 2) array of coordinates sorted by segid.
 
+    The coordinates of segids[i] are coords[offsets[i]:offsets[i+1]],
+    and are kept in the row-major order of the face.
+    """
     x, y = np.nonzero(face_arr)
-    segids = face_arr[(x, y)]
+    voxel_ids = face_arr[(x, y)]
 
-    lookup = dict()
-    for (segid, i, j) in zip(segids, x, y):
-        if segid not in lookup:
-            lookup[segid] = [(i, j)]
-        else:
-            lookup[segid].append((i, j))
+    # stable sort keeps the row-major voxel order within each segid
+    order = np.argsort(voxel_ids, kind="stable")
+    coords = np.stack((x[order], y[order]), axis=1)
+
+    segids, starts = np.unique(voxel_ids[order], return_index=True)
+    offsets = np.append(starts, len(order))
+
+    return segids, offsets, coords
+
+
+def continuations_from_arrays(segids, offsets, coords, face):
+    """
+    Makes a Continuation for each segid whose face_coords are views
+    into the shared coordinate array (see make_face_arrays).
+    """
+    return [Continuation(segid, face, coords[begin:end])
+            for (segid, begin, end) in zip(segids.tolist(),
+                                            offsets[:-1], offsets[1:])]
+
+
+def arrays_from_continuations(continuations):
+    """
+    Packs a list of continuations from the same face into the
+    (segids, offsets, coords) layout produced by make_face_arrays.
+    """
+    segids = np.array([c.segid for c in continuations], dtype=np.uint64)
+    sizes = [len(c.face_coords) for c in continuations]
+    offsets = np.concatenate(([0], np.cumsum(sizes, dtype=np.int64)))
+
+    if len(continuations) > 0:
+        coords = np.concatenate([np.reshape(c.face_coords, (-1, 2))
+                                 for c in continuations])
+    else:
+        coords = np.zeros((0, 2), dtype=np.int64)
+
+    return segids, offsets, coords
+
+
+def make_id_lookup(face_arr):
+    """
+    Takes a 2D numpy array, and finds where the values are nonzero.
+    Returns a lookup from segid to the coords at which it exists
+    """
+    segids, offsets, coords = make_face_arrays(face_arr)
 
-    return lookup
+    return {segid: coords[begin:end]
+            for (segid, begin, end) in zip(segids.tolist(),
+                                           offsets[:-1], offsets[1:])}
 
 
 def hash_chunk_faces(chunk_begin, chunk_end, maxval):
@@ -1,5 +1,5 @@
 from . import assign_ids
-from .assign_ids import assign_unique_ids_serial 
+from .assign_ids import assign_unique_ids, assign_unique_ids_serial
 from .assign_ids import apply_chunk_id_maps, update_chunk_id_maps
 from .assign_ids import apply_id_map
 
@@ -10,5 +10,7 @@ from .merge_ccs import pair_continuation_files, match_continuations
 from . import merge_df
 from .merge_df import merge_seginfo_df, enforce_size_threshold, add_new_ids
 
+from . import spill
+
 from . import misc
 from .misc import expand_id_map
@@ -1,13 +1,23 @@
 """ Connected Component Consolidation """
 
 
+import itertools
+import multiprocessing
+import concurrent.futures
+
 import numpy as np
 
 from .. import continuation
+from ....types import IdMap
 from ... import utils
 from ... import colnames as cn
 
 
+# Continuations of the chunks being matched by a worker process
+# (see find_connected_continuations)
+_worker_continuations = None
+
+
 def pair_continuation_files(contin_files):
 
     pairs = dict()
@@ -33,20 +43,22 @@ def pair_continuation_files(contin_files):
 
 
 def merge_continuations(continuation_arr, overlap_df=None,
-                        max_face_shape=(1152, 1152), overlap_col=cn.ovl_segid):
+                        max_face_shape=(1152, 1152), overlap_col=cn.ovl_segid,
+                        parallel=1):
     """
-    Finds an id mapping to merge the continuations which match across faces
+    Finds an id mapping to merge the continuations which match across faces.
+    Face pairs are matched across a pool of `parallel` processes, and the
+    resulting edges are unioned before a single connected components pass.
     """
     matches = find_connected_continuations(continuation_arr,
-                                           max_face_shape=max_face_shape)
+                                           max_face_shape=max_face_shape,
+                                           parallel=parallel)
 
     if overlap_df is not None:
         matches = filter_matches_by_overlap(
                       matches, overlap_df, overlap_col=overlap_col)
 
-    ccs = utils.find_connected_components(matches)
-
-    return utils.make_id_map(ccs)
+    return IdMap(*utils.find_id_map(matches))
 
 
 def filter_matches_by_overlap(matches, overlap_df,
@@ -67,72 +79,154 @@ def filter_matches_by_overlap(matches, overlap_df,
 
 
 def find_connected_continuations(continuation_arr,
-                                 max_face_shape=(1152, 1152)):
+                                 max_face_shape=(1152, 1152), parallel=1):
     """
     Finds the edges of a graph which describes the continuation connectivity
+
+    When parallel > 1, the adjacent faces are split into contiguous ranges
+    which are matched across a process pool of that size. Each worker
+    receives the continuations once when it starts (shared by fork where
+    available), and reads the faces of its ranges itself.
     """
+    if parallel <= 1:
+        matches = (match_continuations(conts_here, conts_there,
+                                       face_shape=max_face_shape)
+                   for (conts_here, conts_there)
+                   in adjacent_face_pairs(continuation_arr))
+
+        return list(itertools.chain.from_iterable(matches))
+
+    face_indices = list(adjacent_face_indices(continuation_arr.shape))
+    if len(face_indices) == 0:
+        return list()
+
+    num_ranges = min(len(face_indices), 4 * parallel)
+    bounds = np.linspace(0, len(face_indices), num_ranges + 1).astype(int)
+    face_ranges = [face_indices[begin:end]
+                   for (begin, end) in zip(bounds[:-1], bounds[1:])]
+
+    # forked workers share the continuations instead of unpickling a copy
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = None
 
-    sizes = continuation_arr.shape
-    face_checked = np.zeros((6,) + continuation_arr.shape, dtype=np.bool)
-    matches = []
+    with concurrent.futures.ProcessPoolExecutor(
+             parallel, mp_context=context,
+             initializer=set_worker_continuations,
+             initargs=(continuation_arr,)) as executor:
+        matches = executor.map(match_face_range, face_ranges,
+                               itertools.repeat(max_face_shape))
 
-    for index in np.ndindex(sizes):
+        return list(itertools.chain.from_iterable(matches))
 
-        for face in continuation.Face.all_faces():
 
-            # bounds checking
-            if face.hi_index and index[face.axis] == sizes[face.axis] - 1:
-                continue
-            if not face.hi_index and index[face.axis] == 0:
-                continue
+def set_worker_continuations(continuation_arr):
+    """ Process pool initializer for find_connected_continuations """
+    global _worker_continuations
+    _worker_continuations = continuation_arr
 
-            # if we've processed the other side already
-            if face_checked[(face.axis + 3*face.hi_index,) + index]:
+
+def match_face_range(face_indices, max_face_shape=(1152, 1152)):
+    """
+    Matches a range of adjacent faces (see adjacent_face_indices) against
+    the continuations of a worker process (see set_worker_continuations)
+    """
+    matches = list()
+    for (index, axis, next_index) in face_indices:
+        face = continuation.Face(axis, True)
+        matches.extend(match_continuations(
+                           _worker_continuations[index][face],
+                           _worker_continuations[next_index][face.opposite()],
+                           face_shape=max_face_shape))
+
+    return matches
+
+
+def adjacent_face_pairs(continuation_arr):
+    """
+    Generates the (continuations, opposing continuations) for each pair of
+    touching faces between adjacent chunks. The high face of the lower
+    chunk comes first within each pair.
+    """
+    for (index, axis, next_index) in adjacent_face_indices(
+                                         continuation_arr.shape):
+        face = continuation.Face(axis, True)
+
+        yield (continuation_arr[index][face],
+               continuation_arr[next_index][face.opposite()])
+
+
+def adjacent_face_indices(sizes):
+    """
+    Generates (chunk index, axis, next chunk index) for each pair of
+    touching faces between adjacent chunks, where the next chunk is one
+    step higher along the axis.
+    """
+    for index in np.ndindex(sizes):
+        for axis in range(3):
+
+            # bounds checking
+            if index[axis] == sizes[axis] - 1:
                 continue
-            else:
-                face_checked[(face.axis + 3*face.hi_index,) + index] = True
 
             index_to_check = list(index)
-            if face.hi_index:
-                index_to_check[face.axis] += 1
-            else:
-                index_to_check[face.axis] -= 1
-            index_to_check = tuple(index_to_check)
-            oppface = face.opposite()
+            index_to_check[axis] += 1
+
+            yield index, axis, tuple(index_to_check)
 
-            face_checked[(oppface.axis + 3*oppface.hi_index,)
-                         + index_to_check] = True
 
-            conts_here = continuation_arr[index][face]
-            conts_there = continuation_arr[index_to_check][oppface]
+def match_continuations(conts1, conts2, face_shape=(1152, 1152)):
+    """
+    Determines which continuations match within the two lists
 
-            new_matches = match_continuations(conts_here, conts_there,
-                                              face_shape=max_face_shape)
+    Each side's face coordinates are linearized into flat indices and
+    joined by a sorted intersection, so the cost scales with the number
+    of continuation voxels instead of the face area. face_shape only
+    sets the linearization stride (and grows to fit larger coordinates).
+    """
+    return match_face_voxels(face_voxels(conts1), face_voxels(conts2),
+                             face_shape=face_shape)
 
-            matches.extend(new_matches)
 
-    return matches
+def match_face_voxels(voxels1, voxels2, face_shape=(1152, 1152)):
+    """
+    Matches two faces packed as (segids, coords) voxel arrays
+    (see face_voxels). Returns the unique pairs of touching segids.
+    """
+    ids1, coords1 = voxels1
+    ids2, coords2 = voxels2
 
+    if len(ids1) == 0 or len(ids2) == 0:
+        return list()
 
-def match_continuations(conts1, conts2, face_shape=(1152, 1152)):
-    """ Determines which continuations match within the two lists """
+    shape = tuple(np.maximum(face_shape,
+                             np.maximum(coords1.max(0), coords2.max(0)) + 1))
+    inds1 = np.ravel_multi_index(tuple(coords1.T), shape)
+    inds2 = np.ravel_multi_index(tuple(coords2.T), shape)
 
-    face1 = reconstruct_face(conts1, shape=face_shape)
-    face2 = reconstruct_face(conts2, shape=face_shape)
+    _, i1, i2 = np.intersect1d(inds1, inds2, return_indices=True)
 
-    intersection_mask = np.logical_and(face1 != 0, face2 != 0)
+    pairs = np.unique(np.stack((ids1[i1], ids2[i2]), axis=1), axis=0)
 
-    matches1 = face1[intersection_mask]
-    matches2 = face2[intersection_mask]
+    return list(map(tuple, pairs.tolist()))
 
-    return list(set(zip(matches1, matches2)))
 
+def face_voxels(continuations):
+    """
+    Concatenates the face coordinates of a list of continuations. Returns
+    the segid of each voxel alongside a (num_voxels, 2) coordinate array.
+    Continuations mapped to 0 are ignored.
+    """
+    continuations = [c for c in continuations if c.segid != 0]
 
-def reconstruct_face(continuations, shape=(1152, 1152)):
+    if len(continuations) == 0:
+        return np.zeros((0,), dtype=np.uint64), np.zeros((0, 2), dtype=int)
 
-    face = np.zeros(shape, dtype=np.uint32)
+    segids = np.array([c.segid for c in continuations], dtype=np.uint64)
+    sizes = [len(c.face_coords) for c in continuations]
 
-    for c in continuations:
-        face[tuple(c.face_coords.T)] = c.segid
+    coords = np.concatenate([np.reshape(c.face_coords, (-1, 2))
+                             for c in continuations])
 
-    return face
+    return np.repeat(segids, sizes), coords.astype(int)
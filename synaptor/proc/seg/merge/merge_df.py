@@ -1,64 +1,86 @@
 """ Merging Segment Info Dataframes. """
 
 
+import numpy as np
 import pandas as pd
 
+from ....types import IdMap
 from ... import colnames as cn
 
 
 def add_new_ids(seginfo_df, mapping, new_id_colname="new_ids"):
-    seginfo_df[new_id_colname] = seginfo_df.index.map(mapping)
+    if isinstance(mapping, IdMap):
+        # unmapped ids keep their own id
+        segids = seginfo_df.index.values
+        seginfo_df[new_id_colname] = mapping.lookup(segids, default=segids)
+    else:
+        seginfo_df[new_id_colname] = seginfo_df.index.map(mapping)
 
 
 def merge_seginfo_df(seginfo_df, new_id_colname="new_ids"):
-
+    """
+    Merges the rows of a seginfo DataFrame which map to the same new id
+    (rows without a new id keep their own id). Sizes are summed, centroids
+    are averaged by size, bounding boxes are merged, and all other fields
+    are taken from the largest segment of each group.
+
+    Sorts the rows once by new id and reduces each contiguous run of rows
+    with ufunc.reduceat instead of pandas groupby and merge operations.
+    """
     seginfo_df = seginfo_df.reset_index()
     if "index" in seginfo_df.columns:
         seginfo_df = seginfo_df.drop(["index"], axis=1)
 
-    # computing grouped stats
-    grouped = seginfo_df.groupby(new_id_colname)
-    szs = grouped[cn.size].sum()
-    bbox1 = grouped[cn.bbox_cols[:3]].min()
-    bbox2 = grouped[cn.bbox_cols[-3:]].max()
-    coms = compute_centroids(seginfo_df, szs, new_id_colname=new_id_colname)
+    segids = seginfo_df[cn.seg_id].values
+    new_ids = seginfo_df[new_id_colname].values
 
     # setting index to the original if not remapped
-    no_new_id = pd.isnull(seginfo_df[new_id_colname])
-    seginfo_df.loc[no_new_id, new_id_colname] = seginfo_df.loc[no_new_id,
-                                                              cn.seg_id]
-    # taking all other fields from largest cleft
-    new_df = seginfo_df.sort_values([cn.size]).drop_duplicates(new_id_colname)
-
-    # recreating index
-    new_df = new_df.drop([cn.seg_id], axis=1)
-    new_df = new_df.rename(columns={new_id_colname: cn.seg_id})
-    new_df = new_df.set_index(cn.seg_id)
-
-    new_df.update(coms)
-    new_df.update(bbox1)
-    new_df.update(bbox2)
-    new_df.update(szs)
-
-    return new_df
-
-
-def compute_centroids(df, szs, new_id_colname="new_ids"):
+    no_new_id = pd.isnull(new_ids)
+    id_dtype = (new_ids.dtype if np.issubdtype(new_ids.dtype, np.integer)
+                else segids.dtype)
+    new_ids = np.where(no_new_id, segids, new_ids).astype(id_dtype)
+
+    order = np.argsort(new_ids, kind="stable")
+    sorted_ids = new_ids[order]
+    num_rows = len(sorted_ids)
+
+    is_start = np.ones((num_rows,), dtype=bool)
+    is_start[1:] = sorted_ids[1:] != sorted_ids[:-1]
+    starts = np.flatnonzero(is_start)
+    group_ids = sorted_ids[starts]
+
+    new_df = seginfo_df.drop([cn.seg_id, new_id_colname], axis=1)
+    if num_rows == 0:
+        new_df.index = pd.Index(group_ids, name=cn.seg_id)
+        return new_df
+
+    # taking all other fields from the largest segment
+    sizes = seginfo_df[cn.size].values[order]
+    max_sizes = np.maximum.reduceat(sizes, starts)
+    group_sizes = np.diff(np.append(starts, num_rows))
+    is_max = sizes == np.repeat(max_sizes, group_sizes)
+    first_max = np.minimum.reduceat(np.where(is_max, np.arange(num_rows),
+                                             num_rows), starts)
+    new_df = new_df.iloc[order[first_max]]
+    new_df.index = pd.Index(group_ids, name=cn.seg_id)
 
-    szs = szs.reset_index()
-    szs = szs.rename(columns={cn.size: "total_size"})
-
-    centroid_df = pd.merge(df[cn.centroid_cols + [cn.size, new_id_colname]],
-                           szs, how="left", on=new_id_colname)
-
-    # This will create NANs, but those will disappear after grouping
-    centroid_df[cn.size] /= centroid_df["total_size"]
-
-    centroid_df[cn.centroid_x] *= centroid_df[cn.size]
-    centroid_df[cn.centroid_y] *= centroid_df[cn.size]
-    centroid_df[cn.centroid_z] *= centroid_df[cn.size]
+    # computing grouped stats
+    szs = np.add.reduceat(sizes, starts)
+    centroids = seginfo_df[cn.centroid_cols].values[order].astype(float)
+    coms = np.add.reduceat(centroids * sizes[:, np.newaxis], starts)
+    coms = np.divide(coms, szs[:, np.newaxis], out=np.zeros_like(coms),
+                     where=szs[:, np.newaxis] != 0)
+    bbox1 = np.minimum.reduceat(seginfo_df[cn.bbox_cols[:3]].values[order],
+                                starts)
+    bbox2 = np.maximum.reduceat(seginfo_df[cn.bbox_cols[-3:]].values[order],
+                                starts)
+
+    new_df[cn.size] = szs
+    new_df[cn.centroid_cols] = coms.astype(int)
+    new_df[cn.bbox_cols[:3]] = bbox1
+    new_df[cn.bbox_cols[-3:]] = bbox2
 
-    return centroid_df.groupby(new_id_colname)[cn.centroid_cols].sum().astype(int)
+    return new_df
 
 
 def enforce_size_threshold(seginfo_df, size_thr):
@@ -17,6 +17,10 @@ def make_map_dframe(id_map):
     return df
 
 
+def make_map_dframe_from_arrays(src_ids, dst_ids):
+    return pd.DataFrame({cn.src_id: src_ids, cn.dst_id: dst_ids})
+
+
 def empty_map_df():
     columns = [cn.src_id, cn.dst_id]
     return pd.DataFrame({k: [] for k in columns})
@@ -0,0 +1,184 @@
+"""
+Out-of-core Segment Info Merging
+
+Merges chunk seginfo DataFrames that don't fit in memory together. Rows are
+read in bounded batches, spilled to local disk, partitioned by the hash of
+their destination id, and each partition is merged independently.
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from ....types import IdMap
+from ... import colnames as cn
+from ... import hashing
+from .assign_ids import empty_obj_array
+from .merge_df import add_new_ids, merge_seginfo_df, enforce_size_threshold
+
+
+# rough in-memory size of one seginfo row (incl. parsing overhead)
+SEGINFO_ROW_BYTES = 256
+# peak memory of merging a partition relative to its stored size
+PARTITION_OVERHEAD = 4
+
+
+class SpillFiles(object):
+    """
+    SpillFiles - a set of DataFrame partitions on local disk. Each partition
+    is a single file of DataFrame batches pickled one after another, so
+    batches can be appended without reading the partition back.
+    """
+
+    def __init__(self, dirname, num_parts, tag="part"):
+        self.dirname = dirname
+        self.num_parts = num_parts
+        self.fnames = [os.path.join(dirname, f"{tag}_{i}.pkl")
+                       for i in range(num_parts)]
+        self.nbytes = 0
+        self._files = dict()
+
+    def append(self, part, dframe):
+        if part not in self._files:
+            self._files[part] = open(self.fnames[part], "ab")
+
+        pickle.dump(dframe, self._files[part],
+                    protocol=pickle.HIGHEST_PROTOCOL)
+        self.nbytes += int(dframe.memory_usage(index=True).sum())
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = dict()
+
+    def iter_batches(self, part):
+        """ Yields the batches of a partition in the order they were added """
+        self.close()
+        if not os.path.exists(self.fnames[part]):
+            return
+
+        with open(self.fnames[part], "rb") as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    def read(self, part):
+        """ Reads a full partition, or None if nothing was added to it """
+        batches = list(self.iter_batches(part))
+
+        return pd.concat(batches, copy=False) if len(batches) > 0 else None
+
+    def remove(self):
+        self.close()
+        for fname in self.fnames:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+
+def make_spill_dir(parent_dir=None):
+    return tempfile.mkdtemp(prefix="seginfo_spill_", dir=parent_dir)
+
+
+def remove_spill_dir(dirname):
+    shutil.rmtree(dirname, ignore_errors=True)
+
+
+def batch_rows(memory_budget):
+    """ The number of seginfo rows to read at once within a memory budget """
+    return max(1, memory_budget // (PARTITION_OVERHEAD * SEGINFO_ROW_BYTES))
+
+
+def num_partitions(nbytes, memory_budget):
+    """ The number of partitions needed to merge each within the budget """
+    return max(1, int(np.ceil(PARTITION_OVERHEAD * nbytes / memory_budget)))
+
+
+def spill_unique_ids(seginfo_batches, chunk_shape, spill):
+    """
+    Assigns new ids to every cleft segment like assign_unique_ids, but
+    streams over (flat chunk index, DataFrame) batches, and appends each
+    remapped batch to the first partition of a SpillFiles object instead
+    of concatenating them. Batches must arrive in flat chunk order.
+
+    Returns:
+        -A nparray of id maps for each chunk
+    """
+    old_ids = [list() for _ in range(int(np.prod(chunk_shape)))]
+    next_id = 1
+
+    for (i, batch) in seginfo_batches:
+        if len(batch) == 0:
+            continue
+
+        ids = np.asarray(batch.index.values, dtype=np.uint64)
+        new_ids = np.arange(next_id, next_id+len(ids), dtype=np.uint64)
+        next_id += len(ids)
+
+        batch.index = pd.Index(new_ids, name=batch.index.name)
+        spill.append(0, batch)
+        old_ids[i].append(ids)
+
+    chunk_id_maps = empty_obj_array(chunk_shape)
+    next_id = 1
+    for (i, ids) in enumerate(old_ids):
+        ids = np.concatenate(ids) if len(ids) > 0 else np.array([], np.uint64)
+        chunk_id_maps.flat[i] = IdMap(ids, np.arange(next_id,
+                                                     next_id+len(ids)))
+        next_id += len(ids)
+
+    return chunk_id_maps
+
+
+def partition_by_dst_id(spill, cont_id_map, parts_spill):
+    """
+    Adds the destination id of each spilled row by cont_id_map, and
+    redistributes the rows across the partitions of parts_spill by the
+    hash of their destination id. All rows mapping to the same id end up
+    in the same partition.
+    """
+    for batch in spill.iter_batches(0):
+        add_new_ids(batch, cont_id_map, new_id_colname=cn.dst_id)
+        parts = hashing.hash_ids(batch[cn.dst_id].values,
+                                 parts_spill.num_parts)
+
+        for part in np.unique(parts):
+            parts_spill.append(part, batch[parts == part])
+
+    parts_spill.close()
+
+    return parts_spill
+
+
+def merge_partitions(parts_spill, merged_spill, size_thr=None):
+    """
+    Merges each partition with merge_seginfo_df, and writes the result to
+    the same partition of merged_spill. Segments under size_thr (if given)
+    are removed from each partition.
+
+    Returns:
+        -An id map that sets the removed segments to 0
+    """
+    size_thr_map = dict()
+
+    for part in range(parts_spill.num_parts):
+        part_df = parts_spill.read(part)
+        if part_df is None:
+            continue
+
+        merged = merge_seginfo_df(part_df, new_id_colname=cn.dst_id)
+        del part_df
+
+        if size_thr is not None:
+            size_thr_map.update(enforce_size_threshold(merged, size_thr))
+
+        merged_spill.append(part, merged)
+
+    merged_spill.close()
+
+    return size_thr_map
@@ -70,7 +70,8 @@ def cc_task(desc_vol, cc_thresh, sz_thresh,
 
 
 def merge_ccs_task(cont_info_arr, cleft_info_arr,
-                   size_thr, max_face_shape, enforce_overlaps=False):
+                   size_thr, max_face_shape, enforce_overlaps=False,
+                   parallel=1):
     """
     -Assigns a global set of cleft segment ids
     -Finds which continuations match across chunks
@@ -85,7 +86,7 @@ def merge_ccs_task(cont_info_arr, cleft_info_arr,
     """
 
     cons_cleft_info, chunk_id_maps = timed("Assigning new cleft ids",
-                                           seg.merge.assign_unique_ids_serial,
+                                           seg.merge.assign_unique_ids,
                                            cleft_info_arr)
 
     cont_info_arr = timed("Applying chunk_id_maps to continuations",
@@ -97,7 +98,8 @@ def merge_ccs_task(cont_info_arr, cleft_info_arr,
                         cont_info_arr, max_face_shape=max_face_shape,
                         overlap_df=(cons_cleft_info
                                     if enforce_overlaps
-                                    else None))
+                                    else None),
+                        parallel=parallel)
 
     chunk_id_maps = timed("Updating chunk id maps",
                           seg.merge.update_chunk_id_maps,
@@ -122,6 +124,61 @@ def merge_ccs_task(cont_info_arr, cleft_info_arr,
     return cons_cleft_info, chunk_id_maps
 
 
+def merge_ccs_spilled_task(cont_info_arr, seginfo_batches, chunk_shape,
+                           size_thr, max_face_shape, memory_budget,
+                           spill_dir, parallel=1):
+    """
+    Out-of-core version of merge_ccs_task for cleft info that doesn't fit
+    in memory. Reads (flat chunk index, DataFrame) batches of chunk cleft
+    info, and spills them to spill_dir while assigning global ids. The
+    rows are then partitioned by the hash of their merged id, and each
+    partition is merged separately so that roughly memory_budget bytes
+    are used at a time.
+
+    Returns:
+        -A SpillFiles object with one merged cleft DataFrame per partition
+        -A nparray of id maps for each chunk
+    """
+    spill = seg.merge.spill
+
+    id_spill = spill.SpillFiles(spill_dir, 1, tag="unique_ids")
+    chunk_id_maps = timed("Assigning new cleft ids and spilling cleft infos",
+                          spill.spill_unique_ids,
+                          seginfo_batches, chunk_shape, id_spill)
+
+    cont_info_arr = timed("Applying chunk_id_maps to continuations",
+                          seg.merge.apply_chunk_id_maps,
+                          cont_info_arr, chunk_id_maps)
+
+    cont_id_map = timed("Merging connected continuations",
+                        seg.merge.merge_continuations,
+                        cont_info_arr, max_face_shape=max_face_shape,
+                        parallel=parallel)
+
+    chunk_id_maps = timed("Updating chunk id maps",
+                          seg.merge.update_chunk_id_maps,
+                          chunk_id_maps, cont_id_map)
+
+    num_parts = spill.num_partitions(id_spill.nbytes, memory_budget)
+    parts_spill = spill.SpillFiles(spill_dir, num_parts, tag="dst_ids")
+    timed(f"Partitioning cleft infos by merged id ({num_parts} partitions)",
+          spill.partition_by_dst_id,
+          id_spill, cont_id_map, parts_spill)
+    id_spill.remove()
+
+    merged_spill = spill.SpillFiles(spill_dir, num_parts, tag="merged")
+    size_thr_map = timed("Merging cleft dataframe partitions",
+                         spill.merge_partitions,
+                         parts_spill, merged_spill, size_thr=size_thr)
+    parts_spill.remove()
+
+    chunk_id_maps = timed("Updating chunk id maps (for size thresholding)",
+                          seg.merge.update_chunk_id_maps,
+                          chunk_id_maps, size_thr_map)
+
+    return merged_spill, chunk_id_maps
+
+
 def match_continuations_task(contins1, contins2, max_face_shape=(1024, 1024),
                              id_map1=None, id_map2=None):
 
@@ -139,21 +196,13 @@ def match_continuations_task(contins1, contins2, max_face_shape=(1024, 1024),
 
 
 def seg_graph_cc_task(graph_edges, hashmax, all_ids):
-    ccs = timed("Finding connected components",
-                utils.find_connected_components,
-                graph_edges)
-
-    seg_merge_map = timed("Making seg merge_map",
-                          utils.make_id_map,
-                          ccs)
-
-    seg_merge_map = timed("Expanding mapping to include all ids",
-                          seg.merge.expand_id_map,
-                          seg_merge_map, all_ids)
+    src_ids, dst_ids = timed("Finding connected components (incl. all ids)",
+                             utils.find_id_map,
+                             graph_edges, ids=all_ids)
 
     seg_merge_df = timed("Making map dataframe",
-                         seg.merge.misc.make_map_dframe,
-                         seg_merge_map)
+                         seg.merge.misc.make_map_dframe_from_arrays,
+                         src_ids, dst_ids)
 
     seg_merge_df = timed("Hashing dst id",
                          hashing.add_hashed_index,
@@ -183,16 +232,22 @@ def merge_seginfo_task(seginfo_dframe, szthresh=None):
 def edge_task(img, clefts, seg, assoc_net,
               patchsz, offset=(0, 0, 0), root_seg=None,
               samples_per_cleft=2, dil_param=5,
-              id_map=None, hashmax=None, hash_fillval=-1):
+              id_map=None, hashmax=None, hash_fillval=-1,
+              batch_size=8,
+              device=None, precision="fp32", cached_weights=None,
+              return_weights=False):
     """
     -Applies an id map to a chunk (if passed)
     NOTE: Modifies the clefts array if id_map exists
     -Applies an assignment network to each cleft in the chunk
+     (skipping the clefts with cached_weights from a previous run)
     -Computes the sizes of each cleft to assist later thresholding
     -Returns all of the computed information in a DataFrame
 
     Returns:
      -A DataFrame of info for each edge within this chunk
+     -A DataFrame of the network output weights for each cleft
+      (see edge/weights.py), only if return_weights=True
     """
 
     if id_map is not None:
@@ -200,12 +255,22 @@ def edge_task(img, clefts, seg, assoc_net,
                        seg_utils.relabel_data,
                        clefts, id_map, copy=False)
 
+    if cached_weights is not None:
+        cached_weights = edge.weights.split_weight_dframe(cached_weights)
+
     edges = timed("Inferring edges",
                   edge.infer_edges,
                   assoc_net, img, clefts, seg,
                   offset=offset, patchsz=patchsz,
                   samples_per_cleft=samples_per_cleft,
-                  root_seg=root_seg, dil_param=dil_param)
+                  root_seg=root_seg, dil_param=dil_param,
+                  batch_size=batch_size, device=device,
+                  precision=precision,
+                  cached_weights=cached_weights,
+                  return_weights=return_weights)
+
+    if return_weights:
+        edges, weights = edges
 
     edges = timed("Computing cleft size and adding it to dframe",
                   edge.add_cleft_sizes,
@@ -223,6 +288,13 @@ def edge_task(img, clefts, seg, assoc_net,
                       edges, [cn.seg_id], hashmax,
                       indexname=cn.clefthash)
 
+    if return_weights:
+        weights = timed("Making weight dframe",
+                        edge.weights.make_weight_dframe,
+                        *weights)
+
+        return edges, weights
+
     return edges
 
 
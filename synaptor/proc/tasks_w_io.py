@@ -6,6 +6,11 @@ Storage) or (2) a SQLAlchemy-supported database.
 
 
 import time
+import shutil
+import inspect
+import tempfile
+import contextlib
+import concurrent.futures
 
 from .. import io
 from .. import types
@@ -19,6 +24,23 @@ from . import norm
 from . import colnames as cn
 
 
+# Number of concurrent reads while gathering the inputs of an edge task
+EDGE_READ_THREADS = 5
+
+# Edge task inputs being read in the background (see prefetch_edge_task)
+# At most PREFETCH_LIMIT are kept, and the oldest is dropped beyond that
+PREFETCH_LIMIT = 2
+_prefetched_edge_inputs = dict()
+_prefetch_executor = None
+# Whether edge_task calls only prefetch their inputs (see prefetching)
+_prefetching = False
+
+# Networks prepared so far, keyed by their checksum and inference settings
+# (see load_network)
+NETWORK_CACHE_SIZE = 4
+_networks = dict()
+
+
 def cc_task(desc_cvname, seg_cvname, storagestr,
             cc_thresh, sz_thresh, chunk_begin, chunk_end,
             mip=0, parallel=1, storagedir=None, hashmax=100,
@@ -83,16 +105,19 @@ def cc_task(desc_cvname, seg_cvname, storagestr,
         #  you can create "phantom" segments in the database that don't
         #  really exist in the segmentation volume.
         #  These phantoms create further problems later.
-        timed("Writing results to the database",
-              io.write_db_dframes,
-              [fhash_df, seginfo_df], storagestr,
-              [fhash_tablename, seginfo_tablename])
+        # The unique ids assigned to each segment are returned by the
+        #  insert itself
+        returned = timed("Writing results to the database",
+                         io.write_db_dframes,
+                         [fhash_df, seginfo_df], storagestr,
+                         [fhash_tablename, seginfo_tablename],
+                         returning={seginfo_tablename:
+                                    taskio.idmap.UNIQUE_ID_MAP_COLUMNS})
 
         # Writing a backup unique ids mapping to file storage to
         # make match_contins faster
-        unique_ids = timed(f"Reading unique ids for chunk {chunk_bounds}",
-                           taskio.read_chunk_unique_ids,
-                           storagestr, chunk_bounds)
+        unique_ids = taskio.idmap.unique_id_dframe_to_map(
+                         returned[seginfo_tablename])
 
         timed("Writing unique ids to file storage",
               taskio.write_chunk_unique_ids,
@@ -109,7 +134,15 @@ def cc_task(desc_cvname, seg_cvname, storagestr,
               time.time() - start_time, "ccs", timing_tag, storagestr)
 
 
-def merge_ccs_task(storagestr, size_thr, max_face_shape, timing_tag=None):
+def merge_ccs_task(storagestr, size_thr, max_face_shape,
+                   parallel=1, memory_budget=None, spill_dir=None,
+                   timing_tag=None):
+    """
+    Merges the connected components of every chunk. If memory_budget (in
+    bytes) is given, the cleft infos are streamed from storage and merged
+    out-of-core by spilling partitions to a temporary directory within
+    spill_dir (default: the system temp dir).
+    """
 
     start_time = time.time()
 
@@ -117,25 +150,31 @@ def merge_ccs_task(storagestr, size_thr, max_face_shape, timing_tag=None):
                              taskio.read_all_continuations,
                              storagestr)
 
-    cleft_info_arr, local_dir = timed("Reading cleft infos",
-                                      taskio.read_all_chunk_seg_infos,
-                                      storagestr)
+    if memory_budget is not None:
+        merge_ccs_spilled(storagestr, cont_info_arr, size_thr,
+                          max_face_shape, memory_budget,
+                          spill_dir=spill_dir, parallel=parallel)
 
-    chunk_bounds = io.extract_sorted_bboxes(local_dir)
+    else:
+        cleft_info_arr, local_dir = timed("Reading cleft infos",
+                                          taskio.read_all_chunk_seg_infos,
+                                          storagestr)
 
-    # Processing
-    cons_cleft_info, chunk_id_maps = tasks.merge_ccs_task(cont_info_arr,
-                                                          cleft_info_arr,
-                                                          size_thr,
-                                                          max_face_shape)
+        chunk_bounds = io.extract_sorted_bboxes(local_dir)
 
-    timed("Writing merged cleft info",
-          taskio.write_merged_seg_info,
-          cons_cleft_info, storagestr)
+        # Processing
+        cons_cleft_info, chunk_id_maps = tasks.merge_ccs_task(
+                                             cont_info_arr, cleft_info_arr,
+                                             size_thr, max_face_shape,
+                                             parallel=parallel)
 
-    timed("Writing chunk id maps",
-          taskio.write_chunk_id_maps,
-          chunk_id_maps, chunk_bounds, storagestr)
+        timed("Writing merged cleft info",
+              taskio.write_merged_seg_info,
+              cons_cleft_info, storagestr)
+
+        timed("Writing chunk id maps",
+              taskio.write_chunk_id_maps,
+              chunk_id_maps, chunk_bounds, storagestr)
 
     if timing_tag is not None:
         timed("Writing total task time",
@@ -143,6 +182,40 @@ def merge_ccs_task(storagestr, size_thr, max_face_shape, timing_tag=None):
               time.time() - start_time, "merge_ccs", timing_tag, storagestr)
 
 
+def merge_ccs_spilled(storagestr, cont_info_arr, size_thr, max_face_shape,
+                      memory_budget, spill_dir=None, parallel=1):
+    """ Out-of-core cleft info merging for merge_ccs_task """
+    fname_arr, local_dir = timed("Pulling cleft info files",
+                                 taskio.pull_all_chunk_seg_info_files,
+                                 storagestr)
+
+    chunk_bounds = io.extract_sorted_bboxes(local_dir)
+
+    batch_rows = seg.merge.spill.batch_rows(memory_budget)
+    seginfo_batches = taskio.iter_chunk_seg_infos(fname_arr, batch_rows)
+
+    spill_dir = seg.merge.spill.make_spill_dir(spill_dir)
+    try:
+        merged_spill, chunk_id_maps = tasks.merge_ccs_spilled_task(
+                                          cont_info_arr, seginfo_batches,
+                                          fname_arr.shape, size_thr,
+                                          max_face_shape, memory_budget,
+                                          spill_dir, parallel=parallel)
+
+        merged_parts = (merged_spill.read(i)
+                        for i in range(merged_spill.num_parts))
+        timed("Writing merged cleft info",
+              taskio.write_merged_seg_info_parts,
+              (df for df in merged_parts if df is not None), storagestr)
+
+    finally:
+        seg.merge.spill.remove_spill_dir(spill_dir)
+
+    timed("Writing chunk id maps",
+          taskio.write_chunk_id_maps,
+          chunk_id_maps, chunk_bounds, storagestr)
+
+
 def match_continuations_task(
         storagestr, storagedir, facehash,
         max_face_shape=(1024, 1024), timing_tag=None):
@@ -297,7 +370,9 @@ def edge_task(img_cvname, cleft_cvname, seg_cvname,
               lower_clip_frac=0.01, upper_clip_frac=0.01,
               aggscratchpath=None, aggchunksize=None,
               aggstartcoord=None, aggmaxmip=11,
-              timing_tag=None):
+              batch_size=8,
+              device=None, num_threads=None, precision="fp32", jit=False,
+              cache_weights=False, timing_tag=None):
     """
     Runs tasks.chunk_edges_task after reading the relevant
     cloud volume chunks and downsampling the cleft volume
@@ -313,10 +388,157 @@ def edge_task(img_cvname, cleft_cvname, seg_cvname,
 
     base_res_{begin,end} specify a base level bbox in case upsampling the
     other chunk bounds doesn't translate to the same box (e.g. 3//2*2)
+
+    device picks where the network runs (default: CUDA if available,
+    otherwise the CPU with num_threads threads). See edge/device.py for
+    the precision and jit options.
+
+    cache_weights=True stores the summed network outputs for each cleft
+    under {storagestr}/edge_weights, keyed by chunk and by a checksum of
+    the network, input volumes, chunk id map and inference parameters
+    (see edge_weights_checksum). Reruns with different scoring or
+    assignment parameters then skip inference for cached clefts.
+
+    The input volumes are read concurrently (or taken from a previous
+    prefetch_edge_task call), and each version of the network is loaded
+    once per process. Within a prefetching() block, this only starts
+    reading the inputs in the background.
     """
 
     start_time = time.time()
 
+    storagedir = storagestr if storagedir is None else storagedir
+
+    read_args = dict(img_cvname=img_cvname, cleft_cvname=cleft_cvname,
+                     seg_cvname=seg_cvname, chunk_begin=chunk_begin,
+                     chunk_end=chunk_end, storagestr=storagestr,
+                     resolution=resolution, num_downsamples=num_downsamples,
+                     base_res_begin=base_res_begin,
+                     base_res_end=base_res_end, parallel=parallel,
+                     storagedir=storagedir, normcloudpath=normcloudpath,
+                     lower_clip_frac=lower_clip_frac,
+                     upper_clip_frac=upper_clip_frac,
+                     aggscratchpath=aggscratchpath,
+                     aggchunksize=aggchunksize,
+                     aggstartcoord=aggstartcoord, aggmaxmip=aggmaxmip)
+
+    if _prefetching:
+        prefetch_edge_task(**read_args)
+        return
+
+    edge.device.set_num_threads(num_threads)
+
+    inputs = take_prefetched_edge_inputs(read_args)
+    if inputs is None:
+        inputs = read_edge_inputs(**read_args)
+
+    img, clefts, seg = inputs["img"], inputs["clefts"], inputs["seg"]
+    chunk_id_map, net_fnames = inputs["id_map"], inputs["net_fnames"]
+    base_bounds = inputs["base_bounds"]
+
+    try:
+        assoc_net = timed("Loading association network",
+                          load_network,
+                          net_fnames, device=device, precision=precision,
+                          jit=jit)
+
+        if cache_weights:
+            checksum = timed("Computing edge weight checksum",
+                             edge_weights_checksum,
+                             net_fnames, chunk_id_map, patchsz,
+                             samples_per_cleft, dil_param, precision,
+                             **read_args)
+    finally:
+        remove_edge_inputs(inputs)
+
+    assert img.shape == clefts.shape == seg.shape, "mismatched volumes"
+
+    cached_weights = None
+    if cache_weights:
+        cached_weights = timed("Reading cached edge weights",
+                               taskio.read_chunk_edge_weights,
+                               storagestr, base_bounds, checksum)
+
+    edge_info = tasks.edge_task(
+                    img, clefts, seg, assoc_net,
+                    patchsz, offset=chunk_begin,
+                    id_map=chunk_id_map, root_seg=None,
+                    samples_per_cleft=samples_per_cleft,
+                    dil_param=dil_param, hashmax=hashmax,
+                    batch_size=batch_size, device=device,
+                    precision=precision,
+                    cached_weights=cached_weights,
+                    return_weights=cache_weights)
+
+    if cache_weights:
+        edge_info, weights = edge_info
+        timed("Writing edge weights",
+              taskio.write_chunk_edge_weights,
+              weights, storagestr, base_bounds, checksum)
+
+    if num_downsamples > 0:
+        edge_info = timed("Up-sampling edge information",
+                          edge.upsample_edge_info,
+                          edge_info, num_downsamples, chunk_begin)
+
+    timed("Writing chunk edges",
+          taskio.write_chunk_edge_info,
+          edge_info, storagestr, base_bounds)
+
+    if timing_tag is not None:
+        timed("Writing total task time",
+              taskio.write_task_timing,
+              time.time() - start_time, "edge", timing_tag, storagestr)
+
+
+def edge_weights_checksum(net_fnames, chunk_id_map, patchsz,
+                          samples_per_cleft, dil_param, precision,
+                          img_cvname, cleft_cvname, seg_cvname,
+                          resolution=(4, 4, 40), num_downsamples=0,
+                          normcloudpath=None,
+                          lower_clip_frac=0.01, upper_clip_frac=0.01,
+                          aggscratchpath=None, aggchunksize=None,
+                          aggstartcoord=None, aggmaxmip=11, **unused):
+    """
+    A checksum of everything that determines the cached network output
+    weights of a chunk (besides the chunk itself): the network files,
+    the input volumes and how they're read, the cleft ids assigned by
+    merge_ccs (the chunk id map), and the inference parameters. Any extra
+    (read_edge_inputs) keyword arguments are ignored.
+    """
+    id_map_checksum = types.IdMap.from_dict(chunk_id_map).checksum()
+
+    def listlike(v):
+        return tuple(v) if isinstance(v, (list, tuple)) else v
+
+    return taskio.network_checksum(
+               net_fnames, tuple(patchsz), samples_per_cleft, dil_param,
+               precision, img_cvname, cleft_cvname, seg_cvname,
+               listlike(resolution), num_downsamples, normcloudpath,
+               lower_clip_frac, upper_clip_frac, aggscratchpath,
+               listlike(aggchunksize), listlike(aggstartcoord), aggmaxmip,
+               id_map_checksum)
+
+
+def read_edge_inputs(img_cvname, cleft_cvname, seg_cvname,
+                     chunk_begin, chunk_end, storagestr,
+                     resolution=(4, 4, 40), num_downsamples=0,
+                     base_res_begin=None, base_res_end=None,
+                     parallel=1, storagedir=None, normcloudpath=None,
+                     lower_clip_frac=0.01, upper_clip_frac=0.01,
+                     aggscratchpath=None, aggchunksize=None,
+                     aggstartcoord=None, aggmaxmip=11, **unused):
+    """
+    Reads the volumes and other inputs for an edge task. The independent
+    reads are issued concurrently. Any extra (edge_task) keyword
+    arguments are ignored.
+
+    Returns a dict with the img, clefts (downsampled to match img), seg,
+    id_map and net_fnames (local network files), and the base_bounds
+    of the chunk. The network files are pulled into a new directory
+    (net_dir), so concurrent reads don't overwrite each other's files.
+    This should be removed by remove_edge_inputs.
+    """
     chunk_bounds = types.BBox3d(chunk_begin, chunk_end)
 
     if base_res_begin is None:
@@ -326,7 +548,64 @@ def edge_task(img_cvname, cleft_cvname, seg_cvname,
         base_bounds = types.BBox3d(base_res_begin, base_res_end)
 
     storagedir = storagestr if storagedir is None else storagedir
+    net_dir = tempfile.mkdtemp(prefix="synaptor_net_")
+
+    with concurrent.futures.ThreadPoolExecutor(EDGE_READ_THREADS) as executor:
+        img = executor.submit(read_edge_img,
+                              img_cvname, chunk_bounds, resolution,
+                              parallel, normcloudpath,
+                              lower_clip_frac, upper_clip_frac)
+
+        # clefts won't be downsampled - will do that myself below
+        clefts = executor.submit(timed, "Reading cleft chunk at MIP 0",
+                                 io.read_cloud_volume_chunk,
+                                 cleft_cvname, base_bounds,
+                                 mip=0, parallel=parallel)
+
+        if aggscratchpath is None:
+            desc = f"Reading segmentation chunk at {resolution}"
+            seg = executor.submit(timed, desc,
+                                  io.read_cloud_volume_chunk,
+                                  seg_cvname, chunk_bounds, mip=resolution,
+                                  parallel=parallel)
+        else:
+            desc = f"Reading agglomeration chunk at {resolution}"
+            seg = executor.submit(timed, desc,
+                                  taskio.agg.readchunk,
+                                  seg_cvname, chunk_bounds, aggstartcoord,
+                                  aggchunksize, aggscratchpath,
+                                  voxelres=resolution, maxmip=aggmaxmip)
+
+        net_fnames = executor.submit(timed, "Pulling association network",
+                                     taskio.pull_network_from_proc,
+                                     storagedir, net_dir)
+
+        id_map = executor.submit(timed, "Reading chunk id map",
+                                 taskio.read_chunk_id_map,
+                                 storagestr, base_bounds)
+
+        try:
+            inputs = dict(img=img.result(), clefts=clefts.result(),
+                          seg=seg.result(), net_fnames=net_fnames.result(),
+                          id_map=id_map.result(), base_bounds=base_bounds,
+                          net_dir=net_dir)
+        except BaseException:
+            shutil.rmtree(net_dir, ignore_errors=True)
+            raise
+
+    # Downsampling clefts to match other volumes
+    if num_downsamples > 0:
+        desc = f"Downsampling clefts to MIP {num_downsamples}"
+        inputs["clefts"] = timed(desc, seg_utils.downsample_seg_to_MIP,
+                                 inputs["clefts"], 0, num_downsamples)
+
+    return inputs
 
+
+def read_edge_img(img_cvname, chunk_bounds, resolution, parallel,
+                  normcloudpath=None,
+                  lower_clip_frac=0.01, upper_clip_frac=0.01):
+    """ Reads (and optionally normalizes) an image chunk """
     img = timed(f"Reading img chunk at {resolution}",
                 io.read_cloud_volume_chunk,
                 img_cvname, chunk_bounds,
@@ -340,62 +619,126 @@ def edge_task(img_cvname, cleft_cvname, seg_cvname,
 
         img = timed("Normalizing image chunk",
                     norm.normalize_chunk,
-                    img, histograms, chunk_begin[2],
+                    img, histograms, chunk_bounds.min()[2],
                     lower_clip_frac, upper_clip_frac)
 
-    # clefts won't be downsampled - will do that myself below
-    clefts = timed("Reading cleft chunk at MIP 0",
-                   io.read_cloud_volume_chunk,
-                   cleft_cvname, base_bounds,
-                   mip=0, parallel=parallel)
-
-    if aggscratchpath is None:
-        seg = timed(f"Reading segmentation chunk at {resolution}",
-                    io.read_cloud_volume_chunk,
-                    seg_cvname, chunk_bounds, mip=resolution,
-                    parallel=parallel)
-    else:
-        seg = timed(f"Reading agglomeration chunk at {resolution}",
-                    taskio.agg.readchunk,
-                    seg_cvname, chunk_bounds, aggstartcoord,
-                    aggchunksize, aggscratchpath,
-                    voxelres=resolution, maxmip=aggmaxmip)
+    return img
 
-    assoc_net = timed("Reading association network",
-                      taskio.read_network_from_proc,
-                      storagedir).cuda()
 
-    chunk_id_map = timed("Reading chunk id map",
-                         taskio.read_chunk_id_map,
-                         storagestr, base_bounds)
+def remove_edge_inputs(inputs):
+    """ Removes the local network files of read_edge_inputs """
+    shutil.rmtree(inputs["net_dir"], ignore_errors=True)
 
-    # Downsampling clefts to match other volumes
-    if num_downsamples > 0:
-        clefts = timed(f"Downsampling clefts to MIP {num_downsamples}",
-                       seg_utils.downsample_seg_to_MIP,
-                       clefts, 0, num_downsamples)
 
-    assert img.shape == clefts.shape == seg.shape, "mismatched volumes"
+@contextlib.contextmanager
+def prefetching():
+    """
+    Within this block, edge_task calls only start reading their inputs
+    in the background (see prefetch_edge_task). This lets the worker
+    prefetch a task by running its script (see cloud/kube/executor.py).
+    """
+    global _prefetching
+    _prefetching = True
+    try:
+        yield
+    finally:
+        _prefetching = False
 
-    edge_info = tasks.edge_task(img, clefts, seg, assoc_net,
-                                patchsz, offset=chunk_begin,
-                                id_map=chunk_id_map, root_seg=None,
-                                samples_per_cleft=samples_per_cleft,
-                                dil_param=dil_param, hashmax=hashmax)
 
-    if num_downsamples > 0:
-        edge_info = timed("Up-sampling edge information",
-                          edge.upsample_edge_info,
-                          edge_info, num_downsamples, chunk_begin)
+def prefetch_edge_task(**kwargs):
+    """
+    Starts reading the inputs of an edge task (given edge_task arguments)
+    in the background. A later edge_task call with the same arguments
+    uses these inputs instead of reading them again. Only the latest
+    PREFETCH_LIMIT prefetches are kept, and failed ones are dropped.
+    """
+    key = edge_inputs_key(kwargs)
+    if key in _prefetched_edge_inputs:
+        return
 
-    timed("Writing chunk edges",
-          taskio.write_chunk_edge_info,
-          edge_info, storagestr, base_bounds)
+    while len(_prefetched_edge_inputs) >= PREFETCH_LIMIT:
+        oldest = next(iter(_prefetched_edge_inputs))
+        discard_prefetch(_prefetched_edge_inputs.pop(oldest))
+
+    future = prefetch_executor().submit(read_edge_inputs, **kwargs)
+    _prefetched_edge_inputs[key] = future
+
+    def drop_failed(future):
+        if not future.cancelled() and future.exception() is not None:
+            if _prefetched_edge_inputs.get(key) is future:
+                _prefetched_edge_inputs.pop(key, None)
+
+    future.add_done_callback(drop_failed)
+
+
+def take_prefetched_edge_inputs(read_args):
+    """
+    Returns (and forgets) prefetched inputs for an edge task if any.
+    Failed prefetches return None, so the inputs are read again.
+    """
+    future = _prefetched_edge_inputs.pop(edge_inputs_key(read_args), None)
+    if future is None:
+        return None
+
+    try:
+        return future.result()
+    except Exception as e:
+        print(f"Prefetching edge task inputs failed: {e!r}")
+        return None
+
+
+def discard_prefetch(future):
+    """ Cancels a prefetch, or removes its inputs once it finishes """
+    if future.cancel():
+        return
+
+    def remove(future):
+        if future.exception() is None:
+            remove_edge_inputs(future.result())
+
+    future.add_done_callback(remove)
 
-    if timing_tag is not None:
-        timed("Writing total task time",
-              taskio.write_task_timing,
-              time.time() - start_time, "edge", timing_tag, storagestr)
+
+def edge_inputs_key(kwargs):
+    """ A hashable key for the arguments which pick an edge task's inputs """
+    args = inspect.signature(read_edge_inputs).bind(**kwargs)
+    args.apply_defaults()
+
+    args = dict(args.arguments)
+    del args["unused"]
+    if args["storagedir"] is None:
+        args["storagedir"] = args["storagestr"]
+
+    return repr(sorted((k, tuple(v) if isinstance(v, list) else v)
+                       for (k, v) in args.items()))
+
+
+def prefetch_executor():
+    global _prefetch_executor
+    if _prefetch_executor is None:
+        _prefetch_executor = concurrent.futures.ThreadPoolExecutor(1)
+
+    return _prefetch_executor
+
+
+def load_network(net_fnames, device=None, precision="fp32", jit=False):
+    """
+    Reads and prepares a network for inference. The network is cached
+    within the process by a checksum of its files, so later tasks using
+    the same network (from any storagedir) and settings reuse it, while
+    a different network is always read again.
+    """
+    key = (taskio.network_checksum(net_fnames), str(device), precision, jit)
+
+    if key not in _networks:
+        while len(_networks) >= NETWORK_CACHE_SIZE:
+            del _networks[next(iter(_networks))]
+
+        net = io.read_network(*net_fnames, device=device)
+        _networks[key] = edge.device.prepare_network(
+                             net, device=device, precision=precision, jit=jit)
+
+    return _networks[key]
 
 
 def merge_edges_task(voxel_res, dist_thr, size_thr,
@@ -667,3 +1010,4 @@ def fixsegids_task(storagestr, chunk_begin, chunk_end,
           taskio.write_chunk_edge_info,
           fixed_df.reset_index(), storagestr, chunk_bounds,
           tablename="corrupted_chunk_edges")
+
@@ -2,7 +2,6 @@ import itertools
 
 import numpy as np
 import pandas as pd
-import igraph
 
 
 def merge_info_df(df, id_map, merge_fn):
@@ -37,41 +36,186 @@ def merge_info_df(df, id_map, merge_fn):
 
 
 def find_connected_components(matches):
+    """ Returns the connected components of a graph as lists of ids """
+    union_find = UnionFind()
+    union_find.add_edges(matches)
 
-    all_ids = list(set(itertools.chain(*matches)))
-    vertex_mapping = { segid: i for (i,segid) in enumerate(all_ids) }
+    return union_find.components()
 
-    g = igraph.Graph(len(all_ids))
-    g.vs["ids"] = all_ids
 
-    mapped_edges = map(lambda x: (vertex_mapping[x[0]],vertex_mapping[x[1]]),
-                       matches)
+def find_id_map(edges, ids=None, batch_size=1_000_000):
+    """
+    Maps each id within a graph to the minimum id of its connected
+    component (as make_id_map does for a list of components).
 
-    g.add_edges(mapped_edges)
+    Edges can be an (N, 2) array or any iterable of pairs (including a
+    generator), and are consumed in batches of batch_size. Any extra
+    ids are included as singleton components.
+
+    Returns two aligned arrays: (src_ids, dst_ids)
+    """
+    union_find = UnionFind(ids)
+    union_find.add_edges(edges, batch_size=batch_size)
 
-    vertex_ccs = g.components()
+    return union_find.id_map_arrays()
 
-    # This is horribly slow for some reason
-    # orig_ccs = [g.vs[cc]["ids"] for cc in vertex_ccs]
-    orig_ccs = deal_cc_ids(g, vertex_ccs)
 
-    return orig_ccs
+class UnionFind(object):
+    """
+    UnionFind - an array-backed disjoint set forest over uint64 ids
 
+    Ids are kept in a sorted array, and each parent pointer is an index
+    into that array. Each root is always the smallest index (and so the
+    smallest id) of its component, which lets a batch of edges be linked
+    with vectorized hooking instead of a Python loop per edge. Paths are
+    compressed for every queried index.
+    """
 
-def deal_cc_ids(g, vertex_ccs, ids_key="ids"):
+    def __init__(self, ids=None):
+        self.ids = np.zeros((0,), dtype=np.uint64)
+        self.parent = np.zeros((0,), dtype=np.int64)
 
-    #Init bookkeeping objects
-    mapping = np.zeros((len(g.vs),), dtype=np.uint32)
-    cc_ids = [list() for _ in range(len(vertex_ccs))]
+        if ids is not None:
+            self.add_ids(ids)
 
-    for (cc_i,cc) in enumerate(vertex_ccs):
-        for seg_j in cc:
-            mapping[seg_j] = cc_i
+    def __len__(self):
+        return len(self.ids)
 
-    for (segid, cc) in zip(g.vs[ids_key], iter(mapping)):
-        cc_ids[cc].append(segid)
+    def add_ids(self, ids):
+        """ Adds new ids as singleton components """
+        ids = sorted_unique(np.asarray(ids, dtype=np.uint64))
+        new_ids = ids[~sorted_contains(self.ids, ids)]
 
-    return cc_ids
+        if len(new_ids) == 0:
+            return
+
+        # merging the (sorted) new ids into place instead of sorting again
+        new_inds = (np.searchsorted(self.ids, new_ids)
+                    + np.arange(len(new_ids)))
+        is_old = np.ones((len(self.ids) + len(new_ids),), dtype=bool)
+        is_old[new_inds] = False
+
+        merged_ids = np.empty(is_old.shape, dtype=np.uint64)
+        merged_ids[new_inds] = new_ids
+        merged_ids[is_old] = self.ids
+
+        # the relative order of the old ids is unchanged, so each root
+        # remains the smallest index within its component
+        old_inds = np.flatnonzero(is_old)
+        parent = np.arange(len(merged_ids), dtype=np.int64)
+        parent[old_inds] = old_inds[self.parent]
+
+        self.ids, self.parent = merged_ids, parent
+
+    def add_edges(self, edges, batch_size=1_000_000):
+        """ Unions the endpoints of each edge, consuming edges in batches """
+        if isinstance(edges, np.ndarray):
+            # adding every id at once (one sort) instead of per batch
+            self.add_ids(edges.ravel())
+
+        for batch in edge_batches(edges, batch_size):
+            self.union(batch[:, 0], batch[:, 1])
+
+    def union(self, ids1, ids2):
+        """ Unions each pair of aligned ids within two arrays """
+        ids1 = np.asarray(ids1, dtype=np.uint64)
+        ids2 = np.asarray(ids2, dtype=np.uint64)
+
+        # searching for sorted ids is much faster over a large id array
+        uniq_ids, inv = np.unique(np.concatenate((ids1, ids2)),
+                                  return_inverse=True)
+        self.add_ids(uniq_ids)
+
+        inds = np.searchsorted(self.ids, uniq_ids)[inv]
+        inds1, inds2 = inds[:len(ids1)], inds[len(ids1):]
+
+        while True:
+            roots1, roots2 = self._find(inds1), self._find(inds2)
+            unlinked = roots1 != roots2
+            if not unlinked.any():
+                break
+
+            inds1, inds2 = roots1[unlinked], roots2[unlinked]
+
+            # hooking the larger root onto the smallest root it touches
+            # some hooks can collide, and those are retried next round
+            np.minimum.at(self.parent, np.maximum(inds1, inds2),
+                          np.minimum(inds1, inds2))
+
+    def find(self, ids):
+        """ Returns the root id for each id """
+        inds = np.searchsorted(self.ids, np.asarray(ids, dtype=np.uint64))
+        return self.ids[self._find(inds)]
+
+    def _find(self, inds):
+        roots = self.parent[inds]
+        while True:
+            next_roots = self.parent[roots]
+            if np.array_equal(next_roots, roots):
+                break
+            roots = next_roots
+
+        self.parent[inds] = roots
+
+        return roots
+
+    def id_map_arrays(self):
+        """ Returns (src_ids, dst_ids) mapping each id to its root """
+        roots = self._find(np.arange(len(self.ids)))
+
+        return self.ids.copy(), self.ids[roots]
+
+    def components(self):
+        """ Returns each connected component as a list of ids """
+        roots = self._find(np.arange(len(self.ids)))
+
+        order = np.argsort(roots, kind="stable")
+        splits = np.nonzero(np.diff(roots[order]))[0] + 1
+
+        return [cc.tolist() for cc in np.split(self.ids[order], splits)
+                if len(cc) > 0]
+
+
+def sorted_unique(arr):
+    """ np.unique for a flat array, through a single sort """
+    arr = np.sort(arr, axis=None)
+    if len(arr) == 0:
+        return arr
+
+    keep = np.empty(arr.shape, dtype=bool)
+    keep[0] = True
+    np.not_equal(arr[1:], arr[:-1], out=keep[1:])
+
+    return arr[keep]
+
+
+def sorted_contains(sorted_arr, values):
+    """ Whether each value is within a sorted array """
+    if len(sorted_arr) == 0:
+        return np.zeros(values.shape, dtype=bool)
+
+    inds = np.searchsorted(sorted_arr, values)
+    inds[inds == len(sorted_arr)] = 0
+
+    return sorted_arr[inds] == values
+
+
+def edge_batches(edges, batch_size):
+    """ Splits an array or iterable of pairs into (n, 2) uint64 arrays """
+    if isinstance(edges, np.ndarray):
+        edges = edges.reshape((-1, 2))
+        for i in range(0, len(edges), batch_size):
+            yield edges[i:i+batch_size].astype(np.uint64)
+
+        return
+
+    edges = iter(edges)
+    while True:
+        batch = list(itertools.islice(edges, batch_size))
+        if len(batch) == 0:
+            break
+
+        yield np.array(batch, dtype=np.uint64).reshape((-1, 2))
 
 
 def make_id_map(ccs):
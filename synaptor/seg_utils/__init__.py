@@ -8,6 +8,7 @@ These functions include:
 - Bounding boxes (bounding_boxes)
 - Segment sizes (segment_sizes)
 - General data relabeling (relabel_data)
+- Relabeling by sorted id arrays, e.g. IdMaps (relabel_data_sorted)
 - Relabeling segment ids to 1:N (relabel_data_1N)
 - Finding nonzero unique ids (nonzero_unique_ids)
 - High-pass size thresholding (filter_segs_by_size)
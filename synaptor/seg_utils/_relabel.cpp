@@ -1,6 +1,8 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/numpy.h>
 #include <pybind11/stl.h>
+#include <algorithm>
+#include <cstdint>
 
 namespace py = pybind11;
 
@@ -38,6 +40,59 @@ py::array_t<T> relabel_data(py::array_t<T> d, std::unordered_map<T,T> mapping)
 }
 
 
+const char* relabel_data_sorted__doc__ = R"/(
+Relabel data according to sorted source and destination ids in-place.
+
+Args:
+    d (1darray<T>): A (flattened) data volume.
+    src_ids (1darray<uint64>): Sorted unique data values to replace.
+    dst_ids (1darray<uint64>): The new value for each source id.
+
+Returns:
+    1darray<T> : The same data volume with desired values replaced.
+)/";
+template<typename T>
+py::array_t<T> relabel_data_sorted(py::array_t<T> d,
+                                   py::array_t<uint64_t> src_ids,
+                                   py::array_t<uint64_t> dst_ids)
+{
+    auto r = d.template mutable_unchecked<1>();
+    auto src = src_ids.template unchecked<1>();
+    auto dst = dst_ids.template unchecked<1>();
+    const uint64_t* begin = src.data(0);
+    const uint64_t* end = begin + src.shape(0);
+
+    if (src.shape(0) == 0){
+        return d;
+    }
+
+    // segmentations have long runs of the same value, so the last lookup
+    // is reused
+    T last = r.shape(0) > 0 ? r(0) : 0;
+    const uint64_t* found = std::lower_bound(begin, end, (uint64_t)last);
+    bool last_found = found != end && *found == (uint64_t)last;
+    T last_dst = last_found ? (T)dst(found - begin) : last;
+    T v;
+
+    for (ssize_t i = 0; i < r.shape(0); ++i){
+        v = r(i);
+
+        if (v != last){
+            last = v;
+            found = std::lower_bound(begin, end, (uint64_t)v);
+            last_found = found != end && *found == (uint64_t)v;
+            last_dst = last_found ? (T)dst(found - begin) : v;
+        }
+
+        if (last_found){
+            r(i) = last_dst;
+        }
+    }
+
+    return d;
+}
+
+
 template <typename T>
 using dual_map = std::unordered_map<T, std::unordered_map<T,T>>;
 
@@ -92,6 +147,10 @@ PYBIND11_MODULE(_relabel, m) {
     m.def("relabel_data", &relabel_data<float>,
           relabel_data__doc__);
 
+    m.def("relabel_data_sorted", &relabel_data_sorted<uint64_t>);
+    m.def("relabel_data_sorted", &relabel_data_sorted<unsigned int>,
+          relabel_data_sorted__doc__);
+
     m.def("relabel_paired_data", &relabel_paired_data<unsigned int>);
     m.def("relabel_paired_data", &relabel_paired_data<float>,
           relabel_paired_data__doc__);
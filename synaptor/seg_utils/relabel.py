@@ -2,6 +2,7 @@ import numpy as np
 
 from . import describe
 from . import _relabel
+from ..types.idmap import IdMap
 
 
 def relabel_data(d, mapping, copy=True):
@@ -14,7 +15,8 @@ def relabel_data(d, mapping, copy=True):
 
     Args:
         d (3darray): A data volume.
-        mapping (dict): A mapping from data values in d to new desired values.
+        mapping (dict or IdMap): A mapping from data values in d to new
+            desired values. IdMaps are applied directly from their arrays.
         copy (bool): Whether or not to perform relabeling in-place. Defaults
             to True, which will create a new volume.
 
@@ -22,11 +24,52 @@ def relabel_data(d, mapping, copy=True):
         3darray: A modified or newly created volume with the
             desired modifications.
     """
+    if isinstance(mapping, IdMap):
+        return mapping.relabel(d, copy=copy)
+
     if copy:
         d = np.copy(d)
     return _relabel.relabel_data(d, mapping)
 
 
+def relabel_data_sorted(d, src_ids, dst_ids, copy=True):
+    """
+    Relabel data according to sorted ids.
+
+    Modify the entries of :param:d that match an entry of :param:src_ids to
+    the corresponding entry of :param:dst_ids (e.g. the arrays of an IdMap).
+    Other values are left unchanged.
+
+    Args:
+        d (ndarray): A uint32 or uint64 data volume.
+        src_ids (1darray): Sorted unique data values to replace.
+        dst_ids (1darray): The new value for each source id.
+        copy (bool): Whether or not to perform relabeling in-place. Defaults
+            to True, which will create a new volume.
+
+    Returns:
+        ndarray: A modified or newly created volume with the
+            desired modifications.
+    """
+    assert d.dtype in (np.uint32, np.uint64), f"unsupported dtype {d.dtype}"
+    src_ids = np.ascontiguousarray(src_ids, dtype=np.uint64)
+    dst_ids = np.ascontiguousarray(dst_ids, dtype=np.uint64)
+    assert src_ids.shape == dst_ids.shape, "mismatched src and dst ids"
+
+    if copy or not d.flags.c_contiguous:
+        r = np.array(d, order="C")
+    else:
+        r = d
+
+    _relabel.relabel_data_sorted(r.reshape(-1), src_ids, dst_ids)
+
+    if not copy and r is not d:
+        d[...] = r
+        return d
+
+    return r
+
+
 def relabel_data_1N(d, copy=True):
     """
     Relabel segment values from 1:N
@@ -1,2 +1,5 @@
 from . import bbox
 from .bbox import BBox3d, Vec3d
+
+from . import idmap
+from .idmap import IdMap
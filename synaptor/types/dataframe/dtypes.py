@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 
+import numpy as np
+
 
 class DType(object):
 
     length = 0
     fields = []
+    dtype = None
 
     def merge(fields1, fields2):
         pass
@@ -14,6 +17,7 @@ class Centroid(DType):
 
     length = 3
     fields = ["centroid_x","centroid_y","centroid_z"]
+    dtype = np.int64
 
     def merge(fields1, fields2):
         
@@ -31,6 +35,7 @@ class Size(DType):
 
     length = 1
     fields = ["size"]
+    dtype = np.int64
 
     def merge(fields1, fields2):
         return [("size", fields1["size"]+fields2["size"])]
@@ -41,6 +46,7 @@ class BBox(DType):
     length = 6
     fields = ["bbox_bx","bbox_by","bbox_bz",
               "bbox_ex","bbox_ey","bbox_ez"]
+    dtype = np.int64
 
     def merge(fields1, fields2):
         pass
@@ -50,6 +56,7 @@ class PresynSeg(DType):
 
     length = 1
     fields = ["presyn_segid"]
+    dtype = np.int64
 
     def merge(fields1, fields2):
         pass
@@ -59,6 +66,7 @@ class PostsynSeg(DType):
 
     length = 1
     fields = ["postsyn_segid"]
+    dtype = np.int64
 
     def merge(fields1, fields2):
         pass
@@ -68,6 +76,7 @@ class PresynWeight(DType):
 
     length = 1
     fields = ["presyn_weight"]
+    dtype = np.float64
 
     def merge(fields1, fields2):
         pass
@@ -77,6 +86,7 @@ class PostsynWeight(DType):
 
     length = 1
     fields = ["postsyn_weight"]
+    dtype = np.float64
 
     def merge(fields1, fields2):
         pass
@@ -86,6 +96,7 @@ class PresynLoc(DType):
 
     length = 3
     fields = ["presyn_loc_x","presyn_loc_y","presyn_loc_z"]
+    dtype = np.int64
 
     def merge(fields1, fields2):
         pass
@@ -95,6 +106,7 @@ class PostsynLoc(DType):
 
     length = 3
     fields = ["postsyn_loc_x","postsyn_loc_y","postsyn_loc_z"]
+    dtype = np.int64
 
     def merge(fields1, fields2):
         pass
@@ -104,6 +116,7 @@ class PresynCount(DType):
 
     length = 1
     fields = ["presyn_count"]
+    dtype = np.int64
 
     def merge(fields1, fields2):
         pass
@@ -113,6 +126,36 @@ class PostsynCount(DType):
 
     length = 1
     fields = ["postsyn_count"]
+    dtype = np.int64
+
+    def merge(fields1, fields2):
+        pass
+
+
+class SegId(DType):
+
+    length = 1
+    fields = ["cleft_segid", "src_id", "dst_id"]
+    dtype = np.int64
+
+    def merge(fields1, fields2):
+        pass
+
+
+class HashIndex(DType):
+
+    length = 1
+    fields = ["clefthash", "partnerhash", "dst_id_hash"]
+    dtype = np.int64
 
     def merge(fields1, fields2):
         pass
+
+
+def column_dtype(colname):
+    """ Returns the declared dtype of a column, or None if undeclared """
+    for dtype in DType.__subclasses__():
+        if colname in dtype.fields:
+            return dtype.dtype
+
+    return None
@@ -0,0 +1,199 @@
+"""
+Segment ID Map
+
+An id mapping stored as sorted source and destination uint64 arrays.
+"""
+
+import hashlib
+import collections.abc
+
+import numpy as np
+
+
+class IdMap(object):
+    """
+    IdMap - a mapping between segment ids backed by sorted arrays
+
+    The map holds its own copies of the arrays it's created from.
+
+    Supports the read/write dict interface used by the merging functions
+    (along with keys(), values() and items()), and adds vectorized methods:
+
+    lookup()    -- map an array of ids, with an optional default
+    compose()   -- return a new map as if another map is applied after this
+    relabel()   -- relabel a data volume by the mapping
+    save()      -- write the map to a .npy or .npz file
+    load()      -- read a map written by save()
+    checksum()  -- a short hash of the mapping's contents
+    """
+
+    __slots__ = ("src_ids", "dst_ids")
+
+    def __init__(self, src_ids=(), dst_ids=()):
+        src_ids = np.asarray(src_ids, dtype=np.uint64).ravel()
+        dst_ids = np.asarray(dst_ids, dtype=np.uint64).ravel()
+        assert src_ids.shape == dst_ids.shape, "mismatched src and dst ids"
+
+        # already sorted and unique - copying the arrays, since they may be
+        # shared (or read-only) views and __setitem__ writes in place
+        if np.all(src_ids[1:] > src_ids[:-1]):
+            self.src_ids, self.dst_ids = src_ids.copy(), dst_ids.copy()
+            return
+
+        # sorting by src id, and keeping the last value for repeated keys
+        # (as a dict would)
+        order = np.argsort(src_ids, kind="stable")
+        src_ids, dst_ids = src_ids[order], dst_ids[order]
+
+        keep = np.ones(src_ids.shape, dtype=bool)
+        keep[:-1] = src_ids[:-1] != src_ids[1:]
+
+        self.src_ids = src_ids[keep]
+        self.dst_ids = dst_ids[keep]
+
+    @classmethod
+    def from_dict(cls, mapping):
+        """ Creates an IdMap from a dict (or another IdMap) """
+        if isinstance(mapping, IdMap):
+            return mapping
+
+        return cls(list(mapping.keys()), list(mapping.values()))
+
+    def to_dict(self):
+        return dict(zip(self.src_ids.tolist(), self.dst_ids.tolist()))
+
+    def _find(self, ids):
+        """ Returns the index of each id within src_ids, and whether found """
+        ids = np.asarray(ids, dtype=np.uint64)
+        if len(self.src_ids) == 0:
+            return np.zeros(ids.shape, dtype=int), np.zeros(ids.shape, bool)
+
+        inds = np.searchsorted(self.src_ids, ids)
+        inds[inds == len(self.src_ids)] = 0
+
+        return inds, self.src_ids[inds] == ids
+
+    def lookup(self, ids, default=None):
+        """
+        Maps an array of ids. Ids without an entry take the default value
+        (a scalar or an array aligned with ids). Raises a KeyError for any
+        missing id if default is None.
+        """
+        inds, found = self._find(ids)
+
+        if default is None:
+            if not found.all():
+                missing = np.asarray(ids)[~found]
+                raise KeyError(f"{len(missing)} ids not found in map,"
+                               f" e.g. {missing.flat[0]}")
+            return self.dst_ids[inds]
+
+        default = np.broadcast_to(np.asarray(default, dtype=np.uint64),
+                                  inds.shape)
+        if len(self.src_ids) == 0:
+            return default.copy()
+
+        return np.where(found, self.dst_ids[inds], default)
+
+    def compose(self, other):
+        """
+        Returns a new IdMap as if other is applied after this map. Values
+        that other doesn't map are left unchanged.
+        """
+        other = IdMap.from_dict(other)
+        dst_ids = other.lookup(self.dst_ids, default=self.dst_ids)
+
+        return IdMap(self.src_ids, dst_ids)
+
+    def relabel(self, data, copy=True):
+        """ Relabels a data volume. Unmapped values are left unchanged. """
+        if data.dtype in (np.uint32, np.uint64):
+            # avoiding a circular import (seg_utils uses IdMaps)
+            from ..seg_utils import relabel
+
+            return relabel.relabel_data_sorted(data, self.src_ids,
+                                               self.dst_ids, copy=copy)
+
+        flat = np.asarray(data).ravel()
+        relabeled = self.lookup(flat, default=flat).astype(data.dtype)
+
+        if copy:
+            return relabeled.reshape(data.shape)
+
+        data[...] = relabeled.reshape(data.shape)
+
+        return data
+
+    def save(self, path):
+        """ Writes to an .npz file, or to a (2, N) .npy array otherwise """
+        if path.endswith(".npz"):
+            np.savez(path, src_ids=self.src_ids, dst_ids=self.dst_ids)
+        else:
+            np.save(path, np.stack((self.src_ids, self.dst_ids)))
+
+    @classmethod
+    def load(cls, path):
+        if path.endswith(".npz"):
+            with np.load(path) as f:
+                return cls(f["src_ids"], f["dst_ids"])
+        else:
+            src_ids, dst_ids = np.load(path)
+            return cls(src_ids, dst_ids)
+
+    def checksum(self):
+        """ A short hash of the mapping (e.g. for keying cached results) """
+        digest = hashlib.sha256()
+        digest.update(self.src_ids.tobytes())
+        digest.update(self.dst_ids.tobytes())
+
+        return digest.hexdigest()[:16]
+
+    # dict interface
+    def keys(self):
+        return self.src_ids.tolist()
+
+    def values(self):
+        return self.dst_ids.tolist()
+
+    def items(self):
+        return zip(self.src_ids.tolist(), self.dst_ids.tolist())
+
+    def get(self, key, default=None):
+        inds, found = self._find([key])
+        return self.dst_ids[inds[0]].item() if found[0] else default
+
+    def __getitem__(self, key):
+        inds, found = self._find([key])
+        if not found[0]:
+            raise KeyError(key)
+
+        return self.dst_ids[inds[0]].item()
+
+    def __setitem__(self, key, value):
+        inds, found = self._find([key])
+        if found[0]:
+            self.dst_ids[inds[0]] = value
+        else:
+            ind = np.searchsorted(self.src_ids, np.uint64(key))
+            self.src_ids = np.insert(self.src_ids, ind, np.uint64(key))
+            self.dst_ids = np.insert(self.dst_ids, ind, np.uint64(value))
+
+    def __contains__(self, key):
+        return bool(self._find([key])[1][0])
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.src_ids)
+
+    def __eq__(self, other):
+        if not isinstance(other, (IdMap, collections.abc.Mapping)):
+            return NotImplemented
+
+        other = IdMap.from_dict(other)
+        return (np.array_equal(self.src_ids, other.src_ids) and
+                np.array_equal(self.dst_ids, other.dst_ids))
+
+    def __repr__(self):
+        return f"<IdMap with {len(self)} entries>"
@@ -34,6 +34,13 @@ parser.add_argument("--num_downsamples", type=int, default=0)
 parser.add_argument("--base_res_begin", nargs=3, type=int, default=None)
 parser.add_argument("--base_res_end", nargs=3, type=int, default=None)
 parser.add_argument("--parallel", type=int, default=1)
+parser.add_argument("--batch_size", type=int, default=8)
+parser.add_argument("--device", default=None)
+parser.add_argument("--num_threads", type=int, default=None)
+parser.add_argument("--precision", default="fp32",
+                    choices=["fp32", "bf16", "int8"])
+parser.add_argument("--jit", action="store_true")
+parser.add_argument("--cache_weights", action="store_true")
 parser.add_argument("--timing_tag", default=None)
 
 parser.add_argument("--aggscratchpath", default=None)
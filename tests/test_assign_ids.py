@@ -0,0 +1,112 @@
+"""
+Vectorized id assignment (synaptor/proc/seg/merge/assign_ids.py) should
+match the per-chunk dict assignment it replaced
+"""
+import copy
+
+import numpy as np
+import pandas as pd
+
+from synaptor.proc.seg import continuation
+from synaptor.proc.seg.merge import assign_ids
+
+
+def reference_assign_unique_ids(cleft_info_arr):
+    """ assign_unique_ids as it was, with a dict id map per chunk """
+    chunk_id_maps = np.empty(cleft_info_arr.shape, dtype=object)
+    df_parts = list()
+    next_id = 1
+
+    for index in np.ndindex(cleft_info_arr.shape):
+        dframe = cleft_info_arr[index]
+        segids = dframe.index.tolist()
+
+        chunk_id_maps[index] = dict(zip(segids, range(next_id,
+                                                      next_id+len(segids))))
+        next_id += len(segids)
+
+        df_parts.append(dframe.rename(chunk_id_maps[index]))
+
+    return pd.concat(df_parts), chunk_id_maps
+
+
+def random_cleft_info_arr(shape=(2, 3, 2), seed=0):
+    rng = np.random.default_rng(seed)
+
+    cleft_info_arr = np.empty(shape, dtype=object)
+    for index in np.ndindex(shape):
+        num_rows = rng.integers(2, 6)
+        segids = rng.choice(np.arange(1, 1000, dtype=np.uint64),
+                            size=num_rows, replace=False)
+        if index == (1, 2, 1):
+            segids[:2] = [2 ** 64 - 1, 2 ** 63]
+
+        cleft_info_arr[index] = pd.DataFrame(
+            {"size": rng.integers(1, 100, size=num_rows),
+             "centroid_x": rng.integers(0, 50, size=num_rows)},
+            index=pd.Index(segids, name="cleft_segid"))
+
+    cleft_info_arr[0, 1, 0] = cleft_info_arr[0, 1, 0].iloc[:0]
+
+    return cleft_info_arr
+
+
+def test_assign_unique_ids_matches_reference():
+    cleft_info_arr = random_cleft_info_arr()
+
+    full_df, chunk_id_maps = assign_ids.assign_unique_ids(
+                                 copy.deepcopy(cleft_info_arr))
+    ref_df, ref_maps = reference_assign_unique_ids(
+                           copy.deepcopy(cleft_info_arr))
+
+    np.testing.assert_array_equal(full_df.index, ref_df.index)
+    assert full_df.index.name == ref_df.index.name
+    pd.testing.assert_frame_equal(full_df.reset_index(drop=True),
+                                  ref_df.reset_index(drop=True))
+
+    assert chunk_id_maps.shape == ref_maps.shape
+    for (id_map, ref_map) in zip(chunk_id_maps.flat, ref_maps.flat):
+        assert id_map.to_dict() == ref_map
+
+    serial_df, serial_maps = assign_ids.assign_unique_ids_serial(
+                                 copy.deepcopy(cleft_info_arr))
+    np.testing.assert_array_equal(serial_df.index, ref_df.index)
+    assert list(serial_maps.flat) == list(ref_maps.flat)
+
+
+def test_id_map_updates_match_dicts():
+    cleft_info_arr = random_cleft_info_arr(seed=1)
+    _, chunk_id_maps = assign_ids.assign_unique_ids(cleft_info_arr)
+    dict_maps = np.empty(chunk_id_maps.shape, dtype=object)
+    for (i, id_map) in enumerate(chunk_id_maps.flat):
+        dict_maps.flat[i] = id_map.to_dict()
+
+    num_ids = sum(len(m) for m in dict_maps.flat)
+    cont_id_map = {i: (i + 1) // 2 for i in range(1, num_ids + 1)}
+
+    updated = assign_ids.update_chunk_id_maps(chunk_id_maps.copy(),
+                                              cont_id_map)
+    expected = assign_ids.update_chunk_id_maps(copy.deepcopy(dict_maps),
+                                               cont_id_map)
+    assert [m.to_dict() for m in updated.flat] == list(expected.flat)
+
+    # continuations take the same ids from either map
+    def make_continuations(id_maps):
+        continuation_arr = np.empty(id_maps.shape, dtype=object)
+        for (i, id_map) in enumerate(id_maps.flat):
+            face = continuation.Face(0, True)
+            continuation_arr.flat[i] = {
+                face: [continuation.Continuation(segid, face, None)
+                       for segid in sorted(id_map.keys())]}
+
+        return continuation_arr
+
+    from_idmaps = assign_ids.apply_chunk_id_maps(
+                      make_continuations(chunk_id_maps), chunk_id_maps)
+    from_dicts = assign_ids.apply_chunk_id_maps(
+                     make_continuations(dict_maps), dict_maps)
+
+    for (conts, ref_conts) in zip(from_idmaps.flat, from_dicts.flat):
+        for face in ref_conts:
+            assert ([c.segid for c in conts[face]]
+                    == [c.segid for c in ref_conts[face]])
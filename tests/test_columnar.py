@@ -0,0 +1,144 @@
+"""
+Binary columnar dataframes (synaptor/io/backends/columnar.py) should read
+back the same frames (and filtered rows) as the csv files they replace
+"""
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from synaptor.io.backends import columnar
+from synaptor.io.backends import local
+
+
+FORMATS = [".npz", ".parquet"]
+FILTERS = [None,
+           [("size", ">", 40)],
+           [("size", ">=", 10), ("partnerhash", "==", 3)],
+           [("partnerhash", "in", {0, 2})],
+           [("partnerhash", "not in", [1]), ("bbox_max_z", "<", 30)],
+           [("cleft_segid", "<=", 2 ** 63)],
+           [("size", "<", 0)]]
+
+
+def random_seginfo(num_rows=60, seed=0):
+    rng = np.random.default_rng(seed)
+    segids = rng.choice(np.arange(1, 10000, dtype=np.uint64),
+                        size=num_rows, replace=False)
+    segids[:2] = [2 ** 64 - 1, 2 ** 63 + 1]
+
+    return pd.DataFrame(
+        {"size": rng.integers(1, 100, size=num_rows),
+         "centroid_x": rng.integers(0, 1000, size=num_rows),
+         "bbox_max_z": rng.integers(0, 50, size=num_rows),
+         "partnerhash": rng.integers(0, 4, size=num_rows),
+         "weight": rng.random(num_rows),
+         "tag": rng.choice(["a", "bc"], size=num_rows)},
+        index=pd.Index(segids, name="cleft_segid"))
+
+
+def reference_read(dframe, tmp_path, columns=None, filters=None):
+    """ A csv round trip, filtered after reading """
+    path = str(tmp_path / "reference.csv")
+    local.write_dframe(dframe, path)
+    read = pd.read_csv(path, index_col=0)
+    read.index = read.index.astype(np.uint64)
+
+    read = columnar.filter_dframe(read, filters)
+    if columns is not None:
+        read = read[[c for c in columns if c != read.index.name]]
+
+    return read
+
+
+def assert_same_values(dframe, expected):
+    assert list(dframe.columns) == list(expected.columns)
+    assert dframe.index.name == expected.index.name
+    np.testing.assert_array_equal(dframe.index.values.astype(np.uint64),
+                                  expected.index.values)
+    for name in expected.columns:
+        if expected[name].dtype.kind == "f":
+            np.testing.assert_allclose(dframe[name], expected[name])
+        else:
+            np.testing.assert_array_equal(dframe[name].astype(str),
+                                          expected[name].astype(str))
+
+
+@pytest.mark.parametrize("ext", FORMATS)
+@pytest.mark.parametrize("filters", FILTERS)
+def test_read_matches_csv(tmp_path, ext, filters):
+    dframe = random_seginfo()
+    path = str(tmp_path / f"seginfo{ext}")
+    local.write_dframe(dframe, path)
+
+    read = local.read_dframe(path, filters=filters)
+
+    assert_same_values(read, reference_read(dframe, tmp_path,
+                                            filters=filters))
+
+
+@pytest.mark.parametrize("ext", FORMATS + [".csv"])
+def test_columns_and_chunks(tmp_path, ext):
+    dframe = random_seginfo(seed=1)
+    path = str(tmp_path / f"seginfo{ext}")
+    local.write_dframe(dframe, path)
+    columns = ["partnerhash", "size"]
+    filters = [("partnerhash", "!=", 1)]
+
+    read = local.read_dframe(path, columns=columns, filters=filters)
+    expected = reference_read(dframe, tmp_path, columns, filters)
+    assert_same_values(read, expected)
+
+    with local.read_dframe(path, chunksize=7, columns=columns,
+                           filters=filters) as reader:
+        # csv chunks infer their own index dtypes (int64 or uint64)
+        chunks = [chunk.set_axis(chunk.index.astype(np.uint64))
+                  for chunk in reader]
+
+    assert_same_values(pd.concat(chunks), expected)
+
+
+@pytest.mark.parametrize("ext", FORMATS)
+def test_file_objects(tmp_path, ext):
+    dframe = random_seginfo(seed=2)
+    fname = f"gs://bucket/seginfo{ext}"
+
+    buf = BytesIO()
+    local.write_dframe(dframe, buf, fname=fname)
+    buf.seek(0)
+
+    read = local.read_dframe(buf, fname=fname)
+
+    assert_same_values(read, reference_read(dframe, tmp_path))
+
+
+@pytest.mark.parametrize("ext", FORMATS)
+def test_write_dframe_parts(tmp_path, ext):
+    dframe = random_seginfo(seed=3)
+    parts = [dframe.iloc[:20], dframe.iloc[20:21], dframe.iloc[21:]]
+    path = str(tmp_path / f"parts{ext}")
+    whole_path = str(tmp_path / f"whole{ext}")
+
+    columnar.write_dframe_parts(iter(parts), path)
+    columnar.write_dframe(dframe, whole_path)
+
+    pd.testing.assert_frame_equal(columnar.read_dframe(path),
+                                  columnar.read_dframe(whole_path))
+    filters = [("size", ">", 50)]
+    pd.testing.assert_frame_equal(
+        columnar.read_dframe(path, filters=filters),
+        columnar.read_dframe(whole_path, filters=filters))
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_write_npz_parts_checks_columns(tmp_path):
+    dframe = random_seginfo(seed=4)
+    path = str(tmp_path / "parts.npz")
+
+    with pytest.raises(AssertionError):
+        columnar.write_dframe_parts(
+            [dframe, dframe.rename(columns={"size": "sz"})], path)
+
+    with pytest.raises(AssertionError):
+        columnar.write_dframe_parts(iter([]), path)
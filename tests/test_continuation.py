@@ -0,0 +1,99 @@
+"""
+Array-backed continuation extraction (synaptor/proc/seg/continuation.py)
+should match the per-voxel dict lookup it replaced
+"""
+import numpy as np
+import pytest
+
+from synaptor.proc.seg import continuation
+
+
+def reference_id_lookup(face_arr):
+    """ The per-voxel segid -> coords lookup used before make_face_arrays """
+    x, y = np.nonzero(face_arr)
+    segids = face_arr[(x, y)]
+
+    lookup = dict()
+    for (segid, i, j) in zip(segids, x, y):
+        lookup.setdefault(segid, list()).append((i, j))
+
+    return {segid: np.array(coords) for (segid, coords) in lookup.items()}
+
+
+def reference_continuations(seg):
+    """ extract_all_continuations as it was before make_face_arrays """
+    continuations = dict()
+    continuation_ids = set()
+
+    for face in continuation.Face.all_faces():
+        lookup = reference_id_lookup(face.extract(seg))
+
+        continuation_ids.update(lookup.keys())
+        continuations[face] = [continuation.Continuation(segid, face, coords)
+                               for (segid, coords) in lookup.items()]
+
+    return continuations, continuation_ids
+
+
+def random_seg(seed, shape=(9, 7, 5), maxid=12, dtype="uint32"):
+    rng = np.random.default_rng(seed)
+    seg = rng.integers(0, maxid, size=shape).astype(dtype)
+    seg[seg > maxid // 2] = 0
+
+    return seg
+
+
+def as_dict(continuations):
+    return {c.segid: np.asarray(c.face_coords) for c in continuations}
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_extract_all_continuations(seed):
+    seg = random_seg(seed)
+
+    continuations, continuation_ids = continuation.extract_all_continuations(
+                                          seg)
+    expected, expected_ids = reference_continuations(seg)
+
+    assert continuation_ids == expected_ids
+    for face in continuation.Face.all_faces():
+        found, ref = as_dict(continuations[face]), as_dict(expected[face])
+
+        assert sorted(found) == sorted(ref)
+        for segid in ref:
+            np.testing.assert_array_equal(found[segid], ref[segid])
+        assert all(c.face == face for c in continuations[face])
+
+
+def test_make_id_lookup_large_ids():
+    face_arr = np.zeros((6, 4), dtype=np.uint64)
+    face_arr[0, 1] = face_arr[5, 3] = 2 ** 64 - 1
+    face_arr[2, 2] = 2 ** 63
+    face_arr[3, 0] = 1
+
+    lookup = continuation.make_id_lookup(face_arr)
+    expected = reference_id_lookup(face_arr)
+
+    assert sorted(lookup) == sorted(expected)
+    for segid in expected:
+        np.testing.assert_array_equal(lookup[segid], expected[segid])
+
+
+def test_arrays_round_trip():
+    face = continuation.Face(2, False)
+    segids, offsets, coords = continuation.make_face_arrays(
+                                  face.extract(random_seg(5)))
+    continuations = continuation.continuations_from_arrays(
+                        segids, offsets, coords, face)
+
+    packed = continuation.arrays_from_continuations(continuations)
+
+    for (arr, expected) in zip(packed, (segids, offsets, coords)):
+        np.testing.assert_array_equal(arr, expected)
+
+    # an empty face
+    segids, offsets, coords = continuation.make_face_arrays(
+                                  np.zeros((3, 3), dtype="uint32"))
+    assert len(segids) == 0 and list(offsets) == [0] and coords.shape == (0, 2)
+    assert continuation.continuations_from_arrays(
+               segids, offsets, coords, face) == []
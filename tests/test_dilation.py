@@ -0,0 +1,79 @@
+"""
+The separable CPU dilation (synaptor/proc/edge/dilation.py) should give
+the same masks as the conv3d dilation it replaced
+"""
+import numpy as np
+import pytest
+import scipy.ndimage as ndimage
+import torch
+
+from synaptor.proc.edge import dilation
+
+
+def reference_kernel(dil_param):
+    """ make_dilation_kernel as it was in asynet """
+    kernel = ndimage.generate_binary_structure(2, 1)
+    kernel = ndimage.iterate_structure(kernel, dil_param)
+    width = kernel.shape[-1]
+
+    kernel = np.stack((kernel, kernel, kernel), axis=0)
+
+    return kernel.reshape((1, 1, 3, width, width))
+
+
+def reference_dilate(mask, dil_param):
+    """ torch_dilation as it was in asynet (on the CPU) """
+    kernel = reference_kernel(dil_param).astype("float32")
+    sz = kernel.shape
+    padding = (sz[2]//2, sz[3]//2, sz[4]//2)
+
+    output = torch.nn.functional.conv3d(
+                 torch.from_numpy(mask.astype("float32")),
+                 torch.from_numpy(kernel), padding=padding)
+
+    return output.numpy().astype("bool")
+
+
+def random_mask(seed, shape=(5, 17, 13), density=0.02):
+    rng = np.random.default_rng(seed)
+    mask = rng.random((1, 1) + shape) < density
+    # touching the borders
+    mask[0, 0, 0, 0, 0] = mask[0, 0, -1, -1, -1] = True
+
+    return mask.astype("float32")
+
+
+@pytest.mark.parametrize("dil_param", [0, 1, 2, 5])
+@pytest.mark.parametrize("seed", range(3))
+def test_cpu_dilate_matches_conv(seed, dil_param):
+    mask = random_mask(seed)
+    expected = reference_dilate(mask, dil_param)
+
+    dilated = dilation.cpu_dilate(mask, dil_param)
+
+    assert dilated.dtype == bool
+    np.testing.assert_array_equal(dilated, expected)
+    np.testing.assert_array_equal(
+        dilation.torch_dilate(mask, dil_param, torch.device("cpu")),
+        expected)
+    np.testing.assert_array_equal(dilation.dilate(mask, dil_param, "cpu"),
+                                  expected)
+
+
+def test_thin_and_empty_masks():
+    # single planes and empty masks
+    for shape in [(1, 9, 9), (2, 1, 6), (3, 4, 4)]:
+        mask = random_mask(4, shape=shape, density=0.1)
+        np.testing.assert_array_equal(dilation.cpu_dilate(mask, 3),
+                                      reference_dilate(mask, 3))
+
+    empty = np.zeros((1, 1, 3, 6, 6), dtype="float32")
+    assert not dilation.cpu_dilate(empty, 2).any()
+
+
+def test_dilation_kernel_is_cached_and_unchanged():
+    kernel = dilation.dilation_kernel(4)
+
+    np.testing.assert_array_equal(kernel, reference_kernel(4))
+    assert dilation.dilation_kernel(4) is kernel
+    assert not kernel.flags.writeable
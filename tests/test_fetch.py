@@ -0,0 +1,93 @@
+"""
+Reading remote files through memory or spilled copies (synaptor/io/base.py),
+served from a fake bucket
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from synaptor import io
+from synaptor.io import base
+from synaptor.io.backends import fakebucket
+
+
+@pytest.fixture
+def bucket(tmp_path, monkeypatch):
+    """ Serves gs:// paths from tmp_path, recording each range read """
+    monkeypatch.setattr(fakebucket, "ROOT", str(tmp_path))
+
+    reads = list()
+    read_bytes = fakebucket.read_bytes
+
+    def recorded_read_bytes(remote_path, start=None, end=None):
+        data = read_bytes(remote_path, start=start, end=end)
+        reads.append(len(data))
+        return data
+
+    monkeypatch.setattr(fakebucket, "read_bytes", recorded_read_bytes)
+
+    spilled = list()
+    spill_file = base.spill_file
+
+    def recorded_spill_file(path, head, spill_fname):
+        spilled.append(spill_fname)
+        return spill_file(path, head, spill_fname)
+
+    monkeypatch.setattr(base, "spill_file", recorded_spill_file)
+
+    return reads, spilled
+
+
+def write_remote(data, path):
+    io.write_bytes(data, path)
+    return path
+
+
+@pytest.mark.parametrize("size", [10, 100, 101, 250, 300, 301])
+def test_fetch_reads_each_byte_once(bucket, monkeypatch, size):
+    reads, spilled = bucket
+    monkeypatch.setattr(base, "SPILL_THRESHOLD", 100)
+    data = bytes((np.arange(size) % 251).tolist())
+    path = write_remote(data, "gs://bucket/file.bin")
+
+    with io.fetched(path) as source:
+        if size <= 100:
+            assert source.read() == data
+            assert len(spilled) == 0
+        else:
+            with open(source, "rb") as f:
+                assert f.read() == data
+            assert spilled == [source]
+
+    assert sum(reads) == size
+    assert not any(os.path.exists(f) for f in spilled)
+
+
+def test_read_dframe_chunks_keep_spill(bucket, monkeypatch):
+    _, spilled = bucket
+    monkeypatch.setattr(base, "SPILL_THRESHOLD", 100)
+    dframe = pd.DataFrame({"size": np.arange(50)},
+                          index=pd.Index(np.arange(50) + 1, name="segid"))
+    path = "gs://bucket/info.csv"
+    io.write_dframe(dframe, path)
+
+    with io.read_dframe(path, chunksize=7) as reader:
+        assert len(spilled) == 1 and os.path.exists(spilled[0])
+        chunks = list(reader)
+
+    assert not os.path.exists(spilled[0])
+    pd.testing.assert_frame_equal(pd.concat(chunks), dframe)
+    assert max(len(c) for c in chunks) == 7
+
+    # closing the reader before reading every chunk
+    with io.read_dframe(path, chunksize=7, filters=[("size", ">", 5)]) as r:
+        assert os.path.exists(spilled[1])
+        pd.testing.assert_frame_equal(next(iter(r)), dframe.iloc[6:7])
+
+    assert not os.path.exists(spilled[1])
+
+    # unchunked reads are unchanged
+    pd.testing.assert_frame_equal(io.read_dframe(path), dframe)
+    assert not os.path.exists(spilled[2])
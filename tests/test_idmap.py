@@ -0,0 +1,192 @@
+"""
+Array-backed id maps (synaptor/types/idmap.py)
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from synaptor import seg_utils
+from synaptor.types import IdMap
+from synaptor.proc.seg.merge import assign_ids
+
+
+def random_map(rng, num_ids=50, maxid=200):
+    src_ids = rng.choice(np.arange(1, maxid), size=num_ids, replace=False)
+    dst_ids = rng.integers(1, 2 ** 31, size=num_ids)
+
+    return IdMap(src_ids, dst_ids)
+
+
+@pytest.mark.parametrize("dtype", ["uint32", "uint64"])
+@pytest.mark.parametrize("copy", [True, False])
+def test_relabel_matches_dict(dtype, copy):
+    rng = np.random.default_rng(0)
+    id_map = random_map(rng)
+    data = rng.integers(0, 200, size=(20, 30, 4)).astype(dtype)
+
+    expected = seg_utils.relabel_data_iterative(data, id_map.to_dict())
+    relabeled = seg_utils.relabel_data(data.copy(), id_map, copy=copy)
+    relabeled_method = id_map.relabel(data.copy(), copy=copy)
+
+    for result in [relabeled, relabeled_method]:
+        assert result.dtype == data.dtype
+        np.testing.assert_array_equal(result, expected)
+
+
+def test_relabel_in_place():
+    rng = np.random.default_rng(1)
+    id_map = random_map(rng)
+    data = rng.integers(0, 200, size=(20, 30, 4)).astype("uint32")
+    expected = seg_utils.relabel_data_iterative(data, id_map.to_dict())
+
+    copied = data.copy()
+    seg_utils.relabel_data(copied, id_map, copy=True)
+    np.testing.assert_array_equal(copied, data)
+
+    seg_utils.relabel_data(data, id_map, copy=False)
+    np.testing.assert_array_equal(data, expected)
+
+    # non-contiguous volumes are also modified in place
+    fortran = np.asfortranarray(copied)
+    view = copied.transpose((2, 1, 0))
+    seg_utils.relabel_data(fortran, id_map, copy=False)
+    seg_utils.relabel_data(view, id_map, copy=False)
+    np.testing.assert_array_equal(fortran, expected)
+    np.testing.assert_array_equal(copied, expected)
+
+
+def test_relabel_large_ids():
+    big = np.uint64(2 ** 64 - 2)
+    id_map = IdMap([3, big], [big, 3])
+    data = np.array([[[0, 3, big, big + 1]]], dtype="uint64")
+
+    relabeled = seg_utils.relabel_data(data, id_map)
+
+    np.testing.assert_array_equal(relabeled, [[[0, big, 3, big + 1]]])
+
+
+def test_relabel_other_dtypes():
+    id_map = IdMap([1, 2], [5, 6])
+    data = np.array([[[0, 1, 2, 3]]], dtype="int64")
+
+    np.testing.assert_array_equal(id_map.relabel(data), [[[0, 5, 6, 3]]])
+    np.testing.assert_array_equal(IdMap().relabel(data), data)
+
+
+def test_construction_matches_dict():
+    src_ids = [5, 3, 9, 3, 1]
+    dst_ids = [50, 30, 90, 31, 10]
+    expected = dict(zip(src_ids, dst_ids))
+
+    id_map = IdMap(src_ids, dst_ids)
+
+    assert id_map.to_dict() == expected
+    assert id_map == expected
+    assert IdMap.from_dict(expected) == id_map
+    assert list(id_map.keys()) == sorted(expected)
+    assert len(id_map) == len(expected)
+    assert id_map != {1: 10}
+    assert id_map != [1, 3, 5, 9]
+
+
+def test_lookup():
+    id_map = IdMap([1, 3, 5], [10, 30, 50])
+    ids = np.array([[5, 1], [3, 3]], dtype="uint32")
+
+    np.testing.assert_array_equal(id_map.lookup(ids), [[50, 10], [30, 30]])
+    np.testing.assert_array_equal(id_map.lookup([0, 3, 7], default=0),
+                                  [0, 30, 0])
+    np.testing.assert_array_equal(
+        id_map.lookup([0, 3, 7], default=[1, 2, 3]), [1, 30, 3])
+
+    with pytest.raises(KeyError):
+        id_map.lookup([1, 2])
+
+    assert id_map[3] == 30 and id_map.get(4) is None and 5 in id_map
+    with pytest.raises(KeyError):
+        id_map[4]
+
+
+def test_lookup_large_ids():
+    big = 2 ** 64 - 1
+    id_map = IdMap([big, 0, big - 1], [1, big, 2])
+
+    assert id_map[big] == 1 and id_map[0] == big
+    ids = np.array([big, big - 1, 5], dtype="uint64")
+
+    np.testing.assert_array_equal(id_map.lookup(ids, default=7), [1, 2, 7])
+
+
+def test_compose_matches_dict():
+    rng = np.random.default_rng(2)
+    first = random_map(rng)
+    second = IdMap(first.dst_ids[::2], rng.integers(1, 100, size=25))
+
+    composed = first.compose(second)
+    expected = {k: second.get(v, v) for (k, v) in first.items()}
+
+    assert composed == expected
+    assert first.compose(second.to_dict()) == expected
+
+
+@pytest.mark.parametrize("fname", ["map.npz", "map.npy"])
+def test_save_load(tmp_path, fname):
+    big = 2 ** 64 - 1
+    id_map = IdMap([3, 1, big], [big, 2, 4])
+    path = str(tmp_path / fname)
+
+    id_map.save(path)
+    loaded = IdMap.load(path)
+
+    assert loaded == id_map
+    assert loaded.src_ids.dtype == loaded.dst_ids.dtype == np.uint64
+
+
+def test_setitem_matches_dict():
+    rng = np.random.default_rng(3)
+    id_map = random_map(rng)
+    expected = id_map.to_dict()
+
+    for (key, value) in zip(rng.integers(0, 300, size=100),
+                            rng.integers(0, 1000, size=100)):
+        id_map[int(key)] = int(value)
+        expected[int(key)] = int(value)
+
+    assert id_map == expected
+    assert np.all(id_map.src_ids[1:] > id_map.src_ids[:-1])
+
+
+def test_setitem_copies_sources():
+    src_ids = np.array([1, 2, 3], dtype="uint64")
+    dst_ids = np.array([10, 20, 30], dtype="uint64")
+    id_map = IdMap(src_ids, dst_ids)
+
+    id_map[2] = 21
+    id_map[4] = 40
+
+    np.testing.assert_array_equal(dst_ids, [10, 20, 30])
+    assert id_map == {1: 10, 2: 21, 3: 30, 4: 40}
+
+    # read-only arrays (e.g. dataframe values under copy-on-write)
+    dframe = pd.DataFrame({"dst_id": dst_ids}, index=src_ids)
+    readonly = dframe["dst_id"].to_numpy()
+    readonly.flags.writeable = False
+    id_map = IdMap(dframe.index.values, readonly)
+
+    id_map[1] = 11
+
+    assert id_map[1] == 11
+    np.testing.assert_array_equal(dframe["dst_id"], [10, 20, 30])
+
+
+def test_assign_unique_ids_maps_are_independent():
+    cleft_info_arr = np.empty((2, 1, 1), dtype=object)
+    cleft_info_arr[0, 0, 0] = pd.DataFrame({"size": [1, 2]}, index=[4, 7])
+    cleft_info_arr[1, 0, 0] = pd.DataFrame({"size": [3]}, index=[2])
+
+    full_df, chunk_id_maps = assign_ids.assign_unique_ids(cleft_info_arr)
+    chunk_id_maps[0, 0, 0][4] = 100
+
+    np.testing.assert_array_equal(full_df.index, [1, 2, 3])
+    assert chunk_id_maps[0, 0, 0] == {4: 100, 7: 2}
+    assert chunk_id_maps[1, 0, 0] == {2: 3}
@@ -0,0 +1,172 @@
+"""
+Batched network inference (synaptor/proc/edge/inference.py) should match
+running the network over each patch on its own
+"""
+import numpy as np
+import pytest
+import torch
+
+from synaptor.types import bbox
+from synaptor.proc.edge import asynet
+from synaptor.proc.edge import inference
+from synaptor.proc.edge import locs
+
+
+PATCHSZ = (8, 8, 4)
+
+
+class AsynetLike(torch.nn.Module):
+    """ An assignment-shaped network which returns a list of outputs """
+
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.c = torch.nn.Conv3d(2, 2, 3, padding=1)
+
+    def forward(self, x):
+        return [self.c(x)]
+
+
+def single_output(net, net_input):
+    """ One forward pass for a single input, as before batching """
+    with torch.no_grad():
+        output = net(torch.from_numpy(net_input.copy()))
+
+    return asynet.format_output(output)[0]
+
+
+def random_inputs(seed, shapes):
+    rng = np.random.default_rng(seed)
+    return [rng.random((1, 2) + shape, dtype=np.float32) for shape in shapes]
+
+
+def random_volumes(seed=0):
+    rng = np.random.default_rng(seed)
+    shape = (24, 24, 8)
+    img = rng.integers(0, 256, size=shape).astype("uint8")
+    seg = rng.integers(0, 6, size=shape).astype("uint32")
+
+    cleft = np.zeros(shape, dtype="uint32")
+    cleft[2:6, 2:6, 1:3] = 1
+    cleft[12:16, 14:20, 4:7] = 2
+    cleft[19:24, 3:7, 0:2] = 3
+
+    return img, cleft, seg
+
+
+@pytest.mark.parametrize("batch_size", [1, 3, 8])
+def test_outputs_match_single_passes(batch_size):
+    net = AsynetLike()
+    shapes = [(4, 8, 8)] * 5 + [(2, 8, 6), (4, 8, 8), (2, 8, 6)] * 2
+    inputs = random_inputs(0, shapes)
+
+    outputs = list()
+    engine = inference.BatchedInference(net, batch_size=batch_size,
+                                        device="cpu",
+                                        postproc=asynet.format_output)
+    with engine:
+        for (i, net_input) in enumerate(inputs):
+            # every other input is written into the engine's buffer
+            if i % 2 == 0:
+                buf = engine.input_buffer(net_input.shape)
+                buf[...] = net_input
+                net_input = buf
+
+            def callback(output, i=i):
+                outputs.append((i, output))
+
+            engine.add(net_input, callback)
+
+    assert [i for (i, _) in outputs] == list(range(len(inputs)))
+    for (net_input, (_, output)) in zip(inputs, outputs):
+        expected = single_output(net, net_input)
+
+        assert output.dtype == torch.float32
+        assert output.shape == expected.shape
+        torch.testing.assert_close(output, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_partial_batches_wait_for_flush():
+    net = AsynetLike()
+    inputs = random_inputs(1, [(4, 8, 8)] * 4)
+
+    outputs = list()
+    engine = inference.BatchedInference(net, batch_size=3, device="cpu",
+                                        postproc=asynet.format_output)
+    for net_input in inputs:
+        engine.add(net_input, outputs.append)
+
+    assert len(outputs) == 3
+    engine.flush()
+    assert len(outputs) == 4
+    engine.flush()
+    assert len(outputs) == 4
+
+    torch.testing.assert_close(outputs[3], single_output(net, inputs[3]),
+                               rtol=1e-5, atol=1e-6)
+
+
+def test_buffer_slots_are_run_in_place():
+    net = AsynetLike()
+    engine = inference.BatchedInference(net, batch_size=4, device="cpu",
+                                        postproc=asynet.format_output)
+
+    for net_input in random_inputs(2, [(4, 8, 8)] * 3):
+        buf = engine.input_buffer(net_input.shape)
+        buf[...] = net_input
+        engine.add(buf, lambda output: None)
+
+    batch = inference.stack_inputs(engine.inputs, engine.slots)
+    assert np.shares_memory(batch, engine.buffer)
+    np.testing.assert_array_equal(batch, np.concatenate(engine.inputs))
+
+    # a copied input breaks the run of slots
+    engine.add(engine.inputs[0].copy(), lambda output: None)
+    assert len(engine.inputs) == 0
+
+
+def reference_cleft_weights(net, img, cleft, seg, cleft_locs, dil_param):
+    """ infer_cleft_weights as one forward pass per patch """
+    wt_sums = {cid: dict() for cid in cleft_locs.keys()}
+    seg_szs = {cid: dict() for cid in cleft_locs.keys()}
+
+    for (cid, cid_locs) in cleft_locs.items():
+        for loc in cid_locs:
+            box = bbox.containing_box(loc, PATCHSZ, cleft.shape)
+            img_p, psd_p, seg_p = asynet.get_patches(img, cleft, seg,
+                                                     box, cid)
+
+            segids = asynet.find_close_segments(psd_p, seg_p, dil_param,
+                                                device="cpu")
+            if len(segids) == 0:
+                continue
+
+            output = asynet.infer_patch(net, img_p, psd_p, device="cpu")
+            new_weights, new_szs = asynet.seg_weights(output, seg_p, segids)
+            wt_sums[cid] = asynet.dict_tuple_sum(new_weights, wt_sums[cid])
+            seg_szs[cid] = asynet.dict_sum(seg_szs[cid], new_szs)
+
+    return wt_sums, seg_szs
+
+
+@pytest.mark.parametrize("batch_size", [1, 4])
+def test_infer_cleft_weights_matches_per_patch(batch_size):
+    net = AsynetLike()
+    img, cleft, seg = random_volumes()
+    cleft_locs = locs.pick_cleft_locs(cleft, [1, 2, 3], "coverage",
+                                      None, PATCHSZ)
+
+    wt_sums, seg_szs, _ = asynet.infer_cleft_weights(
+                              net, img, cleft, seg, cleft_locs, PATCHSZ,
+                              dil_param=2, batch_size=batch_size,
+                              device="cpu")
+    expected_wts, expected_szs = reference_cleft_weights(
+                                     net, img, cleft, seg, cleft_locs, 2)
+
+    assert seg_szs == expected_szs
+    assert wt_sums.keys() == expected_wts.keys()
+    for cid in expected_wts:
+        assert wt_sums[cid].keys() == expected_wts[cid].keys()
+        for segid in expected_wts[cid]:
+            np.testing.assert_allclose(wt_sums[cid][segid],
+                                       expected_wts[cid][segid], rtol=1e-5)
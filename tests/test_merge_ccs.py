@@ -0,0 +1,72 @@
+"""
+Matching continuations across chunks (synaptor/proc/seg/merge/merge_ccs.py)
+"""
+import numpy as np
+
+from synaptor.proc.seg import continuation
+from synaptor.proc.seg.merge import merge_ccs
+
+
+FACE_SHAPE = (12, 10)
+
+
+def random_continuation_arr(shape=(3, 2, 2), seed=0):
+    """ Random continuations with overlapping ids across chunk faces """
+    rng = np.random.default_rng(seed)
+
+    continuation_arr = np.empty(shape, dtype=object)
+    for index in np.ndindex(shape):
+        continuations = dict()
+        for face in continuation.Face.all_faces():
+            face_arr = rng.integers(0, 40, size=FACE_SHAPE, dtype=np.uint64)
+            face_arr[face_arr > 20] = 0
+            continuations[face] = continuation.continuations_from_arrays(
+                                      *continuation.make_face_arrays(face_arr),
+                                      face)
+
+        continuation_arr[index] = continuations
+
+    return continuation_arr
+
+
+def test_parallel_matches_serial():
+    continuation_arr = random_continuation_arr()
+
+    serial = merge_ccs.find_connected_continuations(
+                 continuation_arr, FACE_SHAPE, parallel=1)
+    assert len(serial) > 0
+
+    for parallel in [2, 3]:
+        matches = merge_ccs.find_connected_continuations(
+                      continuation_arr, FACE_SHAPE, parallel=parallel)
+
+        assert matches == serial
+
+    merged = merge_ccs.merge_continuations(
+                 continuation_arr, max_face_shape=FACE_SHAPE, parallel=2)
+
+    assert merged == merge_ccs.merge_continuations(
+                         continuation_arr, max_face_shape=FACE_SHAPE)
+
+
+def test_adjacent_faces():
+    continuation_arr = random_continuation_arr((2, 3, 1))
+
+    face_indices = list(merge_ccs.adjacent_face_indices((2, 3, 1)))
+    # (x edges) + (y edges) between the 2x3x1 chunks
+    assert len(face_indices) == 1 * 3 + 2 * 2
+
+    for ((index, axis, next_index), (conts_here, conts_there)) in zip(
+            face_indices, merge_ccs.adjacent_face_pairs(continuation_arr)):
+        assert next_index[axis] == index[axis] + 1
+        assert all(c.face == continuation.Face(axis, True)
+                   for c in conts_here)
+        assert all(c.face == continuation.Face(axis, False)
+                   for c in conts_there)
+
+
+def test_single_chunk():
+    continuation_arr = random_continuation_arr((1, 1, 1))
+
+    assert merge_ccs.find_connected_continuations(
+               continuation_arr, FACE_SHAPE, parallel=2) == []
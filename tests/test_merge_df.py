@@ -0,0 +1,93 @@
+"""
+Merging seginfo frames (synaptor/proc/seg/merge/merge_df.py) - exact
+size-weighted centroids and integer segment ids
+"""
+import numpy as np
+import pandas as pd
+
+from synaptor.proc import colnames as cn
+from synaptor.proc.seg.merge import merge_df
+
+
+def seginfo(sizes, centroids, bboxes, new_ids, tags=None, segids=None):
+    segids = np.arange(1, len(sizes) + 1) if segids is None else segids
+    dframe = pd.DataFrame({cn.size: sizes},
+                          index=pd.Index(segids, name=cn.seg_id))
+    dframe[cn.centroid_cols] = np.asarray(centroids)
+    dframe[cn.bbox_cols] = np.asarray(bboxes)
+    if tags is not None:
+        dframe["tag"] = tags
+    dframe["new_ids"] = new_ids
+
+    return dframe
+
+
+def reference_merge(dframe):
+    """ Integer arithmetic: floor(sum(centroid * size) / sum(size)) """
+    rows = dict()
+    for (segid, row) in dframe.iterrows():
+        new_id = row["new_ids"]
+        new_id = segid if pd.isnull(new_id) else int(new_id)
+        rows.setdefault(new_id, list()).append(row)
+
+    merged = dict()
+    for (new_id, group) in rows.items():
+        sizes = [int(r[cn.size]) for r in group]
+        total = sum(sizes)
+        largest = group[sizes.index(max(sizes))]
+
+        merged[new_id] = dict(
+            {cn.size: total, "tag": largest["tag"]},
+            **{c: sum(int(r[c]) * s for (r, s) in zip(group, sizes)) // total
+               for c in cn.centroid_cols},
+            **{c: min(int(r[c]) for r in group) for c in cn.bbox_cols[:3]},
+            **{c: max(int(r[c]) for r in group) for c in cn.bbox_cols[-3:]})
+
+    return merged
+
+
+def test_centroids_are_exact_weighted_means():
+    # summing size fractions (1/7, 2/7, 4/7) in floating point gave 29
+    dframe = seginfo(sizes=[1, 2, 4],
+                     centroids=[[10, 0, 3], [20, 0, 3], [40, 7, 3]],
+                     bboxes=[[0, 0, 0, 5, 5, 5]] * 3,
+                     new_ids=[9, 9, 9])
+
+    merged = merge_df.merge_seginfo_df(dframe)
+
+    assert merged.index.tolist() == [9]
+    assert merged[cn.centroid_cols].values.tolist() == [[30, 4, 3]]
+    assert merged[cn.size].tolist() == [7]
+
+
+def test_merge_matches_integer_reference():
+    rng = np.random.default_rng(0)
+    num_rows = 300
+    new_ids = rng.integers(1, 60, size=num_rows).astype(float)
+    new_ids[rng.random(num_rows) < 0.1] = np.nan
+    dframe = seginfo(sizes=rng.integers(1, 300, size=num_rows),
+                     centroids=rng.integers(0, 1000, size=(num_rows, 3)),
+                     bboxes=rng.integers(0, 1000, size=(num_rows, 6)),
+                     tags=rng.choice(["a", "b", "c"], size=num_rows),
+                     new_ids=new_ids,
+                     segids=np.arange(num_rows) + 1000)
+
+    merged = merge_df.merge_seginfo_df(dframe)
+    expected = reference_merge(dframe)
+
+    # float new ids (with NaNs) still give an integer index
+    assert merged.index.dtype.kind in "iu"
+    assert merged.index.name == cn.seg_id
+    assert sorted(merged.index.tolist()) == sorted(expected)
+    for (segid, row) in merged.iterrows():
+        assert row.to_dict() == expected[segid]
+
+
+def test_merge_empty():
+    dframe = seginfo(sizes=[], centroids=np.empty((0, 3), dtype=int),
+                     bboxes=np.empty((0, 6), dtype=int), new_ids=[])
+
+    merged = merge_df.merge_seginfo_df(dframe)
+
+    assert len(merged) == 0
+    assert "new_ids" not in merged.columns
@@ -0,0 +1,69 @@
+"""
+The out-of-core merge (merge_ccs_spilled_task) should match merge_ccs_task
+"""
+import copy
+
+import numpy as np
+import pandas as pd
+
+from synaptor.proc import tasks
+from synaptor.proc.seg.merge import spill
+
+
+CHUNK_SHAPE = (20, 20, 8)
+NUM_CHUNKS = (2, 2, 1)
+
+
+def random_chunks(seed=0):
+    """ Continuations and cleft info for the chunks of a random volume """
+    rng = np.random.default_rng(seed)
+    vol = rng.random(tuple(np.multiply(CHUNK_SHAPE, NUM_CHUNKS)))
+
+    cont_info_arr = np.empty(NUM_CHUNKS, dtype=object)
+    cleft_info_arr = np.empty(NUM_CHUNKS, dtype=object)
+    for index in np.ndindex(NUM_CHUNKS):
+        offset = np.multiply(index, CHUNK_SHAPE)
+        bounds = tuple(slice(o, o + sz)
+                       for (o, sz) in zip(offset, CHUNK_SHAPE))
+
+        _, continuations, seg_info = tasks.cc_task(vol[bounds], 0.7, 3,
+                                                   offset=tuple(offset))
+        cont_info_arr[index] = continuations
+        cleft_info_arr[index] = seg_info
+
+    return cont_info_arr, cleft_info_arr
+
+
+def seginfo_batches(cleft_info_arr, batch_rows):
+    for (i, dframe) in enumerate(cleft_info_arr.ravel()):
+        for start in range(0, max(len(dframe), 1), batch_rows):
+            yield i, dframe.iloc[start:start+batch_rows]
+
+
+def test_spilled_merge_matches_merge_ccs(tmp_path):
+    cont_info_arr, cleft_info_arr = random_chunks()
+    assert sum(len(df) for df in cleft_info_arr.ravel()) > 0
+
+    merged_df, chunk_id_maps = tasks.merge_ccs_task(
+                                   copy.deepcopy(cont_info_arr),
+                                   copy.deepcopy(cleft_info_arr),
+                                   5, CHUNK_SHAPE[:2])
+
+    # a tiny memory budget spreads the rows over several partitions
+    merged_spill, spilled_id_maps = tasks.merge_ccs_spilled_task(
+                                        copy.deepcopy(cont_info_arr),
+                                        seginfo_batches(cleft_info_arr, 7),
+                                        NUM_CHUNKS, 5, CHUNK_SHAPE[:2],
+                                        2000, str(tmp_path))
+    assert merged_spill.num_parts > 1
+
+    parts = (merged_spill.read(i) for i in range(merged_spill.num_parts))
+    spilled_df = pd.concat([df for df in parts if df is not None])
+
+    pd.testing.assert_frame_equal(spilled_df.sort_index(),
+                                  merged_df.sort_index(),
+                                  check_dtype=False)
+
+    for (spilled, expected) in zip(spilled_id_maps.ravel(),
+                                   chunk_id_maps.ravel()):
+        assert spilled == expected
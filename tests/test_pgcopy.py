@@ -0,0 +1,107 @@
+"""
+In-memory COPY buffers (synaptor/io/backends/pgcopy.py) - no database needed
+"""
+import struct
+
+import numpy as np
+import pandas as pd
+import pytest
+import sqlalchemy as sa
+
+from synaptor.io.backends import pgcopy
+
+
+def make_table():
+    return sa.Table("segs", sa.MetaData(),
+                    sa.Column("segid", sa.BigInteger),
+                    sa.Column("size", sa.Integer),
+                    sa.Column("centroid", sa.Float),
+                    sa.Column("tag", sa.Text))
+
+
+def test_cast_columns():
+    table = make_table()
+    dframe = pd.DataFrame({"segid": [1., 2., 3.],
+                           "size": [10., np.nan, 30.],
+                           "centroid": [10.05, 1.5, 2.],
+                           "tag": ["a", "b", "c"]})
+
+    cast = pgcopy.cast_columns(dframe, table)
+
+    assert cast["segid"].dtype == np.int64
+    assert cast["size"].dtype == "Int64"
+    assert cast["size"].isna().tolist() == [False, True, False]
+    assert cast["centroid"].dtype == np.float64
+
+    buf = pgcopy.csv_buffer(cast)
+    assert buf.read().splitlines() == ["1,10,10.05,a", "2,,1.5,b",
+                                       "3,30,2.0,c"]
+
+
+def test_cast_columns_rejects_fractions():
+    dframe = pd.DataFrame({"size": [1.5]})
+
+    with pytest.raises(AssertionError):
+        pgcopy.cast_columns(dframe, make_table())
+
+
+def parse_rows(data, fmts):
+    """ Parses binary COPY data into rows (None for NULLs) """
+    assert data[:len(pgcopy.BINARY_HEADER)] == pgcopy.BINARY_HEADER
+    assert data[-2:] == pgcopy.BINARY_TRAILER
+
+    rows, i = list(), len(pgcopy.BINARY_HEADER)
+    while i < len(data) - 2:
+        (numfields,) = struct.unpack(">h", data[i:i+2])
+        assert numfields == len(fmts)
+        i += 2
+
+        row = list()
+        for fmt in fmts:
+            (length,) = struct.unpack(">i", data[i:i+4])
+            i += 4
+            if length == -1:
+                row.append(None)
+                continue
+
+            field = data[i:i+length]
+            i += length
+            row.append(field.decode() if fmt is None
+                       else np.frombuffer(field, dtype=fmt)[0].item())
+
+        rows.append(row)
+
+    return rows
+
+
+def test_binary_header():
+    assert pgcopy.BINARY_HEADER == (b"PGCOPY\n\xff\r\n\x00"
+                                    + b"\x00" * 8)
+    assert pgcopy.BINARY_TRAILER == b"\xff\xff"
+
+
+def test_binary_fixed_width_rows():
+    table = make_table()
+    dframe = pd.DataFrame({"segid": [1, 2 ** 40], "size": [10, 20],
+                           "centroid": [10.05, -1.]})
+    fmts = [">i8", ">i4", ">f8"]
+
+    data = pgcopy.binary_buffer(dframe, table).read()
+
+    assert parse_rows(data, fmts) == [[1, 10, 10.05], [2 ** 40, 20, -1.]]
+    # 2 bytes of field count, and a 4 byte length before each field
+    row_bytes = 2 + sum(4 + np.dtype(fmt).itemsize for fmt in fmts)
+    assert len(data) == (len(pgcopy.BINARY_HEADER) + 2 * row_bytes
+                         + len(pgcopy.BINARY_TRAILER))
+
+
+def test_binary_variable_width_rows():
+    table = make_table()
+    dframe = pgcopy.cast_columns(
+                 pd.DataFrame({"segid": [1., 2.], "size": [np.nan, 5.],
+                               "tag": ["ab", "ü"]}), table)
+
+    data = pgcopy.binary_buffer(dframe, table).read()
+
+    assert parse_rows(data, [">i8", ">i4", None]) == [[1, None, "ab"],
+                                                      [2, 5, "ü"]]
@@ -0,0 +1,97 @@
+"""
+Batched pruner inference (synaptor/proc/edge/pruner.py) should match
+running the network over each candidate patch
+"""
+import numpy as np
+import torch
+
+from synaptor.types import bbox
+from synaptor.proc.edge import pruner
+
+
+PATCHSZ = (8, 8, 4)
+
+
+class ListNet(torch.nn.Module):
+    """ A pruner-shaped network which returns a list of outputs """
+
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.c = torch.nn.Conv3d(4, 1, 1)
+
+    def forward(self, x):
+        return [self.c(x).mean(dim=(2, 3, 4))]
+
+
+class TensorNet(ListNet):
+    def forward(self, x):
+        return super().forward(x)[0]
+
+
+def random_volumes(seed=0):
+    rng = np.random.default_rng(seed)
+    shape = (24, 24, 8)
+    img = rng.integers(0, 256, size=shape).astype("uint8")
+    seg = rng.integers(1, 4, size=shape).astype("uint32")
+
+    cleft = np.zeros(shape, dtype="uint32")
+    cleft[2:6, 2:6, 1:3] = 1
+    cleft[12:16, 14:20, 4:7] = 2
+    cleft[18:22, 3:7, 2:4] = 3
+
+    return img, seg, cleft
+
+
+def candidate_outputs(net, img, seg, cleft, candidates):
+    """ One forward pass per candidate, as before batching """
+    cleft_locs = pruner.locs.pick_cleft_locs(cleft, [1, 2, 3],
+                                             "centroid", 1, PATCHSZ)
+    outputs = list()
+    for (cid, presyn_id, postsyn_id) in candidates:
+        box = bbox.containing_box(cleft_locs[cid][0], PATCHSZ, img.shape)
+        img_p, syn_p, seg_p = pruner.get_patches(img, cleft, seg, box, cid)
+        outputs.append(pruner.predict_candidate(net, img_p, syn_p, seg_p,
+                                                presyn_id, postsyn_id,
+                                                device="cpu"))
+
+    return outputs
+
+
+def test_prune_candidates_list_output():
+    img, seg, cleft = random_volumes()
+    candidates = [(1, 1, 2), (1, 2, 3), (2, 3, 1), (3, 1, 3), (3, 2, 2)]
+    net = ListNet()
+
+    expected = candidate_outputs(net, img, seg, cleft, candidates)
+    thresh = float(np.median(expected))
+
+    for batch_size in [1, 2, 8]:
+        pruned, outputs = pruner.prune_candidates(
+                              net, img, seg, PATCHSZ, candidates,
+                              cleft=cleft, output_thresh=thresh,
+                              batch_size=batch_size, device="cpu")
+
+        kept = [(c, o) for (c, o) in zip(candidates, expected) if o > thresh]
+        assert pruned == [c for (c, _) in kept]
+        np.testing.assert_allclose(outputs, [o for (_, o) in kept],
+                                   rtol=1e-5)
+
+
+def test_max_candidates_tensor_and_list_output():
+    img, seg, cleft = random_volumes(1)
+    candidates = [(1, 1, 2), (1, 2, 3), (2, 3, 1), (2, 1, 1), (3, 1, 3)]
+
+    expected = candidate_outputs(TensorNet(), img, seg, cleft, candidates)
+    best = dict()
+    for (candidate, output) in zip(candidates, expected):
+        cid = candidate[0]
+        if cid not in best or output > best[cid][1]:
+            best[cid] = (candidate, output)
+
+    for net in [TensorNet(), ListNet()]:
+        pruned = pruner.max_candidates(net, img, seg, PATCHSZ, candidates,
+                                       cleft=cleft, batch_size=2,
+                                       device="cpu")
+
+        assert sorted(pruned) == sorted(c for (c, _) in best.values())
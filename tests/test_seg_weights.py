@@ -0,0 +1,89 @@
+"""
+Single-pass segment weights (synaptor/proc/edge/asynet.py) should match
+the per-segment mask sums they replaced
+"""
+import numpy as np
+import pytest
+import torch
+
+from synaptor.proc.edge import asynet
+
+
+def reference_seg_weights(output, seg, segids):
+    """ seg_weights as it was, with one mask per segment (on the CPU) """
+    weights = {}
+    sizes = {}
+
+    presyn_output = output[0, ...]
+    postsyn_output = output[1, ...]
+
+    for i in segids:
+        seg_mask = torch.from_numpy((seg == i).astype("bool"))[0, 0, ...]
+        sizes[i] = torch.sum(seg_mask).item()
+
+        pre_wt = torch.sum(presyn_output[seg_mask]).item()
+        post_wt = torch.sum(postsyn_output[seg_mask]).item()
+
+        weights[i] = (pre_wt, post_wt)
+
+    return weights, sizes
+
+
+def random_patch(seed, dtype, shape=(4, 9, 7), maxid=8):
+    rng = np.random.default_rng(seed)
+    seg = rng.integers(0, maxid, size=(1, 1) + shape).astype(dtype)
+    output = torch.from_numpy(rng.random((2,) + shape, dtype=np.float32))
+
+    return output, seg
+
+
+def assert_same_weights(weights, sizes, expected_weights, expected_sizes):
+    assert sizes == expected_sizes
+    assert list(weights) == list(expected_weights)
+    for segid in expected_weights:
+        np.testing.assert_allclose(weights[segid], expected_weights[segid],
+                                   rtol=1e-5)
+
+
+@pytest.mark.parametrize("dtype", ["uint32", "uint64"])
+@pytest.mark.parametrize("seed", range(3))
+def test_seg_weights_match_reference(seed, dtype):
+    output, seg = random_patch(seed, dtype)
+    # unsorted, and including ids missing from the patch
+    segids = [5, 2, 7, 100, 1, 3]
+
+    weights, sizes = asynet.seg_weights(output, seg, segids)
+
+    assert_same_weights(weights, sizes,
+                        *reference_seg_weights(output, seg, segids))
+
+
+def test_seg_weights_all_ids_and_large_ids():
+    output, seg = random_patch(3, "uint64")
+    seg[seg == 1] = 2 ** 64 - 1
+    seg[seg == 2] = 2 ** 63
+
+    weights, sizes = asynet.seg_weights(output, seg)
+    segids = sorted(set(np.unique(seg).tolist()) - {0})
+
+    assert_same_weights(weights, sizes,
+                        *reference_seg_weights(output, seg, segids))
+    assert asynet.seg_weights(output, seg, []) == ({}, {})
+
+
+def test_seg_weight_arrays_extra_channels():
+    # channels past pre/post are ignored
+    output, seg = random_patch(4, "uint32")
+    output = torch.cat((output, torch.ones_like(output)), dim=0)
+    segids = [3, 1, 4]
+
+    weight_arr, size_arr = asynet.seg_weight_arrays(output, seg, segids)
+    expected_weights, expected_sizes = reference_seg_weights(output, seg,
+                                                             segids)
+
+    assert weight_arr.shape == (3, 2)
+    np.testing.assert_array_equal(size_arr,
+                                  [expected_sizes[i] for i in segids])
+    np.testing.assert_allclose(weight_arr,
+                               [expected_weights[i] for i in segids],
+                               rtol=1e-5)
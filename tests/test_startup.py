@@ -0,0 +1,51 @@
+"""
+Startup benchmark for the task scripts
+
+Each script should parse its arguments without importing heavy
+dependencies (torch, cloudvolume, ...) first. The time budget (seconds)
+can be adjusted through SYNAPTOR_IMPORT_BUDGET.
+"""
+import os
+import sys
+import glob
+import time
+import subprocess
+
+import pytest
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = sorted(glob.glob(os.path.join(REPO_DIR, "scripts", "*.py")))
+IMPORT_BUDGET = float(os.environ.get("SYNAPTOR_IMPORT_BUDGET", 1.5))
+HEAVY_MODULES = ["torch", "cloudvolume", "sqlalchemy",
+                 "boto3", "google.cloud.storage"]
+
+
+def run_python(*args):
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    start = time.time()
+    result = subprocess.run([sys.executable, *args], env=env,
+                            capture_output=True, text=True)
+
+    return result, time.time() - start
+
+
+def test_import_skips_heavy_modules():
+    result, _ = run_python(
+        "-c", "import sys, synaptor;"
+              f" print([m for m in {HEAVY_MODULES!r} if m in sys.modules])")
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
+
+
+@pytest.mark.parametrize("script", SCRIPTS, ids=os.path.basename)
+def test_script_help_startup(script):
+    result, elapsed = run_python(script, "--help")
+
+    if result.returncode != 0 and "ModuleNotFoundError" in result.stderr:
+        pytest.skip(result.stderr.strip().splitlines()[-1])
+
+    assert result.returncode == 0, result.stderr
+    assert elapsed < IMPORT_BUDGET, (f"{os.path.basename(script)} took"
+                                     f" {elapsed:.2f}s to start")
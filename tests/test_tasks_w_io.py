@@ -0,0 +1,267 @@
+"""
+Edge task IO helpers (synaptor/proc/tasks_w_io.py) - no cloud volumes needed
+"""
+import os
+import inspect
+import tempfile
+import threading
+
+import pytest
+
+from synaptor import types
+from synaptor.proc import tasks_w_io
+
+
+CHECKSUM_ARGS = dict(patchsz=(80, 80, 18), samples_per_cleft=2,
+                     dil_param=5, precision="fp32",
+                     img_cvname="gs://bucket/img",
+                     cleft_cvname="gs://bucket/clefts",
+                     seg_cvname="gs://bucket/seg",
+                     resolution=(8, 8, 40), num_downsamples=1,
+                     chunk_begin=(0, 0, 0), chunk_end=(512, 512, 64),
+                     storagestr="gs://bucket/proc", parallel=1)
+
+
+@pytest.fixture
+def net_fnames(tmp_path):
+    fnames = (str(tmp_path / "net.py"), str(tmp_path / "net.chkpt"))
+    for (i, fname) in enumerate(fnames):
+        with open(fname, "wb") as f:
+            f.write(bytes([i]) * 100)
+
+    return fnames
+
+
+def id_map():
+    return types.IdMap([1, 2, 5], [10, 11, 12])
+
+
+def checksum(net_fnames, chunk_id_map, **changed):
+    args = dict(CHECKSUM_ARGS, **changed)
+    return tasks_w_io.edge_weights_checksum(net_fnames, chunk_id_map, **args)
+
+
+def test_edge_weights_checksum_stable(net_fnames):
+    base = checksum(net_fnames, id_map())
+
+    assert checksum(net_fnames, id_map()) == base
+    assert checksum(net_fnames, id_map().to_dict()) == base
+    assert checksum(net_fnames, id_map(), resolution=[8, 8, 40]) == base
+    # reading parameters that don't change the inputs
+    assert checksum(net_fnames, id_map(), parallel=4) == base
+    assert checksum(net_fnames, id_map(),
+                    storagestr="gs://bucket/other") == base
+
+
+@pytest.mark.parametrize("changed", [
+    dict(img_cvname="gs://bucket/img2"),
+    dict(cleft_cvname="gs://bucket/clefts2"),
+    dict(seg_cvname="gs://bucket/seg2"),
+    dict(resolution=(4, 4, 40)),
+    dict(num_downsamples=0),
+    dict(patchsz=(80, 80, 20)),
+    dict(samples_per_cleft=3),
+    dict(dil_param=3),
+    dict(precision="bf16"),
+    dict(normcloudpath="gs://bucket/norm"),
+    dict(aggscratchpath="gs://bucket/agg"),
+])
+def test_edge_weights_checksum_params(net_fnames, changed):
+    assert (checksum(net_fnames, id_map(), **changed)
+            != checksum(net_fnames, id_map()))
+
+
+def test_edge_weights_checksum_id_map(net_fnames):
+    base = checksum(net_fnames, id_map())
+
+    assert checksum(net_fnames, types.IdMap([1, 2, 5], [10, 11, 13])) != base
+    assert checksum(net_fnames, types.IdMap([1, 2, 6], [10, 11, 12])) != base
+    assert checksum(net_fnames, types.IdMap([1, 2], [10, 11])) != base
+
+
+def test_edge_weights_checksum_network(net_fnames):
+    base = checksum(net_fnames, id_map())
+
+    with open(net_fnames[1], "ab") as f:
+        f.write(b"\x00")
+
+    assert checksum(net_fnames, id_map()) != base
+
+
+@pytest.fixture
+def networks(monkeypatch):
+    """ Records network reads, with a fresh network cache """
+    monkeypatch.setattr(tasks_w_io, "_networks", dict())
+    reads = list()
+
+    def read_network(net_fname, chkpt_fname, device=None):
+        reads.append((net_fname, chkpt_fname))
+        return object()
+
+    monkeypatch.setattr(tasks_w_io.io, "read_network", read_network)
+    monkeypatch.setattr(tasks_w_io.edge.device, "prepare_network",
+                        lambda net, **kwargs: net)
+
+    return reads
+
+
+def copy_network(net_fnames, dirname, extra=b""):
+    os.makedirs(dirname, exist_ok=True)
+    copies = list()
+    for fname in net_fnames:
+        copy = os.path.join(dirname, os.path.basename(fname))
+        with open(fname, "rb") as f, open(copy, "wb") as g:
+            g.write(f.read() + extra)
+        copies.append(copy)
+
+    return tuple(copies)
+
+
+def test_load_network_cached_by_checksum(net_fnames, networks, tmp_path):
+    net = tasks_w_io.load_network(net_fnames, device="cpu")
+
+    # the same files pulled to another directory
+    moved = copy_network(net_fnames, str(tmp_path / "moved"))
+    assert tasks_w_io.load_network(moved, device="cpu") is net
+    assert len(networks) == 1
+
+    # different files or settings
+    changed = copy_network(net_fnames, str(tmp_path / "changed"), b"\x00")
+    assert tasks_w_io.load_network(changed, device="cpu") is not net
+    assert tasks_w_io.load_network(net_fnames, device="cpu",
+                                   precision="bf16") is not net
+    assert len(networks) == 3
+
+
+def test_load_network_cache_size(net_fnames, networks, tmp_path,
+                                 monkeypatch):
+    monkeypatch.setattr(tasks_w_io, "NETWORK_CACHE_SIZE", 2)
+    fnames = [copy_network(net_fnames, str(tmp_path / str(i)), bytes([i]))
+              for i in range(3)]
+
+    nets = [tasks_w_io.load_network(f) for f in fnames]
+    assert len(tasks_w_io._networks) == 2
+
+    # the oldest network is read again
+    assert tasks_w_io.load_network(fnames[2]) is nets[2]
+    assert tasks_w_io.load_network(fnames[0]) is not nets[0]
+    assert len(networks) == 4
+
+
+READ_ARGS = dict(img_cvname="gs://bucket/img",
+                 cleft_cvname="gs://bucket/clefts",
+                 seg_cvname="gs://bucket/seg",
+                 chunk_begin=(0, 0, 0), chunk_end=(512, 512, 64),
+                 storagestr="gs://bucket/proc")
+
+
+def chunk_args(i, **changed):
+    begin = (512 * i, 0, 0)
+    end = (512 * (i + 1), 512, 64)
+
+    return dict(READ_ARGS, chunk_begin=begin, chunk_end=end, **changed)
+
+
+@pytest.fixture
+def prefetch(monkeypatch, tmp_path):
+    """
+    Replaces read_edge_inputs with a fake that records its calls. Reads of
+    chunks within blocked wait until they're unblocked.
+    """
+    monkeypatch.setattr(tasks_w_io, "_prefetched_edge_inputs", dict())
+    monkeypatch.setattr(tasks_w_io, "_prefetch_executor", None)
+    calls = list()
+    blocked = dict()
+
+    def read_edge_inputs(**kwargs):
+        begin = tuple(kwargs["chunk_begin"])
+        calls.append(begin)
+        if begin in blocked:
+            blocked[begin].wait(10)
+        if begin[0] < 0:
+            raise RuntimeError("failed read")
+
+        return dict(chunk_begin=begin,
+                    net_dir=tempfile.mkdtemp(dir=str(tmp_path)))
+
+    read_edge_inputs.__signature__ = inspect.signature(
+                                         tasks_w_io.read_edge_inputs)
+    monkeypatch.setattr(tasks_w_io, "read_edge_inputs", read_edge_inputs)
+
+    yield calls, blocked
+
+    for event in blocked.values():
+        event.set()
+    tasks_w_io.prefetch_executor().shutdown(wait=True)
+
+
+def test_prefetch_matches_edge_task_args(prefetch):
+    calls, _ = prefetch
+
+    tasks_w_io.prefetch_edge_task(**chunk_args(0))
+    tasks_w_io.prefetch_edge_task(**chunk_args(0))
+    assert tasks_w_io.take_prefetched_edge_inputs(chunk_args(1)) is None
+
+    # lists, default storagedir and edge_task-only arguments match
+    read_args = chunk_args(0, storagedir=READ_ARGS["storagestr"],
+                           resolution=[4, 4, 40], patchsz=(80, 80, 18))
+    read_args["chunk_end"] = list(read_args["chunk_end"])
+    inputs = tasks_w_io.take_prefetched_edge_inputs(read_args)
+
+    assert inputs["chunk_begin"] == (0, 0, 0)
+    assert calls == [(0, 0, 0)]
+    assert tasks_w_io.take_prefetched_edge_inputs(read_args) is None
+
+
+def test_prefetch_limit_discards_oldest(prefetch, monkeypatch):
+    calls, blocked = prefetch
+    monkeypatch.setattr(tasks_w_io, "PREFETCH_LIMIT", 2)
+    blocked[(0, 0, 0)] = threading.Event()
+
+    for i in range(4):
+        tasks_w_io.prefetch_edge_task(**chunk_args(i))
+
+    assert len(tasks_w_io._prefetched_edge_inputs) == 2
+    assert tasks_w_io.take_prefetched_edge_inputs(chunk_args(1)) is None
+
+    blocked[(0, 0, 0)].set()
+    inputs = [tasks_w_io.take_prefetched_edge_inputs(chunk_args(i))
+              for i in (2, 3)]
+    tasks_w_io.prefetch_executor().shutdown(wait=True)
+
+    # the running read is removed once done, the queued one never runs
+    assert calls == [(0, 0, 0), (1024, 0, 0), (1536, 0, 0)]
+    assert [inp["chunk_begin"] for inp in inputs] == [(1024, 0, 0),
+                                                      (1536, 0, 0)]
+    assert all(os.path.isdir(inp["net_dir"]) for inp in inputs)
+    assert len(os.listdir(os.path.dirname(inputs[0]["net_dir"]))) == 2
+    assert len(tasks_w_io._prefetched_edge_inputs) == 0
+
+
+def test_failed_prefetch_is_dropped(prefetch, capsys):
+    calls, blocked = prefetch
+    failing = chunk_args(-1)
+    blocked[(-512, 0, 0)] = threading.Event()
+
+    tasks_w_io.prefetch_edge_task(**failing)
+    blocked[(-512, 0, 0)].set()
+    assert tasks_w_io.take_prefetched_edge_inputs(failing) is None
+    assert "failed read" in capsys.readouterr().out
+
+    tasks_w_io.prefetch_edge_task(**failing)
+    tasks_w_io.prefetch_executor().shutdown(wait=True)
+    assert len(tasks_w_io._prefetched_edge_inputs) == 0
+    assert calls == [(-512, 0, 0)] * 2
+
+
+def test_prefetching_edge_task(prefetch):
+    calls, _ = prefetch
+
+    with tasks_w_io.prefetching():
+        assert tasks_w_io.edge_task(patchsz=(80, 80, 18),
+                                    **chunk_args(0)) is None
+
+    inputs = tasks_w_io.take_prefetched_edge_inputs(chunk_args(0))
+    assert inputs["chunk_begin"] == (0, 0, 0)
+    assert calls == [(0, 0, 0)]
+    assert not tasks_w_io._prefetching
@@ -0,0 +1,95 @@
+"""
+The array-backed union-find (synaptor/proc/utils.py) should give the same
+components and id maps as a graph connected components pass
+"""
+import numpy as np
+import pytest
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from synaptor.proc import utils
+
+
+BIG = 2 ** 64 - 1
+
+
+def reference_components(edges, ids=()):
+    """ Components as sets, found by scipy (in place of igraph) """
+    edges = np.asarray(edges, dtype=np.uint64).reshape((-1, 2))
+    all_ids, inds = np.unique(np.concatenate((edges.ravel(),
+                                              np.asarray(ids, np.uint64))),
+                              return_inverse=True)
+    inds = inds[:edges.size].reshape((-1, 2))
+
+    graph = coo_matrix((np.ones(len(inds)), (inds[:, 0], inds[:, 1])),
+                       shape=(len(all_ids), len(all_ids)))
+    _, labels = connected_components(graph, directed=False)
+
+    components = dict()
+    for (segid, label) in zip(all_ids.tolist(), labels):
+        components.setdefault(label, set()).add(segid)
+
+    return list(components.values())
+
+
+def random_edges(seed, num_edges=300, maxid=400, offset=0):
+    rng = np.random.default_rng(seed)
+    edges = rng.integers(1, maxid, size=(num_edges, 2)).astype(np.uint64)
+
+    return edges + np.uint64(offset)
+
+
+def as_sets(components):
+    return sorted(map(frozenset, components), key=min)
+
+
+@pytest.mark.parametrize("offset", [0, 2 ** 40, BIG - 500])
+@pytest.mark.parametrize("seed", range(3))
+def test_find_id_map_matches_components(seed, offset):
+    edges = random_edges(seed, offset=offset)
+    extra_ids = np.array([offset, offset + 450], dtype=np.uint64)
+
+    src_ids, dst_ids = utils.find_id_map(edges, ids=extra_ids)
+    expected = utils.make_id_map(reference_components(edges, extra_ids))
+
+    assert src_ids.dtype == dst_ids.dtype == np.uint64
+    assert dict(zip(src_ids.tolist(), dst_ids.tolist())) == expected
+    assert as_sets(utils.find_connected_components(edges)) == as_sets(
+               reference_components(edges))
+
+
+def test_edge_batches_and_iterables():
+    edges = random_edges(3, offset=BIG - 500)
+    expected = utils.find_id_map(edges)
+
+    as_tuples = [tuple(e) for e in edges.tolist()]
+    for (batch_edges, batch_size) in [(iter(as_tuples), 7),
+                                      (as_tuples, 1),
+                                      (edges, 13)]:
+        result = utils.find_id_map(batch_edges, batch_size=batch_size)
+
+        for (arr, expected_arr) in zip(result, expected):
+            np.testing.assert_array_equal(arr, expected_arr)
+
+
+def test_incremental_union():
+    edges = random_edges(4, offset=BIG - 500)
+    union_find = utils.UnionFind([BIG, 5])
+
+    for part in np.array_split(edges, 5):
+        union_find.add_ids(part[:3, 0])
+        union_find.add_edges(part)
+
+    src_ids, dst_ids = union_find.id_map_arrays()
+    expected = utils.make_id_map(reference_components(edges, [BIG, 5]))
+
+    assert dict(zip(src_ids.tolist(), dst_ids.tolist())) == expected
+    np.testing.assert_array_equal(union_find.find(src_ids), dst_ids)
+    assert len(union_find) == len(expected)
+
+
+def test_empty():
+    src_ids, dst_ids = utils.find_id_map([])
+
+    assert len(src_ids) == len(dst_ids) == 0
+    assert utils.find_connected_components([]) == []